@@ -0,0 +1,310 @@
+"""Admission control for the LLM-backed endpoints.
+
+Two layers keep one client from using up the OpenAI rate limit for everyone:
+
+- Token buckets per user and per client IP, checked before the endpoint
+  runs (``rate_limited``), or once the body is known for endpoints whose
+  cost depends on it, such as one token per batch item
+  (``admit_request``). Signed-in callers are charged to both buckets,
+  guests to their IP's only. The IP limit is the looser one, because a
+  classroom often shares one address.
+- A bounded concurrency limit per upstream model (``model_slot``). Calls
+  beyond the limit wait in a queue that is served round-robin across
+  clients, so one client's backlog cannot starve the others. The queue is
+  bounded in total, per client and in waiting time.
+
+Either layer turns a request away with a 429 and a ``Retry-After`` header.
+The buckets and queues live in the process, so with several workers each
+one enforces the limits on its own share of the traffic.
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from fastapi import Depends, HTTPException, Request
+
+from metrics import (
+    ADMISSION_REJECTIONS,
+    MODEL_QUEUE_DEPTH,
+    MODEL_QUEUE_WAIT_SECONDS,
+    MODEL_SLOTS_IN_USE,
+    current_endpoint,
+)
+
+# Token buckets: sustained requests per minute and burst size (0 per minute disables a limit)
+RATE_LIMIT_USER_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "20"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "10"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "120"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "40"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Proxies in front of the app whose X-Forwarded-For entries can be trusted
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Concurrent upstream calls per model, e.g. '{"gpt-4o": 16}'; other models get MODEL_CONCURRENCY_DEFAULT
+MODEL_CONCURRENCY: Dict[str, int] = {"gpt-4o-mini": 64, "gpt-4o": 16, **json.loads(os.getenv("MODEL_CONCURRENCY", "{}"))}
+MODEL_CONCURRENCY_DEFAULT = int(os.getenv("MODEL_CONCURRENCY_DEFAULT", "32"))
+MODEL_QUEUE_SIZE = int(os.getenv("MODEL_QUEUE_SIZE", "256"))
+MODEL_QUEUE_PER_CLIENT = int(os.getenv("MODEL_QUEUE_PER_CLIENT", "32"))
+MODEL_QUEUE_TIMEOUT = float(os.getenv("MODEL_QUEUE_TIMEOUT", "15"))
+
+# Whom the current request's upstream calls are queued for; tasks started by the request inherit it
+_client: ContextVar[str] = ContextVar("admission_client", default="anonymous")
+
+
+def too_many_requests(retry_after: float, detail: str = "Too many requests. Please slow down.") -> HTTPException:
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until ``cost`` tokens are available (0 if they are now).
+
+        A cost above the capacity is admitted from a full bucket and leaves it
+        in debt, so a large batch is possible but holds off the next requests.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = min(cost, self.capacity)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets keyed by user id or IP, bounded to the most recently seen keys."""
+
+    def __init__(self, per_minute: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.rate = per_minute / 60
+        self.burst = max(burst, 1.0)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def wait_time(self, key: str, cost: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        return self._bucket(key).wait_time(cost)
+
+    def consume(self, key: str, cost: float = 1.0) -> None:
+        if self.rate > 0:
+            self._bucket(key).tokens -= cost
+
+
+user_rate_limiter = RateLimiter(RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST)
+ip_rate_limiter = RateLimiter(RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST)
+
+
+def client_ip(request: Request) -> str:
+    """The caller's address, taken from X-Forwarded-For as far as ``TRUSTED_PROXY_HOPS`` allows."""
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if forwarded:
+            return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+
+def admit_request(request: Request, user_id: Optional[str], cost: float = 1.0) -> None:
+    """Charge ``cost`` to the caller's buckets, or raise a 429 when either is empty.
+
+    Nothing is charged for a rejected request. Also makes the caller the
+    client that the request's model calls are queued under. Endpoints whose
+    cost depends on the body call this themselves; the others use
+    ``rate_limited``.
+    """
+    ip = client_ip(request)
+    checks = [("ip", ip_rate_limiter, ip)]
+    if user_id:
+        checks.append(("user", user_rate_limiter, user_id))
+
+    wait, reason = max((limiter.wait_time(key, cost), reason) for reason, limiter, key in checks)
+    if wait > 0:
+        ADMISSION_REJECTIONS.labels(current_endpoint(), f"{reason}_rate").inc()
+        raise too_many_requests(wait)
+
+    for _, limiter, key in checks:
+        limiter.consume(key, cost)
+    _client.set(f"user:{user_id}" if user_id else f"ip:{ip}")
+
+
+def rate_limited(cost: float = 1.0):
+    """Dependency charging ``cost`` to the caller's buckets (see ``admit_request``)."""
+    # Imported here: auth needs the Supabase configuration, and modules that only use
+    # model_slot (the emotion classifier and its benchmark) must import without it
+    from auth import get_optional_user_id
+
+    async def admit(request: Request, user_id: Optional[str] = Depends(get_optional_user_id)) -> Optional[str]:
+        admit_request(request, user_id, cost)
+        return user_id
+
+    return admit
+
+
+def _expire(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError())
+
+
+class FairLimiter:
+    """Concurrency limit for one model; waiting calls are admitted round-robin across clients."""
+
+    def __init__(
+        self,
+        model: str,
+        limit: int,
+        max_queue: int = MODEL_QUEUE_SIZE,
+        max_queue_per_client: int = MODEL_QUEUE_PER_CLIENT,
+        queue_timeout: float = MODEL_QUEUE_TIMEOUT,
+    ) -> None:
+        self.model = model
+        self.limit = max(limit, 1)
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        # client -> its waiting calls; the client at the front is served next
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # Moving average of how long a call holds its slot, for Retry-After estimates
+        self._hold_seconds = 1.0
+
+    def _update_gauges(self) -> None:
+        MODEL_SLOTS_IN_USE.labels(self.model).set(self.active)
+        MODEL_QUEUE_DEPTH.labels(self.model).set(self.waiting)
+
+    def _retry_after(self) -> float:
+        return self._hold_seconds * (self.waiting + 1) / self.limit
+
+    def _reject(self, reason: str) -> HTTPException:
+        ADMISSION_REJECTIONS.labels(current_endpoint(), reason).inc()
+        return too_many_requests(self._retry_after(), "The AI service is busy. Please try again shortly.")
+
+    def _grant_next(self) -> None:
+        while self.active < self.limit and self._queues:
+            client, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self.waiting -= 1
+            if queue:
+                # Round robin: the client goes to the back of the line
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+        self._update_gauges()
+
+    def _dequeue(self, client: str, future: asyncio.Future) -> None:
+        queue = self._queues.get(client)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.waiting -= 1
+            if not queue:
+                del self._queues[client]
+        self._update_gauges()
+
+    def _release(self, held: float) -> None:
+        self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held
+        self.active -= 1
+        self._grant_next()
+
+    async def _acquire(self, client: str) -> None:
+        if self.active < self.limit and not self._queues:
+            self.active += 1
+            self._update_gauges()
+            return
+
+        queue = self._queues.get(client)
+        if self.waiting >= self.max_queue:
+            raise self._reject("queue_full")
+        if queue is not None and len(queue) >= self.max_queue_per_client:
+            raise self._reject("client_queue_full")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queues.setdefault(client, deque()).append(future)
+        self.waiting += 1
+        self._update_gauges()
+        start = time.perf_counter()
+        # Not asyncio.wait_for: on Python < 3.12 it swallows a cancellation that arrives together with the grant
+        timer = loop.call_later(self.queue_timeout, _expire, future)
+        try:
+            await future
+        except BaseException as e:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Granted just as the wait ended
+                self._release(0.0)
+            else:
+                self._dequeue(client, future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("queue_timeout") from None
+            raise
+        finally:
+            timer.cancel()
+            MODEL_QUEUE_WAIT_SECONDS.labels(self.model).observe(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def slot(self, client: str) -> AsyncIterator[None]:
+        await self._acquire(client)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+
+_limiters: Dict[str, FairLimiter] = {}
+
+
+def model_limiter(model: str) -> FairLimiter:
+    limiter = _limiters.get(model)
+    if limiter is None:
+        limiter = _limiters[model] = FairLimiter(model, MODEL_CONCURRENCY.get(model, MODEL_CONCURRENCY_DEFAULT))
+    return limiter
+
+
+def set_client(key: str) -> None:
+    """Queue the model calls of work done outside a request (e.g. a background job) under ``key``."""
+    _client.set(key)
+
+
+def model_slot(model: str):
+    """Hold one of ``model``'s concurrency slots for the enclosed upstream call, queueing fairly if all are taken."""
+    return model_limiter(model).slot(_client.get())
+
+
+__all__ = [
+    "FairLimiter",
+    "RateLimiter",
+    "TokenBucket",
+    "admit_request",
+    "client_ip",
+    "ip_rate_limiter",
+    "model_limiter",
+    "model_slot",
+    "rate_limited",
+    "set_client",
+    "too_many_requests",
+    "user_rate_limiter",
+]
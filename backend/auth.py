@@ -0,0 +1,216 @@
+"""Authentication dependency for endpoints that require a Supabase user.
+
+Access tokens are verified locally: HS256 tokens with the project's JWT
+secret (``SUPABASE_JWT_SECRET``) and asymmetric tokens with the project's
+JWKS. Verified tokens are cached until they expire. A token is only sent to
+``supabase.auth.get_user`` when it cannot be checked locally. Rejected
+tokens are remembered for ``AUTH_NEGATIVE_CACHE_SECONDS``, so a client
+repeating a bad token does not cost a Supabase round trip per request.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Optional, Tuple
+
+import jwt
+from fastapi import Header, HTTPException
+
+from metrics import observe_upstream
+from resilience import call_upstream
+from supabase_client import supabase
+
+SUPABASE_URL = os.getenv("SUPABASE_URL", "")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL", f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json")
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_NEGATIVE_CACHE_SECONDS = float(os.getenv("AUTH_NEGATIVE_CACHE_SECONDS", "30"))
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens and caches the resulting user ids until expiry."""
+
+    def __init__(
+        self,
+        jwt_secret: Optional[str] = SUPABASE_JWT_SECRET,
+        jwks_url: Optional[str] = SUPABASE_JWKS_URL,
+        audience: str = SUPABASE_JWT_AUDIENCE,
+        max_entries: int = AUTH_CACHE_SIZE,
+        negative_ttl: float = AUTH_NEGATIVE_CACHE_SECONDS,
+    ) -> None:
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        # PyJWKClient fetches lazily and keeps the key set in memory
+        self._jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True) if jwks_url and jwks_url.startswith("http") else None
+        # token -> (user_id, expires_at)
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # sha256 of a rejected token -> when the rejection is forgotten
+        self._rejected: "OrderedDict[str, float]" = OrderedDict()
+
+    def _cache_get(self, token: str) -> Optional[str]:
+        entry = self._cache.get(token)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if expires_at <= time.time():
+            del self._cache[token]
+            return None
+        self._cache.move_to_end(token)
+        return user_id
+
+    def _cache_put(self, token: str, user_id: str, expires_at: float) -> None:
+        self._cache[token] = (user_id, expires_at)
+        self._cache.move_to_end(token)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _recently_rejected(self, digest: str) -> bool:
+        until = self._rejected.get(digest)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._rejected[digest]
+            return False
+        return True
+
+    def _remember_rejection(self, digest: str) -> None:
+        if self.negative_ttl <= 0:
+            return
+        self._rejected[digest] = time.monotonic() + self.negative_ttl
+        self._rejected.move_to_end(digest)
+        while len(self._rejected) > self.max_entries:
+            self._rejected.popitem(last=False)
+
+    def _decode_with_jwks(self, token: str, algorithm: str) -> dict:
+        signing_key = self._jwks_client.get_signing_key_from_jwt(token)  # type: ignore[union-attr]
+        return jwt.decode(token, signing_key.key, algorithms=[algorithm], audience=self.audience)
+
+    async def _verify_locally(self, token: str) -> Optional[dict]:
+        """Return the verified claims, or None if the token cannot be checked locally.
+
+        Raises ``jwt.InvalidTokenError`` for tokens that are definitely invalid.
+        """
+        algorithm = jwt.get_unverified_header(token).get("alg")
+
+        if algorithm == "HS256":
+            if not self.jwt_secret:
+                return None
+            return jwt.decode(token, self.jwt_secret, algorithms=["HS256"], audience=self.audience)
+
+        if algorithm in ASYMMETRIC_ALGORITHMS and self._jwks_client is not None:
+            try:
+                # The key set fetch is blocking, so keep it off the event loop
+                return await asyncio.to_thread(self._decode_with_jwks, token, algorithm)
+            except jwt.PyJWKClientError as e:
+                print(f"JWKS lookup failed, falling back to Supabase: {str(e)}")
+                return None
+
+        return None
+
+    async def _verify_remotely(self, token: str) -> Tuple[str, float]:
+        async with observe_upstream("supabase", "get_user"):
+            auth_res = await call_upstream(
+                "supabase", partial(asyncio.to_thread, supabase.auth.get_user, token), operation="get_user"
+            )
+
+        err = getattr(auth_res, "error", None)
+        if err is not None:
+            raise HTTPException(status_code=401, detail="Invalid or expired token.")
+
+        user_obj = getattr(auth_res, "user", None)
+        if user_obj is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired token.")
+
+        # Supabase has vouched for the token, so its own expiry claim is trustworthy
+        claims = jwt.decode(token, options={"verify_signature": False})
+        return str(getattr(user_obj, "id", None)), float(claims.get("exp", time.time()))
+
+    async def verify(self, token: str) -> str:
+        """Return the user id for ``token`` or raise a 401 ``HTTPException``."""
+        user_id = self._cache_get(token)
+        if user_id is not None:
+            return user_id
+
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        if self._recently_rejected(digest):
+            raise HTTPException(status_code=401, detail="Invalid or expired token.")
+
+        try:
+            user_id, expires_at = await self._verify_uncached(token)
+        except HTTPException as e:
+            # Upstream failures (5xx, open circuit) are not the token's fault, so only 401s are remembered
+            if e.status_code == 401:
+                self._remember_rejection(digest)
+            raise
+
+        self._cache_put(token, user_id, expires_at)
+        return user_id
+
+    async def _verify_uncached(self, token: str) -> Tuple[str, float]:
+        try:
+            claims = await self._verify_locally(token)
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid or expired token.")
+
+        if claims is not None:
+            user_id = claims.get("sub")
+            if not user_id:
+                raise HTTPException(status_code=401, detail="Invalid or expired token.")
+            expires_at = float(claims.get("exp", time.time()))
+        else:
+            try:
+                user_id, expires_at = await self._verify_remotely(token)
+            except HTTPException:
+                raise
+            except Exception as e:
+                # supabase-py raises AuthApiError (status 401/403) for tokens it does not accept
+                if getattr(e, "status", None) in (401, 403):
+                    raise HTTPException(status_code=401, detail="Invalid or expired token.")
+                raise HTTPException(status_code=500, detail=f"Token validation failed: {str(e)}")
+
+        return user_id, expires_at
+
+
+# Single, process-wide verifier
+token_verifier = TokenVerifier()
+
+
+def bearer_token(authorization: Optional[str]) -> str:
+    """Extract the token from an ``Authorization: Bearer <token>`` header value."""
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header missing.")
+
+    if not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Authorization header must be in the format 'Bearer <token>'.")
+
+    return authorization.split(" ", 1)[1]
+
+
+async def get_current_user_id(
+    authorization: str = Header(..., description="Bearer access token"),
+) -> str:
+    """FastAPI dependency returning the authenticated user's id."""
+    return await token_verifier.verify(bearer_token(authorization))
+
+
+async def get_optional_user_id(
+    authorization: Optional[str] = Header(None, description="Bearer access token, if signed in"),
+) -> Optional[str]:
+    """FastAPI dependency for endpoints open to guests: the user's id, or None without a valid token."""
+    if not authorization:
+        return None
+    try:
+        return await token_verifier.verify(bearer_token(authorization))
+    except HTTPException:
+        return None
+
+
+__all__ = ["get_current_user_id", "get_optional_user_id", "bearer_token", "token_verifier", "TokenVerifier"]
@@ -0,0 +1,173 @@
+"""Compare the local emotional state classifier with the LLM path.
+
+For every sample (the patient's current state plus the doctor's message) the
+script runs the lexicon classifier and the original gpt-4o-mini
+``emotional_state_prompt`` call. It reports label agreement, how often the
+classifier would have skipped the LLM at the configured threshold, and
+latency for both paths as JSON.
+
+Usage (from the ``backend`` directory):
+
+    python benchmarks/emotion_classifier_benchmark.py [--dataset samples.jsonl] [--output report.json]
+
+Dataset lines look like ``{"current_state": "Calm", "message": "...", "expected": "Anxious"}``;
+``expected`` is optional. With ``--no-llm`` the classifier is only compared
+against ``expected`` labels and no OpenAI key is needed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emotional_state import EMOTION_CLASSIFIER_THRESHOLD, classify, llm_emotional_state  # noqa: E402
+
+DEFAULT_SAMPLES = [
+    {"current_state": "Calm", "message": "Good morning, what brings you in today?"},
+    {"current_state": "Calm", "message": "Unfortunately the biopsy results show a malignant tumor."},
+    {"current_state": "Anxious", "message": "I understand this is frightening. We will go through the options together."},
+    {"current_state": "Anxious", "message": "Please don't worry, this is very treatable and we'll take care of you."},
+    {"current_state": "Agitated", "message": "I'm sorry you had to wait so long, that must be really frustrating."},
+    {"current_state": "Agitated", "message": "Calm down, you're overreacting. Just do what I say."},
+    {"current_state": "Resistant", "message": "You have to take this medication, there is no other way."},
+    {"current_state": "Resistant", "message": "What do you think about trying a lower dose first? It's your choice."},
+    {"current_state": "Cooperative", "message": "Thank you for telling me. Would you like to hear about the next steps?"},
+    {"current_state": "Cooperative", "message": "I don't have time for this, the next patient is waiting."},
+    {"current_state": "Calm", "message": "There is a small risk of complications after the surgery."},
+    {"current_state": "Anxious", "message": "Let's take it one step at a time. How do you feel about that?"},
+    {"current_state": "Calm", "message": "Dobrý den, co vás k nám přivádí?"},
+    {"current_state": "Anxious", "message": "Rozumím, že máte strach. Nebojte se, postaráme se o vás společně."},
+    {"current_state": "Cooperative", "message": "Musíte to podstoupit, nemáte na výběr."},
+    {"current_state": "Agitated", "message": "Je mi líto, že jste čekal tak dlouho."},
+    {"current_state": "Calm", "message": "Bohužiaľ, výsledky ukazujú nádor."},
+    {"current_state": "Resistant", "message": "Čo si myslíte o týchto možnostiach?"},
+    {"current_state": "Calm", "message": "Can you describe the pain for me?"},
+    {"current_state": "Agitated", "message": "That's nonsense, it's your fault for not coming earlier."},
+]
+
+
+def load_samples(path: Optional[str]) -> List[dict]:
+    if not path:
+        return list(DEFAULT_SAMPLES)
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(values_ms: List[float]) -> dict:
+    return {
+        "p50_ms": percentile(values_ms, 0.50),
+        "p95_ms": percentile(values_ms, 0.95),
+        "mean_ms": statistics.fmean(values_ms) if values_ms else None,
+    }
+
+
+def agreement(pairs: List[tuple]) -> Optional[float]:
+    pairs = [(a, b) for a, b in pairs if a is not None and b is not None]
+    if not pairs:
+        return None
+    return sum(1 for a, b in pairs if a == b) / len(pairs)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    samples = load_samples(args.dataset)
+
+    # Classifier path: repeat each call to get stable microsecond timings
+    predictions = []
+    classifier_latencies: List[float] = []
+    for sample in samples:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            prediction = classify(sample["current_state"], sample["message"])
+        classifier_latencies.append((time.perf_counter() - start) * 1000 / args.repeat)
+        predictions.append(prediction)
+
+    # LLM path: the original emotional_state_prompt call
+    llm_labels: List[Optional[str]] = [None] * len(samples)
+    llm_latencies: List[float] = []
+    if not args.no_llm:
+        from openai import AsyncOpenAI  # type: ignore
+
+        client = AsyncOpenAI()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def call(index: int, sample: dict) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    llm_labels[index] = await llm_emotional_state(client, sample["current_state"], sample["message"])
+                except Exception as e:
+                    print(f"LLM call failed for sample {index}: {str(e)}", file=sys.stderr)
+                    return
+                llm_latencies.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(call(i, sample) for i, sample in enumerate(samples)))
+
+    confident = [p.confidence >= args.threshold for p in predictions]
+    expected = [sample.get("expected") for sample in samples]
+
+    return {
+        "samples": len(samples),
+        "threshold": args.threshold,
+        "classifier_coverage": sum(confident) / len(samples) if samples else None,
+        "agreement_with_llm": {
+            "all": agreement([(p.state, l) for p, l in zip(predictions, llm_labels)]),
+            "confident_only": agreement([(p.state, l) for p, l, c in zip(predictions, llm_labels, confident) if c]),
+        },
+        "agreement_with_expected": {
+            "classifier": agreement([(p.state, e) for p, e in zip(predictions, expected)]),
+            "llm": agreement([(l, e) for l, e in zip(llm_labels, expected)]),
+        },
+        "latency": {
+            "classifier": latency_summary(classifier_latencies),
+            "llm": latency_summary(llm_latencies),
+        },
+        "details": [
+            {
+                "current_state": sample["current_state"],
+                "message": sample["message"],
+                "classifier": p.state,
+                "confidence": round(p.confidence, 3),
+                "cues": list(p.cues),
+                "llm": l,
+                "expected": e,
+            }
+            for sample, p, l, e in zip(samples, predictions, llm_labels, expected)
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", help="JSONL file with current_state/message[/expected] samples")
+    parser.add_argument("--threshold", type=float, default=EMOTION_CLASSIFIER_THRESHOLD)
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent LLM calls")
+    parser.add_argument("--repeat", type=int, default=200, help="Classifier repetitions per sample for timing")
+    parser.add_argument("--no-llm", action="store_true", help="Skip the OpenAI calls")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Compare the monolithic and the sharded (per-skill) evaluation modes.
+
+Every transcript is scored in both modes: one gpt-4o call for all skills,
+and one concurrent call per skill using ``EVALUATION_SHARD_MODEL`` /
+``EVALUATION_SKILL_MODELS``. The script reports wall-clock latency for each
+mode and how closely the sharded scores agree with the monolithic ones
+(exact, within one point, mean absolute difference), overall and per skill,
+as JSON.
+
+Usage (from the ``backend`` directory, with ``OPENAI_API_KEY`` set):
+
+    python benchmarks/evaluation_mode_benchmark.py [--dataset transcripts.jsonl] [--output report.json]
+
+Dataset lines look like ``{"transcript": "Doctor: ...\\nPatient: ...", "skills": [...], "lang": "en"}``;
+``skills`` defaults to the whole rubric and ``lang`` to English.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation import EVALUATION_SHARD_MODEL, EVALUATION_SKILL_MODELS, score_with_mode  # noqa: E402
+from rubric import MASTER_RUBRIC  # noqa: E402
+
+DEFAULT_SAMPLES = [
+    {
+        "transcript": (
+            "Doctor: Good morning, I'm Dr. Novak. What brings you in today?\n"
+            "Patient: I've had chest pain for two days and I'm scared it's my heart.\n"
+            "Doctor: That sounds frightening. Can you tell me more about when the pain started and what it feels like?\n"
+            "Patient: It's sharp, mostly when I breathe in.\n"
+            "Doctor: Thank you. Does anything make it better or worse? Any fever or cough?\n"
+            "Patient: A little cough, no fever.\n"
+            "Doctor: From what you describe it sounds more like irritation of the lining of the lungs than the heart, "
+            "but I'd like to do an ECG to be sure. Does that sound okay to you?"
+        ),
+    },
+    {
+        "transcript": (
+            "Doctor: Your results are back. It's cancer.\n"
+            "Patient: What? What does that mean for me?\n"
+            "Doctor: We'll start chemo next week. The nurse will give you the schedule.\n"
+            "Patient: I don't understand, is it serious?\n"
+            "Doctor: All cancer is serious. Any other questions? I have another patient waiting."
+        ),
+    },
+    {
+        "transcript": (
+            "Doctor: Hello, I understand you don't want to take the blood pressure medication I prescribed.\n"
+            "Patient: I read online it has terrible side effects.\n"
+            "Doctor: It's good that you looked into it. Which side effects worry you most?\n"
+            "Patient: Dizziness. I live alone.\n"
+            "Doctor: That's a fair concern. Dizziness can happen in the first days, so we could start with a lower dose "
+            "and check in after a week. What would you think about that?\n"
+            "Patient: I could try that.\n"
+            "Doctor: Great. To make sure I explained it well, can you tell me how you'll take it?"
+        ),
+    },
+]
+
+
+def load_samples(path: Optional[str]) -> List[dict]:
+    if not path:
+        return list(DEFAULT_SAMPLES)
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(values_ms: List[float]) -> dict:
+    return {
+        "p50_ms": percentile(values_ms, 0.50),
+        "p95_ms": percentile(values_ms, 0.95),
+        "mean_ms": statistics.fmean(values_ms) if values_ms else None,
+    }
+
+
+def score_agreement(pairs: List[tuple]) -> dict:
+    """Agreement between (monolithic, sharded) score pairs."""
+    if not pairs:
+        return {"pairs": 0, "exact": None, "within_one": None, "mean_abs_diff": None}
+    diffs = [abs(a - b) for a, b in pairs]
+    return {
+        "pairs": len(pairs),
+        "exact": sum(1 for d in diffs if d == 0) / len(diffs),
+        "within_one": sum(1 for d in diffs if d <= 1) / len(diffs),
+        "mean_abs_diff": statistics.fmean(diffs),
+    }
+
+
+async def timed(client, mode: str, sample: dict, skills: List[str]) -> tuple:
+    start = time.perf_counter()
+    try:
+        scores = await score_with_mode(client, skills, sample["transcript"], sample.get("lang", "en"), mode)
+    except Exception as e:
+        print(f"{mode} evaluation failed: {getattr(e, 'detail', str(e))}", file=sys.stderr)
+        return None, None
+    return scores, (time.perf_counter() - start) * 1000
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from openai import AsyncOpenAI  # type: ignore
+
+    client = AsyncOpenAI()
+    samples = load_samples(args.dataset)
+
+    latencies: Dict[str, List[float]] = {"monolithic": [], "sharded": []}
+    pairs: List[tuple] = []
+    pairs_by_skill: Dict[str, List[tuple]] = {}
+    details = []
+    for index, sample in enumerate(samples):
+        skills = sample.get("skills") or list(MASTER_RUBRIC)
+        for _ in range(args.repeat):
+            # One mode at a time, so the two never compete for rate limits
+            monolithic, monolithic_ms = await timed(client, "monolithic", sample, skills)
+            sharded, sharded_ms = await timed(client, "sharded", sample, skills)
+            if monolithic_ms is not None:
+                latencies["monolithic"].append(monolithic_ms)
+            if sharded_ms is not None:
+                latencies["sharded"].append(sharded_ms)
+            if monolithic is None or sharded is None:
+                continue
+
+            for skill in skills:
+                if skill in monolithic and skill in sharded:
+                    pair = (monolithic[skill]["score"], sharded[skill]["score"])
+                    pairs.append(pair)
+                    pairs_by_skill.setdefault(skill, []).append(pair)
+            details.append(
+                {
+                    "sample": index,
+                    "monolithic_ms": round(monolithic_ms, 1),
+                    "sharded_ms": round(sharded_ms, 1),
+                    "scores": {
+                        skill: {"monolithic": monolithic[skill]["score"], "sharded": sharded[skill]["score"]}
+                        for skill in skills
+                        if skill in monolithic and skill in sharded
+                    },
+                }
+            )
+
+    monolithic_p50 = percentile(latencies["monolithic"], 0.50)
+    sharded_p50 = percentile(latencies["sharded"], 0.50)
+    return {
+        "samples": len(samples),
+        "repeat": args.repeat,
+        "shard_model": EVALUATION_SHARD_MODEL,
+        "skill_models": EVALUATION_SKILL_MODELS,
+        "latency": {mode: latency_summary(values) for mode, values in latencies.items()},
+        "speedup_p50": monolithic_p50 / sharded_p50 if monolithic_p50 and sharded_p50 else None,
+        "agreement": score_agreement(pairs),
+        "agreement_by_skill": {skill: score_agreement(skill_pairs) for skill, skill_pairs in pairs_by_skill.items()},
+        "details": details,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", help="JSONL file with transcript[/skills/lang] samples")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per sample and mode")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
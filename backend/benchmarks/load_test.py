@@ -0,0 +1,451 @@
+"""Offline load test of the backend against local upstream stubs.
+
+The script starts ``upstream_stubs.py`` (OpenAI, ElevenLabs, Deepgram and
+Supabase stand-ins) and the app itself under uvicorn, pointed at the stubs
+and at a local database (a fresh SQLite file unless ``--database-url`` is
+given). The database gets the tables and a few seeded scenarios. Virtual
+users then run complete trainer sessions:
+
+    GET /api/scenarios -> POST /api/chat x --turns -> POST /api/evaluate -> POST /api/coach/generate-feedback
+
+The JSON report has p50/p95/p99 latency per endpoint, request and session
+throughput, errors, and the app worker's RSS over the run. With
+``--baseline`` the run is compared to an earlier report, and the script
+exits with status 1 if a p95 latency or the throughput regressed by more than
+``--tolerance``.
+
+Usage (from the ``backend`` directory, after ``pip install -r requirements-dev.txt``
+for the SQLite driver):
+
+    python benchmarks/load_test.py [--users 10] [--sessions 50] [--turns 6] [--output report.json]
+    python benchmarks/load_test.py --baseline report.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import fields
+from typing import Dict, List, Optional
+
+import httpx
+import jwt
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from upstream_stubs import StubConfig  # noqa: E402
+
+JWT_SECRET = "load-test-secret-for-local-runs-only"
+LANGUAGES = ("en", "cs", "sk")
+DOCTOR_LINES = [
+    "Good morning, what brings you in today?",
+    "I understand this is frightening. Can you tell me more about the pain?",
+    "When did it start, and does anything make it better or worse?",
+    "Thank you for telling me. Have you noticed any other symptoms?",
+    "I'd like to run a few tests to be sure. How do you feel about that?",
+    "It's completely normal to be worried. We'll go through the results together.",
+    "Do you have any questions about what we discussed?",
+    "Let's summarize: we'll do the blood test today and meet again on Friday.",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(values_ms: List[float]) -> dict:
+    return {
+        "p50_ms": percentile(values_ms, 0.50),
+        "p95_ms": percentile(values_ms, 0.95),
+        "p99_ms": percentile(values_ms, 0.99),
+        "mean_ms": statistics.fmean(values_ms) if values_ms else None,
+        "max_ms": max(values_ms) if values_ms else None,
+    }
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of ``pid`` in MB (Linux /proc, or psutil where installed)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil  # type: ignore
+
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except Exception:
+        return None
+
+
+async def prepare_database(database_url: str, scenarios: int) -> None:
+    """Create the tables and seed ``scenarios`` scenarios with every rubric skill."""
+    os.environ["DATABASE_URL"] = database_url
+    from sqlalchemy import select
+
+    from database import Base, SessionLocal, engine
+    from models import Scenario, ScenarioSkill, ScenarioTranslation
+    from rubric import MASTER_RUBRIC
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with SessionLocal() as session:
+        for index in range(scenarios):
+            scenario_id = f"load-test-{index + 1}"
+            if (await session.execute(select(Scenario.id).where(Scenario.id == scenario_id))).first():
+                continue
+            session.add(
+                Scenario(
+                    id=scenario_id,
+                    difficulty="medium",
+                    message_limit=20,
+                    initial_emotional_state="Anxious",
+                    voice_id_en="voice-en",
+                    voice_id_cs="voice-cs",
+                    voice_id_sk="voice-sk",
+                )
+            )
+            for skill in MASTER_RUBRIC:
+                session.add(ScenarioSkill(scenario_id=scenario_id, skill_name=skill))
+            for lang in LANGUAGES:
+                session.add(
+                    ScenarioTranslation(
+                        scenario_id=scenario_id,
+                        language_code=lang,
+                        title=f"Load test scenario {index + 1}",
+                        learning_path="Load testing",
+                        goal="Explain the diagnosis and agree on the next steps.",
+                        persona_prompt="You are a 54-year-old patient with recurring chest pain who fears a heart attack.",
+                        opening_line="Doctor, I'm really scared something is wrong with my heart.",
+                    )
+                )
+        await session.commit()
+    await engine.dispose()
+
+
+async def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with status {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds")
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, name: str, status: str) -> None:
+        statuses = self.statuses.setdefault(name, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+    async def call(self, name: str, send) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except httpx.HTTPError as e:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            self._count(name, type(e).__name__)
+            raise
+        self.latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        self._count(name, str(response.status_code))
+        if response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+
+async def run_session(client: httpx.AsyncClient, recorder: Recorder, turns: int, lang: str) -> bool:
+    """One trainer session; returns False if any step failed."""
+    token = jwt.encode(
+        {"sub": str(uuid.uuid4()), "aud": "authenticated", "exp": int(time.time()) + 3600},
+        JWT_SECRET,
+        algorithm="HS256",
+    )
+    auth = {"Authorization": f"Bearer {token}"}
+
+    response = await recorder.call("GET /api/scenarios", lambda: client.get("/api/scenarios", params={"lang": lang}))
+    if response.status_code != 200 or not response.json():
+        return False
+    scenario_id = random.choice(response.json())["id"]
+
+    history: List[str] = []
+    emotional_state = "Anxious"
+    for turn in range(turns):
+        message = DOCTOR_LINES[turn % len(DOCTOR_LINES)]
+        body = {
+            "scenario_id": scenario_id,
+            "message": message,
+            "history": list(history),
+            "current_emotional_state": emotional_state,
+            "lang": lang,
+        }
+        response = await recorder.call("POST /api/chat", lambda: client.post("/api/chat", json=body))
+        if response.status_code != 200:
+            return False
+        reply = response.json()
+        history.extend([message, reply["text_response"]])
+        emotional_state = reply["new_emotional_state"]
+
+    transcript = "\n".join(
+        f"{'Doctor' if index % 2 == 0 else 'Patient'}: {text}" for index, text in enumerate(history)
+    )
+    response = await recorder.call(
+        "POST /api/evaluate",
+        lambda: client.post(
+            "/api/evaluate", json={"scenario_id": scenario_id, "transcript": transcript, "lang": lang}, headers=auth
+        ),
+    )
+    if response.status_code != 200:
+        return False
+    evaluation_id = response.json()["evaluation_id"]
+
+    response = await recorder.call(
+        "POST /api/coach/generate-feedback",
+        lambda: client.post(
+            "/api/coach/generate-feedback", json={"evaluation_id": evaluation_id, "lang": lang}, headers=auth
+        ),
+    )
+    return response.status_code == 200
+
+
+async def sample_rss(pid: int, samples: List[float], stop: asyncio.Event, interval: float) -> None:
+    while not stop.is_set():
+        value = rss_mb(pid)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def drive(args: argparse.Namespace, app_url: str, app_pid: int) -> dict:
+    recorder = Recorder()
+    rss_samples: List[float] = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(app_pid, rss_samples, stop, args.rss_interval))
+    rss_before = rss_mb(app_pid)
+
+    semaphore = asyncio.Semaphore(args.users)
+    outcomes: List[bool] = []
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.request_timeout, limits=limits) as client:
+
+        async def user_session(index: int) -> None:
+            async with semaphore:
+                lang = args.lang or LANGUAGES[index % len(LANGUAGES)]
+                try:
+                    outcomes.append(await run_session(client, recorder, args.turns, lang))
+                except (httpx.HTTPError, KeyError, ValueError) as e:
+                    print(f"Session {index} failed: {str(e)}", file=sys.stderr)
+                    outcomes.append(False)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user_session(index) for index in range(args.sessions)))
+        duration = time.perf_counter() - start
+
+    stop.set()
+    await sampler
+    total_requests = sum(len(values) for values in recorder.latencies.values())
+    return {
+        "duration_s": duration,
+        "sessions": {
+            "completed": sum(outcomes),
+            "failed": len(outcomes) - sum(outcomes),
+            "per_second": sum(outcomes) / duration if duration else None,
+        },
+        "requests": {
+            "total": total_requests,
+            "errors": sum(recorder.errors.values()),
+            "per_second": total_requests / duration if duration else None,
+        },
+        "endpoints": {
+            name: {
+                "count": len(values),
+                "errors": recorder.errors.get(name, 0),
+                "statuses": recorder.statuses.get(name, {}),
+                **latency_summary(values),
+            }
+            for name, values in recorder.latencies.items()
+        },
+        "rss_mb": {
+            "before": rss_before,
+            "peak": max(rss_samples) if rss_samples else None,
+            "after": rss_mb(app_pid),
+            "samples": len(rss_samples),
+        },
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of ``report`` against ``baseline`` beyond ``tolerance`` (a fraction)."""
+    regressions: List[str] = []
+    for name, stats in baseline.get("endpoints", {}).items():
+        current = report["endpoints"].get(name)
+        if current is None or not stats.get("p95_ms") or current.get("p95_ms") is None:
+            continue
+        if current["p95_ms"] > stats["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name} p95 {current['p95_ms']:.1f} ms vs {stats['p95_ms']:.1f} ms")
+    before = (baseline.get("requests") or {}).get("per_second")
+    after = report["requests"]["per_second"]
+    if before and after is not None and after < before * (1 - tolerance):
+        regressions.append(f"throughput {after:.2f} req/s vs {before:.2f} req/s")
+    if report["requests"]["errors"] > (baseline.get("requests") or {}).get("errors", 0):
+        regressions.append(f"errors {report['requests']['errors']} vs {baseline['requests']['errors']}")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> dict:
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'load_test.db')}"
+    stub_port = free_port()
+    app_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    stub_config = {field.name: getattr(args, field.name) for field in fields(StubConfig)}
+    stub_args = [f"--{name.replace('_', '-')}={value}" for name, value in stub_config.items()]
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"{stub_url}/v1",
+        "ELEVENLABS_API_KEY": "stub",
+        "ELEVENLABS_BASE_URL": stub_url,
+        "DEEPGRAM_API_KEY": "stub",
+        "DEEPGRAM_URL": stub_url,
+        "SUPABASE_URL": stub_url,
+        "SUPABASE_KEY": "stub",
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts-cache"),
+        # Every virtual user shares 127.0.0.1, so the request rate limits would throttle the run instead of measuring it
+        "RATE_LIMIT_USER_PER_MINUTE": os.getenv("RATE_LIMIT_USER_PER_MINUTE", "0"),
+        "RATE_LIMIT_IP_PER_MINUTE": os.getenv("RATE_LIMIT_IP_PER_MINUTE", "0"),
+    }
+    if args.remote_auth:
+        # Every new token is checked against the Supabase stub
+        env.pop("SUPABASE_JWT_SECRET", None)
+    else:
+        env["SUPABASE_JWT_SECRET"] = JWT_SECRET
+
+    await prepare_database(database_url, args.scenarios)
+
+    processes: List[subprocess.Popen] = []
+    try:
+        processes.append(
+            subprocess.Popen(
+                [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "upstream_stubs.py"), f"--port={stub_port}", *stub_args],
+                cwd=BACKEND_DIR,
+            )
+        )
+        await wait_until_up(f"{stub_url}/health", processes[-1])
+
+        processes.append(
+            subprocess.Popen(
+                [
+                    sys.executable, "-m", "uvicorn", "main:app",
+                    "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning", "--no-access-log",
+                ],
+                cwd=BACKEND_DIR,
+                env=env,
+            )
+        )
+        await wait_until_up(f"{app_url}/", processes[-1])
+
+        # A short warm-up, so connection setup and first-use costs stay out of the numbers
+        if args.warmup:
+            warmup_args = argparse.Namespace(**{**vars(args), "sessions": args.warmup, "users": min(args.users, args.warmup)})
+            await drive(warmup_args, app_url, processes[-1].pid)
+
+        results = await drive(args, app_url, processes[-1].pid)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {
+            "users": args.users,
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "warmup": args.warmup,
+            "lang": args.lang,
+            "database": database_url.split(":", 1)[0],
+            "remote_auth": args.remote_auth,
+            "stubs": stub_config,
+        },
+        **results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="Concurrent sessions")
+    parser.add_argument("--sessions", type=int, default=50, help="Total sessions")
+    parser.add_argument("--turns", type=int, default=6, help="Chat turns per session")
+    parser.add_argument("--warmup", type=int, default=2, help="Sessions run before measuring")
+    parser.add_argument("--lang", choices=LANGUAGES, help="Session language (default: rotate)")
+    parser.add_argument("--scenarios", type=int, default=3, help="Scenarios to seed")
+    parser.add_argument("--database-url", help="Database to use instead of a fresh SQLite file (tables are created)")
+    parser.add_argument("--remote-auth", action="store_true", help="Verify tokens via the Supabase stub")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--rss-interval", type=float, default=0.5, help="Seconds between RSS samples")
+    for field in fields(StubConfig):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression as a fraction")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Local stand-ins for the OpenAI, ElevenLabs, Deepgram and Supabase APIs.
+
+The stubs speak just enough of each wire protocol for the real SDK clients
+to work against them, with configurable latency and payload sizes:
+
+- ``POST /v1/chat/completions``: OpenAI chat completions, plain or streamed
+  (SSE, including the ``include_usage`` chunk). Structured-output requests
+  get valid scores for every skill in the schema; the emotional state prompt
+  gets an allowed state.
+- ``POST /v1/text-to-speech/{voice_id}``: ElevenLabs synthesis, streamed as
+  ``--tts-bytes-per-char`` bytes per input character.
+- ``POST /v1/listen``: Deepgram prerecorded transcription.
+- ``GET /auth/v1/user``: Supabase token lookup.
+
+Point the app at them with ``OPENAI_BASE_URL``, ``ELEVENLABS_BASE_URL``,
+``DEEPGRAM_URL`` and ``SUPABASE_URL`` (see ``load_test.py``, which starts
+them for you).
+
+Usage (from the ``backend`` directory):
+
+    python benchmarks/upstream_stubs.py --port 9100 [--openai-first-token-ms 300] [--tts-ms 200]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, fields
+from typing import AsyncIterator, List
+
+import jwt
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMOTIONAL_STATES = ["Calm", "Cooperative", "Resistant", "Anxious", "Agitated"]
+WORDS = (
+    "I understand doctor but I am still worried about what this means for my family and whether "
+    "the treatment will help me get back to work soon so please tell me honestly what to expect"
+).split()
+
+
+@dataclass
+class StubConfig:
+    openai_first_token_ms: float = 300.0  # Time to the first token (or to the whole non-streamed reply)
+    openai_token_ms: float = 15.0  # Per generated token
+    openai_reply_tokens: int = 40  # Words in a chat reply
+    tts_ms: float = 200.0  # Time to the first audio chunk
+    tts_bytes_per_char: int = 1000  # Roughly 128 kbit/s MP3 at a normal speaking rate
+    tts_chunk_bytes: int = 16 * 1024
+    tts_chunk_ms: float = 5.0
+    deepgram_ms: float = 400.0
+    supabase_ms: float = 50.0
+
+
+def _sleep(ms: float):
+    return asyncio.sleep(max(ms, 0) / 1000)
+
+
+def _reply_text(body: dict, config: StubConfig) -> str:
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        skills: List[str] = response_format["json_schema"]["schema"].get("required", [])
+        return json.dumps(
+            {
+                skill: {"reasoning": "Stub reasoning.", "score": random.randint(2, 5), "justification": "Stub justification."}
+                for skill in skills
+            }
+        )
+
+    last = str((body.get("messages") or [{}])[-1].get("content", ""))
+    if "new emotional state" in last:
+        return random.choice(EMOTIONAL_STATES)
+    # Different every time, so the TTS cache does not absorb the whole load
+    return " ".join(random.choice(WORDS) for _ in range(config.openai_reply_tokens)) + "."
+
+
+def _usage(body: dict, completion_text: str) -> dict:
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages") or []) // 4
+    completion_tokens = max(1, len(completion_text) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def create_stub_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        text = _reply_text(body, config)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o-mini")
+        tokens = text.split(" ")
+
+        if not body.get("stream"):
+            await _sleep(config.openai_first_token_ms + config.openai_token_ms * len(tokens))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                ],
+                "usage": _usage(body, text),
+            }
+
+        def chunk(delta: dict, finish_reason=None, choices=True, usage=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+            }
+            if usage is not None:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            await _sleep(config.openai_first_token_ms)
+            yield chunk({"role": "assistant", "content": ""})
+            for index, token in enumerate(tokens):
+                if index:
+                    await _sleep(config.openai_token_ms)
+                yield chunk({"content": token if index == 0 else f" {token}"})
+            yield chunk({}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk({}, choices=False, usage=_usage(body, text))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/text-to-speech/{voice_id}")
+    async def text_to_speech(voice_id: str, request: Request):
+        body = await request.json()
+        size = max(1, len(body.get("text", ""))) * config.tts_bytes_per_char
+
+        async def audio() -> AsyncIterator[bytes]:
+            await _sleep(config.tts_ms)
+            sent = 0
+            while sent < size:
+                part = min(config.tts_chunk_bytes, size - sent)
+                yield b"\xff" * part
+                sent += part
+                await _sleep(config.tts_chunk_ms)
+
+        return StreamingResponse(audio(), media_type="audio/mpeg")
+
+    @app.post("/v1/listen")
+    async def listen(request: Request):
+        audio = await request.body()
+        await _sleep(config.deepgram_ms)
+        transcript = "Doctor, I have had a headache for three days."
+        return {
+            "metadata": {
+                "transaction_key": "stub",
+                "request_id": str(uuid.uuid4()),
+                "sha256": "",
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "duration": len(audio) / 32000,
+                "channels": 1,
+                "models": ["stub"],
+                "model_info": {},
+            },
+            "results": {
+                "channels": [
+                    {"alternatives": [{"transcript": transcript, "confidence": 0.99, "words": []}]}
+                ]
+            },
+        }
+
+    @app.get("/auth/v1/user")
+    async def supabase_user(request: Request):
+        await _sleep(config.supabase_ms)
+        authorization = request.headers.get("authorization", "")
+        if not authorization.lower().startswith("bearer "):
+            return JSONResponse({"msg": "missing token"}, status_code=401)
+        claims = jwt.decode(authorization[7:], options={"verify_signature": False})
+        return {
+            "id": claims.get("sub"),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": f"{claims.get('sub')}@example.com",
+            "app_metadata": {},
+            "user_metadata": {},
+            "created_at": "2024-01-01T00:00:00Z",
+        }
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    for field in fields(StubConfig):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StubConfig(**{field.name: getattr(args, field.name) for field in fields(StubConfig)})
+    uvicorn.run(create_stub_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Concurrent execution of one chat turn.
+
+A turn is a small dependency graph: the emotional state decision and the
+history summary are independent and run side by side. The persona
+completion waits for both. With ``CHAT_TTS_BY_SENTENCE`` speech synthesis
+overlaps the completion, since each finished sentence of the streamed reply
+is sent to TTS while the model is still writing the next one; at most
+``TTS_SENTENCE_CONCURRENCY`` sentences are synthesized at once, to stay
+within ElevenLabs' concurrent request limit. Every stage records its start
+and end time relative to the start of the turn.
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from tts import synthesize_speech
+
+# Synthesize the reply sentence by sentence while it is still being generated
+CHAT_TTS_BY_SENTENCE = os.getenv("CHAT_TTS_BY_SENTENCE", "false").lower() in ("1", "true", "yes")
+# Short sentences are merged until a chunk has at least this many characters
+TTS_SENTENCE_MIN_CHARS = int(os.getenv("TTS_SENTENCE_MIN_CHARS", "40"))
+# Sentences of one reply synthesized at the same time; the rest wait their turn
+TTS_SENTENCE_CONCURRENCY = int(os.getenv("TTS_SENTENCE_CONCURRENCY", "2"))
+
+# Sentence end: terminal punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_BOUNDARY = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+
+
+class TurnGraph:
+    """Runs named async stages as soon as their dependencies finish and times each one."""
+
+    def __init__(self) -> None:
+        self._origin = time.perf_counter()
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+        # stage -> (start, end) in seconds since the turn started
+        self.timings: Dict[str, Tuple[float, float]] = {}
+
+    def now(self) -> float:
+        return time.perf_counter() - self._origin
+
+    def add(self, name: str, func: Callable[..., Awaitable], *dependencies: str) -> None:
+        """Schedule ``func(*dependency_results)`` under ``name``."""
+        upstream = [self._tasks[dependency] for dependency in dependencies]
+
+        async def run():
+            results = [await task for task in upstream]
+            start = self.now()
+            try:
+                return await func(*results)
+            finally:
+                self.timings[name] = (start, self.now())
+
+        self._tasks[name] = asyncio.create_task(run())
+
+    async def result(self, name: str):
+        return await self._tasks[name]
+
+    def record(self, name: str, start: float, end: Optional[float] = None) -> None:
+        """Record a stage that was executed inline rather than through ``add``."""
+        self.timings[name] = (start, self.now() if end is None else end)
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+    def summary(self) -> dict:
+        """Per-stage timings in milliseconds plus the end-to-end total."""
+        stages = {
+            name: {
+                "start_ms": round(start * 1000, 1),
+                "end_ms": round(end * 1000, 1),
+                "duration_ms": round((end - start) * 1000, 1),
+            }
+            for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0])
+        }
+        return {"stages": stages, "total_ms": round(self.now() * 1000, 1)}
+
+    def server_timing(self) -> str:
+        """Value for a ``Server-Timing`` response header."""
+        entries = [f"{name};dur={(end - start) * 1000:.1f}" for name, (start, end) in self.timings.items()]
+        entries.append(f"total;dur={self.now() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+class SentenceSpeech:
+    """Starts TTS for each complete sentence of a reply while the rest is still streaming.
+
+    ``feed`` receives text deltas; ``finish`` flushes the remainder and returns
+    the clips joined in order (MP3 frames concatenate cleanly), or None if
+    any sentence fails so the turn degrades to text only, as before. Once a
+    sentence has failed, the ones still waiting for a slot are not sent.
+    """
+
+    def __init__(
+        self,
+        client,
+        voice_id: Optional[str],
+        graph: TurnGraph,
+        min_chars: int = TTS_SENTENCE_MIN_CHARS,
+        concurrency: int = TTS_SENTENCE_CONCURRENCY,
+    ) -> None:
+        self.client = client
+        self.voice_id = voice_id
+        self.graph = graph
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._tasks: List["asyncio.Task"] = []
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._failed = False
+        self._first_start: Optional[float] = None
+        self._first_end: Optional[float] = None
+
+    def feed(self, delta: str) -> None:
+        self._buffer += delta
+        cut = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._buffer):
+            if match.end() - cut >= self.min_chars:
+                self._submit(self._buffer[cut : match.end()])
+                cut = match.end()
+        self._buffer = self._buffer[cut:]
+
+    def _submit(self, text: str) -> None:
+        text = text.strip()
+        if not text or self._failed:
+            return
+        if self._first_start is None:
+            self._first_start = self.graph.now()
+        self._tasks.append(asyncio.create_task(self._synthesize(text, first=not self._tasks)))
+
+    async def _synthesize(self, text: str, first: bool) -> bytes:
+        async with self._slots:
+            if self._failed:
+                return b""
+            try:
+                audio = await synthesize_speech(self.client, text, self.voice_id)
+            except Exception:
+                self._failed = True
+                raise
+        if first:
+            self._first_end = self.graph.now()
+        return audio
+
+    def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    async def finish(self) -> Optional[bytes]:
+        self._submit(self._buffer)
+        self._buffer = ""
+        if not self._tasks:
+            return None
+
+        try:
+            clips = await asyncio.gather(*self._tasks)
+        except Exception as e:
+            self.cancel()
+            print(f"Text-to-speech conversion failed: {str(e)}")
+            return None
+        finally:
+            self.graph.record("tts", self._first_start or 0.0)
+            if self._first_end is not None:
+                self.graph.record("tts_first_sentence", self._first_start or 0.0, self._first_end)
+
+        if not all(clips):
+            print("Warning: No audio data received from ElevenLabs")
+            return None
+        return b"".join(clips)
+
+
+__all__ = [
+    "CHAT_TTS_BY_SENTENCE",
+    "TTS_SENTENCE_CONCURRENCY",
+    "TurnGraph",
+    "SentenceSpeech",
+]
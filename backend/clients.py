@@ -0,0 +1,94 @@
+"""Shared, long-lived async clients for the upstream AI providers.
+
+The clients are created once when the application starts and closed on
+shutdown. OpenAI and ElevenLabs share a single pooled ``httpx.AsyncClient``
+so every request reuses keep-alive connections instead of opening new ones.
+Retries are left to ``resilience.py``, so the OpenAI client makes none itself.
+"""
+
+import os
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI  # type: ignore
+from elevenlabs.client import AsyncElevenLabs
+from deepgram import DeepgramClient, DeepgramClientOptions
+
+# Connection pool sizing (overridable via environment variables)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+
+# Alternative API hosts, e.g. local stubs for load tests (OpenAI reads OPENAI_BASE_URL itself)
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL")
+DEEPGRAM_URL = os.getenv("DEEPGRAM_URL")
+
+
+class UpstreamClients:
+    """Holds the process-wide async clients for OpenAI, ElevenLabs and Deepgram."""
+
+    def __init__(self) -> None:
+        self._http: Optional[httpx.AsyncClient] = None
+        self._openai: Optional[AsyncOpenAI] = None
+        self._elevenlabs: Optional[AsyncElevenLabs] = None
+        self._deepgram: Optional[DeepgramClient] = None
+
+    async def start(self) -> None:
+        """Create the pooled HTTP client and the provider clients on top of it."""
+        if self._http is not None:
+            return
+
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT),
+        )
+
+        # Uses OPENAI_API_KEY from environment variables
+        self._openai = AsyncOpenAI(http_client=self._http, max_retries=0)
+
+        elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
+        if elevenlabs_api_key:
+            self._elevenlabs = AsyncElevenLabs(
+                api_key=elevenlabs_api_key, base_url=ELEVENLABS_BASE_URL, httpx_client=self._http
+            )
+
+        deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
+        if deepgram_api_key:
+            config = DeepgramClientOptions(url=DEEPGRAM_URL) if DEEPGRAM_URL else None
+            self._deepgram = DeepgramClient(deepgram_api_key, config)
+
+    async def close(self) -> None:
+        """Close the pooled HTTP client and drop all provider clients."""
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._openai = None
+        self._elevenlabs = None
+        self._deepgram = None
+
+    @property
+    def openai(self) -> AsyncOpenAI:
+        if self._openai is None:
+            raise RuntimeError("Upstream clients have not been started.")
+        return self._openai
+
+    @property
+    def elevenlabs(self) -> Optional[AsyncElevenLabs]:
+        """ElevenLabs client, or ``None`` when ELEVENLABS_API_KEY is not configured."""
+        return self._elevenlabs
+
+    @property
+    def deepgram(self) -> Optional[DeepgramClient]:
+        """Deepgram client, or ``None`` when DEEPGRAM_API_KEY is not configured."""
+        return self._deepgram
+
+
+# Single, reusable instance started from the FastAPI lifespan
+clients = UpstreamClients()
+
+__all__ = ["clients", "UpstreamClients"]
@@ -0,0 +1,157 @@
+"""Coach debriefs, generated once per (evaluation, language) and then served from the database.
+
+A missing debrief is generated in a background task that streams the
+Markdown as it arrives. Any number of requests can follow the same
+generation: a second tab or a reload joins it instead of starting another
+gpt-4o call. The text is stored as a ``CoachFeedback`` row once it is
+complete, and every later request is a single query.
+"""
+
+import asyncio
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from admission import model_slot
+from database import SessionLocal
+from metrics import observe_upstream, record_token_usage
+from models import CoachFeedback, Evaluation
+from resilience import stream_upstream
+
+DEBRIEF_MODEL = "gpt-4o"
+
+
+class DebriefStream:
+    """One in-flight debrief generation that several readers can follow from the start."""
+
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+        self.finished = False
+        self.error: Optional[Exception] = None
+        self.feedback_id: Optional[int] = None
+        self._changed = asyncio.Condition()
+
+    async def _publish(self, part: Optional[str] = None, finished: bool = False, error: Optional[Exception] = None) -> None:
+        async with self._changed:
+            if part:
+                self.parts.append(part)
+            if error is not None:
+                self.error = error
+            self.finished = self.finished or finished
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Yield every chunk generated so far and then the rest as it arrives.
+
+        Raises the generation error, if any, after the chunks produced before it.
+        """
+        index = 0
+        while True:
+            while index < len(self.parts):
+                yield self.parts[index]
+                index += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.parts) or self.finished)
+
+    async def text(self) -> str:
+        """Wait for the whole debrief."""
+        return "".join([part async for part in self.follow()])
+
+
+class CoachFeedbackService:
+    """Serves stored debriefs and deduplicates the generation of missing ones."""
+
+    def __init__(self) -> None:
+        self._generations: Dict[Tuple[int, str], DebriefStream] = {}
+
+    async def stored(self, session: AsyncSession, evaluation_id: int, lang: str, user_id) -> Optional[CoachFeedback]:
+        """Latest stored debrief of the user's evaluation in ``lang``."""
+        result = await session.execute(
+            select(CoachFeedback)
+            .join(Evaluation, Evaluation.id == CoachFeedback.evaluation_id)
+            .where(
+                CoachFeedback.evaluation_id == evaluation_id,
+                CoachFeedback.language_code == lang,
+                Evaluation.user_id == user_id,  # Ensure user can only access their own evaluations
+            )
+            .order_by(CoachFeedback.id.desc())
+            .limit(1)
+        )
+        return result.scalars().first()
+
+    def in_flight(self, evaluation_id: int, lang: str) -> Optional[DebriefStream]:
+        return self._generations.get((evaluation_id, lang))
+
+    def start(self, client, evaluation_id: int, lang: str, prompt: str) -> DebriefStream:
+        """Start generating a debrief, or return the generation already running for it."""
+        key = (evaluation_id, lang)
+        stream = self._generations.get(key)
+        if stream is None:
+            stream = DebriefStream()
+            self._generations[key] = stream
+            task = asyncio.create_task(self._generate(client, key, prompt, stream))
+            # Removed only after the row is stored, so a miss in both places means "not generated yet"
+            task.add_done_callback(lambda _: self._generations.pop(key, None))
+        return stream
+
+    async def _generate(self, client, key: Tuple[int, str], prompt: str, stream: DebriefStream) -> None:
+        evaluation_id, lang = key
+        try:
+            async with model_slot(DEBRIEF_MODEL), observe_upstream("openai", "debrief", DEBRIEF_MODEL):
+                completion = stream_upstream(
+                    "openai",
+                    partial(
+                        client.chat.completions.create,
+                        model=DEBRIEF_MODEL,
+                        messages=[{"role": "user", "content": prompt}],
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    ),
+                    operation="debrief",
+                )
+                async for event in completion:
+                    # Sent on the final chunk, which has no choices
+                    record_token_usage(DEBRIEF_MODEL, "debrief", getattr(event, "usage", None))
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta.content
+                    if delta:
+                        await stream._publish(delta)
+        except HTTPException as e:
+            await stream._publish(finished=True, error=e)
+            return
+        except Exception as e:
+            await stream._publish(finished=True, error=HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}"))
+            return
+
+        feedback_text = "".join(stream.parts)
+        # Save feedback to database; the readers already have the text if this fails
+        try:
+            async with SessionLocal() as session:
+                coach_feedback = CoachFeedback(
+                    evaluation_id=evaluation_id,
+                    language_code=lang,
+                    feedback_text=feedback_text,
+                    created_at=datetime.utcnow()
+                )
+                session.add(coach_feedback)
+                await session.commit()
+                stream.feedback_id = coach_feedback.id
+        except Exception as db_err:
+            print(f"Saving coach feedback failed: {str(db_err)}")
+
+        await stream._publish(finished=True)
+
+
+# Single, process-wide service
+coach_feedback_service = CoachFeedbackService()
+
+__all__ = ["coach_feedback_service", "CoachFeedbackService", "DebriefStream", "DEBRIEF_MODEL"]
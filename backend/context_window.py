@@ -0,0 +1,182 @@
+"""Token-budgeted conversation windows for the chat and coach completions.
+
+Histories are measured in tokens rather than messages. The most recent
+turns are kept verbatim as long as they fit the budget, and everything older
+is folded into the rolling summary from ``conversation_memory``. If the
+summary cannot be produced, older turns are sent verbatim instead, as far
+back as ``HISTORY_FALLBACK_TOKEN_BUDGET`` allows. Tokens are counted locally
+with ``tiktoken`` when it is installed, otherwise with a characters-per-token
+estimate.
+"""
+
+import asyncio
+import math
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from conversation_memory import conversation_memory
+
+try:
+    import tiktoken  # type: ignore
+except ImportError:  # optional dependency
+    tiktoken = None
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1200"))
+COACH_HISTORY_TOKEN_BUDGET = int(os.getenv("COACH_HISTORY_TOKEN_BUDGET", "2000"))
+# Messages always sent verbatim, even if they alone exceed the budget
+MIN_RECENT_MESSAGES = 2
+# How much verbatim history may be sent when the summary of older turns fails
+HISTORY_FALLBACK_TOKEN_BUDGET = int(os.getenv("HISTORY_FALLBACK_TOKEN_BUDGET", "8000"))
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")  # gpt-4o / gpt-4o-mini
+# Role and framing tokens the API adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Fallback estimate when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        if tiktoken is not None:
+            try:
+                _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:
+                # The encoding file may not be downloadable (e.g. offline)
+                print(f"tiktoken unavailable, estimating tokens: {str(e)}")
+        _encoder_loaded = True
+    return _encoder
+
+
+async def warm_tokenizer() -> str:
+    """Load the tokenizer at startup, off the event loop (a cold cache downloads the encoding file)."""
+    await asyncio.to_thread(_get_encoder)
+    return tokenizer_name()
+
+
+def tokenizer_name() -> str:
+    return "tiktoken" if _get_encoder() is not None else "heuristic"
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in ``text`` (exact with tiktoken, estimated otherwise)."""
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_message_tokens(text: str) -> int:
+    return count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+
+def verbatim_start(token_counts: Sequence[int], budget: int, min_recent: int = MIN_RECENT_MESSAGES) -> int:
+    """Index of the oldest message that still fits the budget, counting back from the newest."""
+    used = 0
+    start = len(token_counts)
+    while start > 0:
+        cost = token_counts[start - 1]
+        kept = len(token_counts) - start
+        if used + cost > budget and kept >= min_recent:
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+@dataclass
+class HistoryWindow:
+    messages: List[dict]  # Optional summary message followed by the verbatim turns
+    history_tokens: int  # Tokens of the full history as submitted
+    window_tokens: int  # Tokens of ``messages``
+    verbatim_messages: int
+    summarized_messages: int
+    budget: int
+    summary_failed: bool = False
+
+    def usage(self) -> dict:
+        return {
+            "tokenizer": tokenizer_name(),
+            "history_budget": self.budget,
+            "history_tokens": self.history_tokens,
+            "window_tokens": self.window_tokens,
+            "verbatim_messages": self.verbatim_messages,
+            "summarized_messages": self.summarized_messages,
+            "summary_failed": self.summary_failed,
+        }
+
+
+async def build_history_window(
+    client,
+    history: Sequence[str],
+    scope: str,
+    budget: int,
+    roles: Tuple[str, str] = ("user", "assistant"),
+    fallback_budget: int = HISTORY_FALLBACK_TOKEN_BUDGET,
+) -> HistoryWindow:
+    """Fit ``history`` (alternating ``roles``, oldest first) into ``budget`` tokens.
+
+    Turns that do not fit are summarized. If summarizing fails, as many of
+    them as fit ``fallback_budget`` are sent verbatim, like the full history
+    was before summaries; only turns beyond that are dropped.
+    """
+    token_counts = [count_message_tokens(text) for text in history]
+    start = verbatim_start(token_counts, budget)
+
+    messages: List[dict] = []
+    window_tokens = 0
+    summarized = 0
+    summary_failed = False
+    if start > 0:
+        try:
+            # Only the messages added since the previous turn are folded into the cached summary
+            conversation_summary = await conversation_memory.summarize(client, scope, list(history[:start]))
+            summary_content = f"Here is a summary of the conversation so far: {conversation_summary}"
+            messages.append({"role": "system", "content": summary_content})
+            window_tokens += count_message_tokens(summary_content)
+            summarized = start
+        except Exception as e:
+            summary_failed = True
+            start = verbatim_start(token_counts, max(fallback_budget, budget))
+            print(f"Conversation summary failed, sending {len(history) - start} of {len(history)} messages verbatim: {str(e)}")
+
+    for idx in range(start, len(history)):
+        messages.append({"role": roles[idx % 2], "content": history[idx]})
+        window_tokens += token_counts[idx]
+
+    return HistoryWindow(
+        messages=messages,
+        history_tokens=sum(token_counts),
+        window_tokens=window_tokens,
+        verbatim_messages=len(history) - start,
+        summarized_messages=summarized,
+        budget=budget,
+        summary_failed=summary_failed,
+    )
+
+
+def completion_usage(usage) -> dict:
+    """Token counts reported by the API for one completion (empty if not reported)."""
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None),
+    }
+
+
+__all__ = [
+    "CHAT_HISTORY_TOKEN_BUDGET",
+    "COACH_HISTORY_TOKEN_BUDGET",
+    "HistoryWindow",
+    "build_history_window",
+    "completion_usage",
+    "count_message_tokens",
+    "count_tokens",
+    "warm_tokenizer",
+]
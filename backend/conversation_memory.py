@@ -0,0 +1,108 @@
+"""Rolling, incrementally updated conversation summaries for the chat and coach endpoints.
+
+Summaries are cached under a hash chain of the messages they cover, so no
+conversation id is needed: on the next turn the longest already-summarized
+prefix of the history is found and only the messages after it are folded
+into the previous summary. Each turn therefore costs one small LLM call no
+matter how long the conversation is.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from functools import partial
+from typing import List, Optional, Tuple
+
+from admission import model_slot
+from metrics import observe_upstream, record_token_usage
+from resilience import call_upstream
+
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "2000"))
+SUMMARY_MODEL = "gpt-4o-mini"
+
+
+def _chain_hashes(scope: str, messages: List[str]) -> List[str]:
+    """Return one hash per prefix of ``messages``; entry ``i`` covers ``messages[:i + 1]``."""
+    hashes: List[str] = []
+    previous = hashlib.sha256(scope.encode("utf-8")).hexdigest()
+    for text in messages:
+        previous = hashlib.sha256(f"{previous}\x00{text}".encode("utf-8")).hexdigest()
+        hashes.append(previous)
+    return hashes
+
+
+class ConversationMemory:
+    """LRU cache of conversation summaries keyed by the prefix they summarize."""
+
+    def __init__(self, max_entries: int = SUMMARY_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+
+    def _get(self, key: str) -> Optional[str]:
+        summary = self._summaries.get(key)
+        if summary is not None:
+            self._summaries.move_to_end(key)
+        return summary
+
+    def _put(self, key: str, summary: str) -> None:
+        self._summaries[key] = summary
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.max_entries:
+            self._summaries.popitem(last=False)
+
+    def _longest_cached_prefix(self, hashes: List[str]) -> Tuple[int, Optional[str]]:
+        """Return ``(covered_count, summary)`` for the longest prefix with a cached summary."""
+        for index in range(len(hashes) - 1, -1, -1):
+            summary = self._get(hashes[index])
+            if summary is not None:
+                return index + 1, summary
+        return 0, None
+
+    async def summarize(self, client, scope: str, messages: List[str]) -> str:
+        """Return a summary of ``messages``, folding only the not-yet-summarized tail.
+
+        ``scope`` separates conversations that happen to share a prefix (for
+        example the same opening line in different scenarios).
+        """
+        if not messages:
+            return ""
+
+        hashes = _chain_hashes(scope, messages)
+        covered, previous_summary = self._longest_cached_prefix(hashes)
+        if covered == len(messages) and previous_summary is not None:
+            return previous_summary
+
+        new_messages = "\n".join(
+            [f"Message {covered + i + 1}: {text}" for i, text in enumerate(messages[covered:])]
+        )
+        if previous_summary is None:
+            summary_prompt = f"Please summarize the key points and emotional progression of the following medical conversation into a few concise bullet points. Transcript: {new_messages}"
+        else:
+            summary_prompt = (
+                "Here is a bullet-point summary of the key points and emotional progression of a medical conversation so far:\n"
+                f"{previous_summary}\n\n"
+                "Update the summary so that it also covers the following new messages. Keep it to a few concise bullet points. "
+                f"New messages: {new_messages}"
+            )
+
+        async with model_slot(SUMMARY_MODEL), observe_upstream("openai", "summary", SUMMARY_MODEL):
+            summary_completion = await call_upstream(
+                "openai",
+                partial(
+                    client.chat.completions.create,
+                    model=SUMMARY_MODEL,
+                    messages=[{"role": "user", "content": summary_prompt}],
+                ),
+                operation="summary",
+            )
+        record_token_usage(SUMMARY_MODEL, "summary", getattr(summary_completion, "usage", None))
+        summary = (summary_completion.choices[0].message.content or "").strip()
+
+        self._put(hashes[-1], summary)
+        return summary
+
+
+# Single, process-wide summary cache
+conversation_memory = ConversationMemory()
+
+__all__ = ["conversation_memory", "ConversationMemory"]
@@ -1,14 +1,69 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from typing import AsyncIterator
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 from dotenv import load_dotenv
 
+from metrics import instrument_engine
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set.")
 
-engine = create_engine(DATABASE_URL, echo=False, future=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base() 
\ No newline at end of file
+# Connection pool tuning (overridable via environment variables)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# asyncpg prepared statement cache; set to 0 behind PgBouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+
+def async_database_url(url: str):
+    """Point plain PostgreSQL URLs at the asyncpg driver; other URLs are used as-is."""
+    parsed = make_url(url)
+    if parsed.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed
+
+
+def _engine_options(url) -> dict:
+    if url.get_backend_name() == "sqlite":
+        # SQLite (local/testing) manages its own pool
+        return {}
+
+    options: dict = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.drivername == "postgresql+asyncpg":
+        options["connect_args"] = {"statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+if ASYNC_DATABASE_URL.drivername == "postgresql+asyncpg":
+    # SQLAlchemy's own cache of asyncpg prepared statements
+    ASYNC_DATABASE_URL = ASYNC_DATABASE_URL.update_query_dict(
+        {"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)}
+    )
+
+engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **_engine_options(ASYNC_DATABASE_URL))
+instrument_engine(engine)
+# Objects stay usable after commit, so a session can release its connection early
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+Base = declarative_base()
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency providing one async session per request."""
+    async with SessionLocal() as session:
+        yield session
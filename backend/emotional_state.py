@@ -0,0 +1,227 @@
+"""Emotional state transitions for the simulated patient.
+
+A local lexicon classifier scores the doctor's message against cue lists
+(English, Czech and Slovak), combined with a prior that favours staying in
+the current state. When it is confident enough its answer is used directly.
+Otherwise the original gpt-4o-mini ``emotional_state_prompt`` call decides.
+"""
+
+import math
+import os
+import re
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from admission import model_slot
+from metrics import observe_upstream, record_token_usage
+from resilience import call_upstream
+
+ALLOWED_STATES: Tuple[str, ...] = ("Calm", "Cooperative", "Resistant", "Anxious", "Agitated")
+
+EMOTIONAL_STATE_MODEL = "gpt-4o-mini"
+
+# Minimum classifier confidence for skipping the LLM; set above 1 to always use the LLM
+EMOTION_CLASSIFIER_THRESHOLD = float(os.getenv("EMOTION_CLASSIFIER_THRESHOLD", "0.65"))
+
+# Prior probability that the patient stays in the current state
+STAY_PROBABILITY = 0.6
+
+# Each cue group lists word stems / phrases (matched at word starts) and the
+# log-odds it adds to each state.
+CUE_GROUPS: List[Tuple[str, List[str], Dict[str, float]]] = [
+    (
+        "empathy",
+        [
+            "i understand", "i hear you", "i can see", "that must be", "it must be", "sounds like you",
+            "makes sense", "that's hard", "that is hard", "i'm sorry", "i am sorry", "sorry to hear",
+            "understandabl", "of course you",
+            "rozumím", "chápu", "je mi líto", "to musí být",
+            "rozumiem", "chápem", "je mi ľúto", "to musí byť",
+        ],
+        {"Calm": 1.2, "Cooperative": 0.8, "Agitated": -0.8, "Resistant": -0.6},
+    ),
+    (
+        "reassurance",
+        [
+            "don't worry", "do not worry", "reassur", "you're safe", "you are safe", "we will", "we'll",
+            "together", "here for you", "take care of you", "good news", "nothing serious", "very treatable",
+            "nebojte", "společně", "spolu", "postaráme",
+            "nebojte sa", "spoločne", "postaráme sa",
+        ],
+        {"Calm": 1.0, "Cooperative": 0.4, "Anxious": -0.8},
+    ),
+    (
+        "collaboration",
+        [
+            "what do you think", "option", "would you prefer", "your choice", "decide together",
+            "how do you feel", "what matters to you", "would you like", "let's", "let us", "what worries you",
+            "co si myslíte", "možnost", "co byste", "jak se cítíte",
+            "čo si myslíte", "možnost", "čo by ste", "ako sa cítite",
+        ],
+        {"Cooperative": 1.3, "Calm": 0.3, "Resistant": -0.7},
+    ),
+    (
+        "politeness",
+        ["please", "thank", "prosím", "děkuji", "děkuju", "ďakujem"],
+        {"Cooperative": 0.5, "Calm": 0.3},
+    ),
+    (
+        "dismissive",
+        [
+            "calm down", "overreact", "stupid", "ridiculous", "not my problem", "whatever", "just do",
+            "stop complaining", "nonsense", "waste of time", "you should have", "your fault", "shut up",
+            "don't be silly", "get over it",
+            "uklidněte se", "nesmysl", "hloupost", "vaše chyba", "přestaňte",
+            "upokojte sa", "nezmysel", "hlúposť", "vaša chyba", "prestaňte",
+        ],
+        {"Agitated": 1.6, "Resistant": 0.8, "Calm": -1.0, "Cooperative": -1.0},
+    ),
+    (
+        "pressure",
+        [
+            "you must", "you have to", "you need to", "no choice", "non-negotiable", "i insist",
+            "do as i say", "mandatory", "no other way",
+            "musíte", "nemáte na výběr", "trvám na",
+            "nemáte na výber", "trvám na",
+        ],
+        {"Resistant": 1.4, "Agitated": 0.3, "Cooperative": -0.6},
+    ),
+    (
+        "bad_news",
+        [
+            "cancer", "tumor", "tumour", "malignan", "biopsy", "serious", "risk", "surgery", "complication",
+            "dying", "death", "fatal", "emergency", "abnormal", "unfortunately", "spread",
+            "rakovin", "nádor", "bohužel", "rizik", "operac", "vážn", "komplikac",
+            "bohužiaľ", "operáci", "komplikáci",
+        ],
+        {"Anxious": 1.4, "Calm": -0.5},
+    ),
+    (
+        "delay",
+        [
+            "wait", "later", "no time", "busy", "next patient", "hurry", "quickly",
+            "počkejte", "nemám čas", "později", "pospěšte",
+            "počkajte", "neskôr", "ponáhľajte",
+        ],
+        {"Agitated": 1.0, "Anxious": 0.3},
+    ),
+]
+
+# A cue group counts at most this many matches per message
+MAX_MATCHES_PER_GROUP = 2
+
+
+def _compile_group(phrases: List[str]) -> Pattern[str]:
+    # Longest phrases first so overlapping stems are counted once
+    alternatives = sorted({re.escape(p) for p in phrases}, key=len, reverse=True)
+    return re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + r")", re.IGNORECASE)
+
+
+COMPILED_CUE_GROUPS: List[Tuple[str, Pattern[str], Dict[str, float]]] = [
+    (name, _compile_group(phrases), weights) for name, phrases, weights in CUE_GROUPS
+]
+
+
+@dataclass(frozen=True)
+class EmotionPrediction:
+    state: str
+    confidence: float
+    cues: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class EmotionalStateResult:
+    state: str
+    source: str  # "classifier", "llm" or "fallback"
+    confidence: Optional[float] = None
+
+
+def classify(current_state: str, message: str) -> EmotionPrediction:
+    """Predict the next emotional state from the doctor's message with the local lexicon."""
+    if current_state in ALLOWED_STATES:
+        other_probability = (1.0 - STAY_PROBABILITY) / (len(ALLOWED_STATES) - 1)
+        logits = {
+            state: math.log(STAY_PROBABILITY if state == current_state else other_probability)
+            for state in ALLOWED_STATES
+        }
+    else:
+        logits = {state: 0.0 for state in ALLOWED_STATES}
+
+    matched: List[str] = []
+    text = message.replace("’", "'")
+    for name, pattern, weights in COMPILED_CUE_GROUPS:
+        count = min(len(pattern.findall(text)), MAX_MATCHES_PER_GROUP)
+        if not count:
+            continue
+        matched.append(name)
+        for state, weight in weights.items():
+            logits[state] += weight * count
+
+    # Softmax over the five states
+    top = max(logits.values())
+    exps = {state: math.exp(value - top) for state, value in logits.items()}
+    total = sum(exps.values())
+    state = max(exps, key=exps.get)  # type: ignore[arg-type]
+    return EmotionPrediction(state=state, confidence=exps[state] / total, cues=tuple(matched))
+
+
+async def llm_emotional_state(client, current_state: str, message: str) -> Optional[str]:
+    """Ask the model for the new state; returns None if the answer is not an allowed state."""
+    emotional_state_prompt = (
+        f"The patient's current emotional state is {current_state}. "
+        f"The Doctor just said: {message}. "
+        "Based on this, what should the patient's new emotional state be? "
+        "Choose only one from this list: Calm, Cooperative, Resistant, Anxious, Agitated."
+    )
+
+    async with model_slot(EMOTIONAL_STATE_MODEL), observe_upstream("openai", "emotional_state", EMOTIONAL_STATE_MODEL):
+        emotional_state_completion = await call_upstream(
+            "openai",
+            partial(
+                client.chat.completions.create,
+                model=EMOTIONAL_STATE_MODEL,
+                messages=[{"role": "user", "content": emotional_state_prompt}],
+            ),
+            operation="emotional_state",
+        )
+    record_token_usage(EMOTIONAL_STATE_MODEL, "emotional_state", getattr(emotional_state_completion, "usage", None))
+    new_emotional_state = (emotional_state_completion.choices[0].message.content or "").strip()
+    return new_emotional_state if new_emotional_state in ALLOWED_STATES else None
+
+
+async def determine_emotional_state(
+    client,
+    current_state: str,
+    message: str,
+    threshold: float = EMOTION_CLASSIFIER_THRESHOLD,
+) -> EmotionalStateResult:
+    """Pick the patient's new state locally when confident, otherwise via the LLM.
+
+    Keeps the current state if the LLM call fails or returns an invalid label.
+    """
+    prediction = classify(current_state, message)
+    if prediction.confidence >= threshold:
+        return EmotionalStateResult(prediction.state, "classifier", prediction.confidence)
+
+    try:
+        new_emotional_state = await llm_emotional_state(client, current_state, message)
+    except Exception as e:
+        print(f"Emotional state determination failed: {str(e)}")
+        # Default to current state if call fails
+        return EmotionalStateResult(current_state, "fallback")
+
+    if new_emotional_state is None:
+        # Default to current state if AI returns invalid response
+        return EmotionalStateResult(current_state, "fallback")
+    return EmotionalStateResult(new_emotional_state, "llm")
+
+
+__all__ = [
+    "ALLOWED_STATES",
+    "EmotionPrediction",
+    "EmotionalStateResult",
+    "classify",
+    "llm_emotional_state",
+    "determine_emotional_state",
+]
@@ -0,0 +1,479 @@
+"""Transcript scoring against the master rubric and persistence of the results.
+
+Shared by the single ``/api/evaluate`` endpoint and the batch endpoint.
+
+The evaluator answers with structured output constrained to the required
+skills, and every score is validated before it is stored. Only the skills
+that come back missing or invalid are asked for again. In the optional
+sharded mode every skill is scored by its own small prompt, concurrently.
+
+Single evaluations are idempotent: a submission is identified by a hash of
+its scenario, language and normalized transcript. A resubmission by the same
+user returns the stored evaluation, and concurrent duplicates share one
+in-flight LLM call.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from datetime import datetime
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from admission import model_slot
+from database import SessionLocal
+from metrics import observe_upstream, record_token_usage
+from resilience import call_upstream
+from models import Evaluation, EvaluationScore
+from prompt_registry import prompt_registry, build_evaluation_reask_prompt, prompt_version, rubric_skills
+
+EVALUATION_MODEL = "gpt-4o"
+# Follow-up requests for skills that came back missing or invalid
+EVALUATION_MAX_REASKS = int(os.getenv("EVALUATION_MAX_REASKS", "2"))
+MIN_SCORE = 1
+MAX_SCORE = 5
+
+# "monolithic": one call scores every skill; "sharded": one concurrent call per skill
+EVALUATION_MODES = ("monolithic", "sharded")
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "monolithic")
+# Model for the per-skill calls, overridable per skill with a JSON object,
+# e.g. EVALUATION_SKILL_MODELS='{"Information Gathering": "gpt-4o-mini"}'
+EVALUATION_SHARD_MODEL = os.getenv("EVALUATION_SHARD_MODEL", EVALUATION_MODEL)
+EVALUATION_SKILL_MODELS: Dict[str, str] = json.loads(os.getenv("EVALUATION_SKILL_MODELS", "{}"))
+
+# Structured-output schemas per skill tuple
+_response_formats: Dict[Tuple[str, ...], dict] = {}
+
+
+def evaluation_response_format(skills: Tuple[str, ...]) -> dict:
+    """Structured-output schema requiring exactly ``skills``, each with reasoning, an integer 1-5 score and a justification.
+
+    ``reasoning`` comes first so the model works through the transcript
+    before it commits to a score; it is not stored.
+    """
+    response_format = _response_formats.get(skills)
+    if response_format is None:
+        skill_schema = {
+            "type": "object",
+            "properties": {
+                "reasoning": {"type": "string"},
+                "score": {"type": "integer", "enum": list(range(MIN_SCORE, MAX_SCORE + 1))},
+                "justification": {"type": "string"},
+            },
+            "required": ["reasoning", "score", "justification"],
+            "additionalProperties": False,
+        }
+        response_format = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "skill_scores",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {skill: skill_schema for skill in skills},
+                    "required": list(skills),
+                    "additionalProperties": False,
+                },
+            },
+        }
+        _response_formats[skills] = response_format
+    return response_format
+
+
+def parse_evaluation_content(ai_content: str) -> dict:
+    """Parse the evaluator output into a dict keyed by skill name; empty if it is not a JSON object."""
+    try:
+        parsed = json.loads(ai_content)
+    except json.JSONDecodeError:
+        # Without structured output the model sometimes wraps the JSON in extra
+        # text, so retry on the substring between the first '{' and the last '}'
+        first_brace = ai_content.find("{")
+        last_brace = ai_content.rfind("}")
+        if first_brace == -1 or last_brace <= first_brace:
+            return {}
+        try:
+            parsed = json.loads(ai_content[first_brace : last_brace + 1])
+        except json.JSONDecodeError:
+            return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def _as_score(value) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+def validate_scores(evaluation_data: dict, skills: Sequence[str]) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """Split the evaluator output into ``(valid scores, problems)`` for ``skills``.
+
+    Skills that were not asked for are dropped, as is each skill's
+    ``reasoning``; each problem is a short description of what was wrong,
+    used in the re-ask.
+    """
+    valid: Dict[str, dict] = {}
+    problems: Dict[str, str] = {}
+    for skill in skills:
+        entry = evaluation_data.get(skill)
+        if entry is None:
+            problems[skill] = "missing"
+            continue
+        if not isinstance(entry, dict):
+            problems[skill] = "not an object with 'score' and 'justification'"
+            continue
+        score = _as_score(entry.get("score"))
+        justification = entry.get("justification")
+        if score is None:
+            problems[skill] = "score is not an integer"
+        elif not MIN_SCORE <= score <= MAX_SCORE:
+            problems[skill] = f"score {score} is outside {MIN_SCORE}-{MAX_SCORE}"
+        elif not isinstance(justification, str) or not justification.strip():
+            problems[skill] = "justification is missing"
+        else:
+            valid[skill] = {"score": score, "justification": justification.strip()}
+    return valid, problems
+
+
+async def score_transcript(
+    client,
+    required_skills: Sequence[str],
+    transcript: str,
+    lang: Optional[str],
+    model: str = EVALUATION_MODEL,
+) -> dict:
+    """Score ``transcript`` on ``required_skills`` with the evaluator model.
+
+    The output is validated against the skills the rubric covers. Skills
+    that come back missing or invalid are asked for again, up to
+    ``EVALUATION_MAX_REASKS`` times; the skills that were already valid are
+    not re-scored.
+    """
+    skills = rubric_skills(required_skills)
+    if not skills:
+        raise HTTPException(status_code=400, detail="Scenario has no rubric skills configured.")
+
+    messages = [
+        {"role": "system", "content": prompt_registry.evaluation(required_skills, lang).text},
+        {"role": "user", "content": transcript},
+    ]
+
+    scores: Dict[str, dict] = {}
+    pending = skills
+    for attempt in range(EVALUATION_MAX_REASKS + 1):
+        try:
+            async with model_slot(model), observe_upstream("openai", "evaluation", model):
+                completion = await call_upstream(
+                    "openai",
+                    partial(
+                        client.chat.completions.create,
+                        model=model,
+                        messages=messages,  # type: ignore[arg-type]
+                        response_format=evaluation_response_format(pending),
+                    ),
+                    operation="evaluation",
+                )
+            record_token_usage(model, "evaluation", getattr(completion, "usage", None))
+            ai_content: str = completion.choices[0].message.content or ""
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
+
+        valid, problems = validate_scores(parse_evaluation_content(ai_content), pending)
+        scores.update(valid)
+        if not problems:
+            return {skill: scores[skill] for skill in skills}
+
+        pending = tuple(problems)
+        if attempt < EVALUATION_MAX_REASKS:
+            print(f"Evaluation re-ask {attempt + 1} for: {', '.join(pending)}")
+            # The follow-up keeps the transcript and the previous answer as context
+            messages = [
+                *messages,
+                {"role": "assistant", "content": ai_content},
+                {"role": "user", "content": build_evaluation_reask_prompt(problems)},
+            ]
+
+    raise HTTPException(status_code=500, detail=f"AI response had no valid scores for: {', '.join(pending)}")
+
+
+def shard_model(skill: str) -> str:
+    return EVALUATION_SKILL_MODELS.get(skill, EVALUATION_SHARD_MODEL)
+
+
+async def score_transcript_sharded(
+    client, required_skills: Sequence[str], transcript: str, lang: Optional[str]
+) -> dict:
+    """Score each rubric skill with its own small prompt, all concurrently, and merge the results.
+
+    Every shard is validated (and re-asked) on its own; the first failing
+    shard fails the evaluation.
+    """
+    skills = rubric_skills(required_skills)
+    if not skills:
+        raise HTTPException(status_code=400, detail="Scenario has no rubric skills configured.")
+
+    shards = await asyncio.gather(
+        *(score_transcript(client, [skill], transcript, lang, model=shard_model(skill)) for skill in skills)
+    )
+    scores: Dict[str, dict] = {}
+    for shard in shards:
+        scores.update(shard)
+    return scores
+
+
+def resolve_evaluation_mode(mode: Optional[str]) -> str:
+    mode = mode or EVALUATION_MODE
+    if mode not in EVALUATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown evaluation mode: {mode}")
+    return mode
+
+
+async def score_with_mode(
+    client, required_skills: Sequence[str], transcript: str, lang: Optional[str], mode: Optional[str] = None
+) -> dict:
+    """Score in ``mode`` (``EVALUATION_MODE`` if not given)."""
+    if resolve_evaluation_mode(mode) == "sharded":
+        return await score_transcript_sharded(client, required_skills, transcript, lang)
+    return await score_transcript(client, required_skills, transcript, lang)
+
+
+def evaluation_prompt_version(required_skills: Sequence[str], lang: Optional[str], mode: Optional[str] = None) -> str:
+    """Version of the evaluator prompt(s) used in ``mode``."""
+    if resolve_evaluation_mode(mode) == "sharded":
+        versions = [prompt_registry.evaluation([skill], lang).version for skill in rubric_skills(required_skills)]
+        return prompt_version("\x00".join(versions))
+    return prompt_registry.evaluation(required_skills, lang).version
+
+
+def build_evaluation_records(
+    user_id,
+    scenario_id: str,
+    transcript: str,
+    evaluation_data: Dict[str, dict],
+    content_hash: Optional[str] = None,
+) -> Evaluation:
+    """Create an (unsaved) Evaluation with its EvaluationScore children."""
+    evaluation_record = Evaluation(
+        created_at=datetime.utcnow(),
+        user_id=user_id,
+        scenario_id=scenario_id,
+        full_transcript=transcript,
+        content_hash=content_hash,
+    )
+
+    # Expecting evaluation_data to be a dict keyed by skill name
+    for skill_name, score_obj in evaluation_data.items():
+        if not isinstance(score_obj, dict):
+            continue
+        evaluation_record.scores.append(
+            EvaluationScore(
+                skill_name=skill_name,
+                score=score_obj.get("score"),
+                justification=score_obj.get("justification"),
+            )
+        )
+
+    return evaluation_record
+
+
+_WHITESPACE = re.compile(r"[ \t\f\v\u00a0]+")
+
+
+def normalize_transcript(transcript: str) -> str:
+    """Canonical form of a transcript: NFC, unified line endings, collapsed spaces, no blank lines."""
+    text = unicodedata.normalize("NFC", transcript).replace("\r\n", "\n").replace("\r", "\n")
+    lines = (_WHITESPACE.sub(" ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def evaluation_content_hash(scenario_id: str, lang: Optional[str], transcript: str) -> str:
+    """Identify a submission by its scenario, language and normalized transcript."""
+    payload = json.dumps([scenario_id, lang or "en", normalize_transcript(transcript)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def stored_scores(evaluation: Evaluation) -> Dict[str, dict]:
+    """Scores of a stored evaluation in the same shape the evaluator returns."""
+    return {
+        score.skill_name: {"score": score.score, "justification": score.justification}
+        for score in evaluation.scores
+    }
+
+
+async def find_evaluation_by_hash(db_session: AsyncSession, user_id, content_hash: str) -> Optional[Evaluation]:
+    """Return the user's stored evaluation for ``content_hash`` (with scores), if any."""
+    result = await db_session.execute(
+        select(Evaluation)
+        .options(selectinload(Evaluation.scores))
+        .where(Evaluation.user_id == user_id, Evaluation.content_hash == content_hash)
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+async def find_evaluations_by_hash(
+    db_session: AsyncSession, user_id, content_hashes: Sequence[str]
+) -> Dict[str, Evaluation]:
+    """The user's stored evaluations (with scores) for any of ``content_hashes``, keyed by hash."""
+    if not content_hashes:
+        return {}
+    result = await db_session.execute(
+        select(Evaluation)
+        .options(selectinload(Evaluation.scores))
+        .where(Evaluation.user_id == user_id, Evaluation.content_hash.in_(list(content_hashes)))
+    )
+    return {evaluation.content_hash: evaluation for evaluation in result.scalars()}
+
+
+async def save_evaluations_once(
+    db_session: AsyncSession, user_id, records: List[Evaluation]
+) -> Dict[str, Tuple[Evaluation, bool]]:
+    """Insert evaluations with distinct content hashes in one transaction, keeping rows stored meanwhile.
+
+    Returns ``content_hash -> (evaluation, replayed)``. If another request
+    stored one of the submissions first, the unique index rejects the
+    insert; the transaction is then repeated without those records and
+    their stored rows are returned with ``replayed`` set.
+    """
+    saved: Dict[str, Tuple[Evaluation, bool]] = {}
+    pending = list(records)
+    for _ in range(2):
+        if not pending:
+            break
+        try:
+            db_session.add_all(pending)
+            await db_session.commit()
+        except IntegrityError:
+            await db_session.rollback()
+            existing = await find_evaluations_by_hash(db_session, user_id, [record.content_hash for record in pending])
+            if not existing:
+                raise HTTPException(status_code=500, detail="Database error: duplicate evaluation not found.")
+            for content_hash, evaluation in existing.items():
+                saved[content_hash] = (evaluation, True)
+            pending = [record for record in pending if record.content_hash not in existing]
+            continue
+        except Exception as db_err:
+            await db_session.rollback()
+            raise HTTPException(status_code=500, detail=f"Database error: {str(db_err)}")
+        for record in pending:
+            saved[record.content_hash] = (record, False)
+        pending = []
+
+    if pending:
+        raise HTTPException(status_code=500, detail="Database error: evaluations could not be stored.")
+    return saved
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its result.
+
+    The call runs in its own task, so a caller that disconnects does not cancel
+    it for the others.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, "asyncio.Task"] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return ``(result, shared)``; ``shared`` is True if an in-flight call was joined."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), shared
+
+
+# Process-wide registry of in-flight single evaluations
+in_flight_evaluations = SingleFlight()
+
+
+async def evaluate_once(
+    client,
+    user_id,
+    scenario_id: str,
+    required_skills: Sequence[str],
+    transcript: str,
+    lang: Optional[str],
+    mode: Optional[str] = None,
+) -> Tuple[int, Dict[str, dict], bool]:
+    """Score and store a transcript unless the user already submitted it.
+
+    Returns ``(evaluation_id, scores, replayed)``. Concurrent identical
+    submissions share one evaluation and one stored row, whatever ``mode``
+    each of them asked for.
+    """
+    content_hash = evaluation_content_hash(scenario_id, lang, transcript)
+
+    async def score_and_save() -> Tuple[int, Dict[str, dict], bool]:
+        # Each flight uses its own session, independent of the callers' requests
+        async with SessionLocal() as db_session:
+            existing = await find_evaluation_by_hash(db_session, user_id, content_hash)
+            if existing is not None:
+                return existing.id, stored_scores(existing), True
+            # Release the connection while the model is working
+            await db_session.commit()
+
+            evaluation_data = await score_with_mode(client, required_skills, transcript, lang, mode)
+
+            record = build_evaluation_records(user_id, scenario_id, transcript, evaluation_data, content_hash)
+            try:
+                db_session.add(record)
+                await db_session.commit()
+            except IntegrityError:
+                # Another worker stored the same submission first
+                await db_session.rollback()
+                existing = await find_evaluation_by_hash(db_session, user_id, content_hash)
+                if existing is None:
+                    raise HTTPException(status_code=500, detail="Database error: duplicate evaluation not found.")
+                return existing.id, stored_scores(existing), True
+            except Exception as db_err:
+                await db_session.rollback()
+                raise HTTPException(status_code=500, detail=f"Database error: {str(db_err)}")
+
+            return record.id, evaluation_data, False
+
+    (evaluation_id, evaluation_data, replayed), shared = await in_flight_evaluations.run(
+        (str(user_id), content_hash), score_and_save
+    )
+    return evaluation_id, evaluation_data, replayed or shared
+
+
+__all__ = [
+    "EVALUATION_MODEL",
+    "parse_evaluation_content",
+    "validate_scores",
+    "evaluation_response_format",
+    "EVALUATION_MODES",
+    "score_transcript",
+    "score_transcript_sharded",
+    "score_with_mode",
+    "resolve_evaluation_mode",
+    "evaluation_prompt_version",
+    "build_evaluation_records",
+    "normalize_transcript",
+    "evaluation_content_hash",
+    "stored_scores",
+    "find_evaluation_by_hash",
+    "find_evaluations_by_hash",
+    "save_evaluations_once",
+    "evaluate_once",
+    "SingleFlight",
+]
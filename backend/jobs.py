@@ -0,0 +1,565 @@
+"""Background jobs for requests too slow to hold open (evaluations and coach debriefs).
+
+Endpoints that support it enqueue a job and answer 202 with its id. Each
+process runs up to ``JOB_WORKERS`` jobs at a time, and clients follow them
+at ``GET /api/jobs/{id}`` or its server-sent event stream. The queue only
+runs with ``JOB_QUEUE_ENABLED`` set.
+
+Job state is kept by the store selected with ``JOB_STORE``:
+
+- ``database`` (default): rows in the ``jobs`` table. Workers claim queued
+  rows with a conditional update, so several processes can share the
+  queue. A running job whose worker stopped sending heartbeats for
+  ``JOB_LEASE_SECONDS`` is claimed again, up to ``JOB_MAX_ATTEMPTS`` runs.
+- ``memory``: a dict in the process, for tests and local runs. Leases work
+  the same way.
+
+Handlers are registered per job kind and receive the job; what they return
+becomes the job's ``result``. An ``HTTPException`` fails the job with its
+status and detail.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, func, or_, select, update
+
+from admission import set_client
+from database import SessionLocal
+from metrics import JOB_PHASE_SECONDS, JOBS_FINISHED, set_endpoint, set_language
+from models import Job
+
+JOB_STORE = os.getenv("JOB_STORE", "database")
+# Off by default: the endpoints answer ?background=true with a 503 and no worker polls the store
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "false").lower() in ("1", "true", "yes")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# How often an idle process looks for jobs submitted by other processes, backing off to the maximum
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_POLL_INTERVAL_MAX = float(os.getenv("JOB_POLL_INTERVAL_MAX", "30"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+JOB_MAX_PENDING_PER_USER = int(os.getenv("JOB_MAX_PENDING_PER_USER", "20"))
+# Finished jobs are deleted after this long
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+# Comment lines sent on an idle event stream so proxies keep it open
+JOB_EVENTS_KEEPALIVE = float(os.getenv("JOB_EVENTS_KEEPALIVE", "15"))
+
+PENDING = ("queued", "running")
+FINISHED = ("succeeded", "failed")
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+@dataclass
+class JobRecord:
+    id: str
+    kind: str
+    user_id: str
+    status: str
+    payload: dict
+    result: Optional[dict] = None
+    error_status: Optional[int] = None
+    error_detail: Optional[str] = None
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> dict:
+        """The job as returned to its owner; the payload is left out."""
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": _isoformat(self.created_at),
+            "started_at": _isoformat(self.started_at),
+            "finished_at": _isoformat(self.finished_at),
+        }
+        if self.status == "succeeded":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = {"status_code": self.error_status, "detail": self.error_detail}
+        return data
+
+
+class JobStore(ABC):
+    """Where jobs are kept; a running job whose heartbeat is older than ``lease_seconds`` is claimed again."""
+
+    def __init__(self, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS) -> None:
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    async def create(self, kind: str, user_id: str, payload: dict) -> JobRecord:
+        """Store a new queued job."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[JobRecord]:
+        """The job, or None if it does not exist (or was pruned)."""
+
+    @abstractmethod
+    async def pending_count(self, user_id: str) -> int:
+        """Number of the user's jobs that are queued or running."""
+
+    @abstractmethod
+    async def claim(self) -> Optional[JobRecord]:
+        """Mark the oldest runnable job as running and return it.
+
+        Runnable are queued jobs and jobs whose lease expired with attempts
+        left; abandoned jobs without attempts left are failed.
+        """
+
+    @abstractmethod
+    async def heartbeat(self, job_id: str) -> None:
+        """Renew a running job's lease."""
+
+    @abstractmethod
+    async def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[HTTPException] = None) -> None:
+        """Record a job's outcome."""
+
+    @abstractmethod
+    async def requeue(self, job_id: str) -> None:
+        """Put back a job interrupted by shutdown, without counting the attempt."""
+
+    @abstractmethod
+    async def prune(self, before: datetime) -> int:
+        """Delete jobs that finished before ``before``."""
+
+
+def _new_job(kind: str, user_id: str, payload: dict) -> JobRecord:
+    return JobRecord(
+        id=uuid.uuid4().hex, kind=kind, user_id=user_id, status="queued", payload=payload, created_at=datetime.utcnow()
+    )
+
+
+# Recorded for a job whose worker died on every attempt
+_GIVEN_UP = {"status": "failed", "error_status": 500, "error_detail": "The job was interrupted too many times."}
+
+
+def _finished_fields(result: Optional[dict], error: Optional[HTTPException]) -> dict:
+    return {
+        "status": "failed" if error is not None else "succeeded",
+        "result": result,
+        "error_status": error.status_code if error is not None else None,
+        "error_detail": str(error.detail) if error is not None else None,
+        "finished_at": datetime.utcnow(),
+    }
+
+
+class MemoryJobStore(JobStore):
+    """Jobs in a dict; state is lost with the process."""
+
+    def __init__(self, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS) -> None:
+        super().__init__(lease_seconds, max_attempts)
+        self._jobs: Dict[str, JobRecord] = {}
+
+    async def create(self, kind: str, user_id: str, payload: dict) -> JobRecord:
+        job = _new_job(kind, user_id, payload)
+        self._jobs[job.id] = job
+        return job
+
+    async def get(self, job_id: str) -> Optional[JobRecord]:
+        return self._jobs.get(job_id)
+
+    async def pending_count(self, user_id: str) -> int:
+        return sum(1 for job in self._jobs.values() if job.user_id == user_id and job.status in PENDING)
+
+    async def claim(self) -> Optional[JobRecord]:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.lease_seconds)
+
+        def abandoned(job: JobRecord) -> bool:
+            return job.status == "running" and job.heartbeat_at is not None and job.heartbeat_at < stale
+
+        for job in self._jobs.values():
+            if abandoned(job) and job.attempts >= self.max_attempts:
+                for name, value in {**_GIVEN_UP, "finished_at": now}.items():
+                    setattr(job, name, value)
+
+        # Dicts keep insertion order, so the first runnable job is the oldest
+        job = next(
+            (
+                job
+                for job in self._jobs.values()
+                if job.status == "queued" or (abandoned(job) and job.attempts < self.max_attempts)
+            ),
+            None,
+        )
+        if job is not None:
+            job.status = "running"
+            job.attempts += 1
+            job.started_at = job.heartbeat_at = now
+        return job
+
+    async def heartbeat(self, job_id: str) -> None:
+        self._jobs[job_id].heartbeat_at = datetime.utcnow()
+
+    async def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[HTTPException] = None) -> None:
+        job = self._jobs[job_id]
+        for name, value in _finished_fields(result, error).items():
+            setattr(job, name, value)
+
+    async def requeue(self, job_id: str) -> None:
+        job = self._jobs[job_id]
+        job.status = "queued"
+        job.attempts -= 1
+
+    async def prune(self, before: datetime) -> int:
+        expired = [job.id for job in self._jobs.values() if job.finished and job.finished_at < before]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+
+class DatabaseJobStore(JobStore):
+    """Jobs in the ``jobs`` table, shared by every process using the database."""
+
+    @staticmethod
+    def _record(row: Job) -> JobRecord:
+        return JobRecord(
+            id=row.id,
+            kind=row.kind,
+            user_id=str(row.user_id),
+            status=row.status,
+            payload=row.payload,
+            result=row.result,
+            error_status=row.error_status,
+            error_detail=row.error_detail,
+            attempts=row.attempts,
+            created_at=row.created_at,
+            started_at=row.started_at,
+            heartbeat_at=row.heartbeat_at,
+            finished_at=row.finished_at,
+        )
+
+    async def create(self, kind: str, user_id: str, payload: dict) -> JobRecord:
+        job = _new_job(kind, user_id, payload)
+        async with SessionLocal() as session:
+            session.add(
+                Job(
+                    id=job.id,
+                    kind=kind,
+                    user_id=user_id,
+                    status=job.status,
+                    payload=payload,
+                    attempts=0,
+                    created_at=job.created_at,
+                )
+            )
+            await session.commit()
+        return job
+
+    async def get(self, job_id: str) -> Optional[JobRecord]:
+        async with SessionLocal() as session:
+            row = await session.get(Job, job_id)
+            return self._record(row) if row is not None else None
+
+    async def pending_count(self, user_id: str) -> int:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(func.count()).select_from(Job).where(Job.user_id == user_id, Job.status.in_(PENDING))
+            )
+            return int(result.scalar_one())
+
+    async def claim(self) -> Optional[JobRecord]:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.lease_seconds)
+        abandoned = and_(Job.status == "running", Job.heartbeat_at < stale)
+        async with SessionLocal() as session:
+            # Jobs whose worker died on every attempt are given up
+            await session.execute(
+                update(Job).where(abandoned, Job.attempts >= self.max_attempts).values(**_GIVEN_UP, finished_at=now)
+            )
+            runnable = or_(Job.status == "queued", and_(abandoned, Job.attempts < self.max_attempts))
+            candidates = await session.execute(
+                select(Job.id).where(runnable).order_by(Job.created_at).limit(JOB_WORKERS)
+            )
+            for job_id in candidates.scalars().all():
+                # Only one process wins the conditional update
+                claimed = await session.execute(
+                    update(Job)
+                    .where(Job.id == job_id, runnable)
+                    .values(status="running", attempts=Job.attempts + 1, started_at=now, heartbeat_at=now)
+                )
+                if claimed.rowcount == 1:
+                    await session.commit()
+                    row = await session.get(Job, job_id, populate_existing=True)
+                    return self._record(row) if row is not None else None
+            await session.commit()
+        return None
+
+    async def _update(self, job_id: str, **values) -> None:
+        async with SessionLocal() as session:
+            await session.execute(update(Job).where(Job.id == job_id).values(**values))
+            await session.commit()
+
+    async def heartbeat(self, job_id: str) -> None:
+        await self._update(job_id, heartbeat_at=datetime.utcnow())
+
+    async def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[HTTPException] = None) -> None:
+        await self._update(job_id, **_finished_fields(result, error))
+
+    async def requeue(self, job_id: str) -> None:
+        await self._update(job_id, status="queued", attempts=Job.attempts - 1)
+
+    async def prune(self, before: datetime) -> int:
+        async with SessionLocal() as session:
+            result = await session.execute(delete(Job).where(Job.status.in_(FINISHED), Job.finished_at < before))
+            await session.commit()
+            return result.rowcount or 0
+
+
+JobHandler = Callable[[JobRecord], Awaitable[dict]]
+
+
+class JobQueue:
+    """Runs registered job handlers, at most ``workers`` at a time.
+
+    A single dispatcher task claims jobs while a worker slot is free. When
+    the queue is empty it polls again after ``poll_interval`` seconds,
+    doubling the wait up to ``max_poll_interval`` while nothing turns up. A
+    job submitted in this process wakes it at once. Nothing runs unless the
+    queue is ``enabled``.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        max_poll_interval: float = JOB_POLL_INTERVAL_MAX,
+        enabled: bool = JOB_QUEUE_ENABLED,
+    ) -> None:
+        self.store = store
+        self.workers = max(workers, 1)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(max_poll_interval, poll_interval)
+        self.enabled = enabled
+        self._handlers: Dict[str, JobHandler] = {}
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Tasks running a job right now, cancelled on shutdown
+        self._running: Set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._stopping = False
+        self._wakeup: Optional[asyncio.Event] = None
+        # job id -> event set when the job changes in this process
+        self._changes: Dict[str, asyncio.Event] = {}
+        self._last_prune = 0.0
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        if not self.enabled or self._dispatcher is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self) -> None:
+        """Stop the dispatcher; interrupted jobs are put back in the queue."""
+        if self._dispatcher is None:
+            return
+        self._stopping = True
+        self._wakeup.set()  # type: ignore[union-attr]
+        # An idle dispatcher finishes its current query and exits; only running jobs are cancelled
+        running = list(self._running)
+        for task in running:
+            task.cancel()
+        dispatcher, self._dispatcher = self._dispatcher, None
+        await asyncio.gather(dispatcher, *running, return_exceptions=True)
+
+    async def submit(self, kind: str, user_id: str, payload: dict) -> JobRecord:
+        """Queue a job, or raise a 429 if the user already has too many pending."""
+        if not self.enabled:
+            raise HTTPException(status_code=503, detail="Background jobs are not enabled on this server.")
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        if await self.store.pending_count(user_id) >= JOB_MAX_PENDING_PER_USER:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many jobs in progress. Please wait for some to finish.",
+                headers={"Retry-After": "5"},
+            )
+        job = await self.store.create(kind, user_id, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get_for_user(self, job_id: str, user_id: str) -> JobRecord:
+        job = await self.store.get(job_id)
+        # Someone else's job is reported as missing, not forbidden
+        if job is None or job.user_id != str(user_id):
+            raise HTTPException(status_code=404, detail="Job not found.")
+        return job
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changes.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def follow(self, job: JobRecord) -> AsyncIterator[Optional[JobRecord]]:
+        """Yield the job whenever its status changes, until it finishes; ``None`` marks a keep-alive."""
+        yield job
+        last_status = job.status
+        last_sent = time.monotonic()
+        while not job.finished:
+            event = self._changes.setdefault(job.id, asyncio.Event())
+            try:
+                # Woken at once for jobs run here; jobs run by other processes are polled
+                await asyncio.wait_for(event.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            job = await self.store.get(job.id) or job
+            if job.status != last_status:
+                last_status = job.status
+                last_sent = time.monotonic()
+                yield job
+            elif time.monotonic() - last_sent >= JOB_EVENTS_KEEPALIVE:
+                last_sent = time.monotonic()
+                yield None
+
+    async def _idle(self, seconds: float) -> bool:
+        """Wait up to ``seconds``; True if a submit (or shutdown) cut the wait short."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)  # type: ignore[union-attr]
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _dispatch(self) -> None:
+        delay = self.poll_interval
+        failures = 0
+        while not self._stopping:
+            await self._slots.acquire()  # type: ignore[union-attr]
+            if self._stopping:
+                self._slots.release()  # type: ignore[union-attr]
+                break
+            self._wakeup.clear()  # type: ignore[union-attr]
+            try:
+                job = await self.store.claim()
+            except Exception as e:
+                self._slots.release()  # type: ignore[union-attr]
+                failures += 1
+                # E.g. the jobs table is missing; back off instead of failing every poll
+                print(f"Claiming a background job failed ({failures} in a row), retrying in {delay:.0f}s: {str(e)}")
+                await self._idle(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+                continue
+            failures = 0
+
+            if job is None:
+                self._slots.release()  # type: ignore[union-attr]
+                await self._prune()
+                woken = await self._idle(delay)
+                delay = self.poll_interval if woken else min(delay * 2, self.max_poll_interval)
+                continue
+
+            delay = self.poll_interval
+            if self._stopping:
+                self._slots.release()  # type: ignore[union-attr]
+                await self.store.requeue(job.id)
+                break
+            # A task per job, so the context it sets up does not leak into the next one
+            task = asyncio.create_task(self._run_claimed(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_claimed(self, job: JobRecord) -> None:
+        try:
+            await self._run(job)
+        except Exception as e:
+            # Recording the outcome failed; the lease expires and the job is claimed again
+            print(f"Background job {job.id} could not be completed: {str(e)}")
+        finally:
+            self._slots.release()  # type: ignore[union-attr]
+
+    async def _heartbeat(self, job_id: str) -> None:
+        interval = self.store.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.store.heartbeat(job_id)
+            except Exception as e:
+                print(f"Job heartbeat failed: {str(e)}")
+
+    async def _run(self, job: JobRecord) -> None:
+        set_endpoint(f"job:{job.kind}")
+        set_language(job.payload.get("lang"))
+        set_client(f"user:{job.user_id}")
+        self._notify(job.id)
+        if job.created_at is not None and job.attempts == 1:
+            JOB_PHASE_SECONDS.labels(job.kind, "queued").observe((job.started_at - job.created_at).total_seconds())
+
+        start = time.perf_counter()
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        result: Optional[dict] = None
+        error: Optional[HTTPException] = None
+        try:
+            handler = self._handlers.get(job.kind)
+            if handler is None:
+                raise HTTPException(status_code=500, detail=f"Unknown job kind: {job.kind}")
+            result = await handler(job)
+        except HTTPException as e:
+            error = e
+        except asyncio.CancelledError:
+            # Shutting down: leave the job for the next worker to pick up
+            await self.store.requeue(job.id)
+            raise
+        except Exception as e:
+            print(f"Background job {job.id} ({job.kind}) failed: {str(e)}")
+            error = HTTPException(status_code=500, detail=f"Job failed: {str(e)}")
+        finally:
+            heartbeat.cancel()
+
+        await self.store.finish(job.id, result=result, error=error)
+        status = "failed" if error is not None else "succeeded"
+        JOBS_FINISHED.labels(job.kind, status).inc()
+        JOB_PHASE_SECONDS.labels(job.kind, "running").observe(time.perf_counter() - start)
+        self._notify(job.id)
+
+    async def _prune(self) -> None:
+        # At most once a minute per process, from whichever worker is idle
+        if time.monotonic() - self._last_prune < 60:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            await self.store.prune(datetime.utcnow() - timedelta(hours=JOB_RETENTION_HOURS))
+        except Exception as e:
+            print(f"Pruning finished jobs failed: {str(e)}")
+
+
+def get_job_store() -> JobStore:
+    if JOB_STORE == "memory":
+        return MemoryJobStore()
+    return DatabaseJobStore()
+
+
+# Single, process-wide queue started from the FastAPI lifespan
+job_queue = JobQueue(get_job_store())
+
+__all__ = [
+    "DatabaseJobStore",
+    "JobQueue",
+    "JobRecord",
+    "JobStore",
+    "MemoryJobStore",
+    "get_job_store",
+    "job_queue",
+]
@@ -1,24 +1,92 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, Header, UploadFile, File, Query
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from functools import partial
 from typing import List, Optional
-from pydantic import BaseModel
-from openai import OpenAI  # type: ignore
+from pydantic import BaseModel, Field
 import os
 import asyncio
 from datetime import datetime
 import json
-from database import SessionLocal
-from models import Scenario, ScenarioSkill, Evaluation, EvaluationScore, CoachFeedback, ScenarioTranslation
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, selectinload
+from database import SessionLocal, get_session
+from models import Evaluation
 from supabase_client import supabase
-from coach_prompts import DEBRIEF_PROMPT, Q_AND_A_PROMPT, HINT_PROMPT
-from deepgram import DeepgramClient, PrerecordedOptions
-from elevenlabs.client import ElevenLabs
+from auth import get_current_user_id
+from admission import admit_request, model_slot, rate_limited
+from clients import clients
+from scenario_catalog import scenario_catalog, ScenarioView
+from prompt_registry import prompt_registry, CompiledPrompt, coach_language
+from coach_feedback import coach_feedback_service, DebriefStream
+from jobs import job_queue, JobRecord
+from emotional_state import determine_emotional_state
+from chat_pipeline import TurnGraph, SentenceSpeech, CHAT_TTS_BY_SENTENCE
+from evaluation import (
+    score_with_mode,
+    resolve_evaluation_mode,
+    evaluation_prompt_version,
+    build_evaluation_records,
+    save_evaluations_once,
+    evaluation_content_hash,
+    find_evaluations_by_hash,
+    stored_scores,
+    evaluate_once,
+)
+from tts import synthesize_speech, stream_speech, media_type_for, DEFAULT_OUTPUT_FORMAT
+from context_window import (
+    HistoryWindow,
+    build_history_window,
+    completion_usage,
+    count_message_tokens,
+    warm_tokenizer,
+    CHAT_HISTORY_TOKEN_BUDGET,
+    COACH_HISTORY_TOKEN_BUDGET,
+)
+from deepgram import PrerecordedOptions
+from speech_to_text import get_stt_backend
+from uploads import BodySizeLimitMiddleware, TRANSCRIBE_MAX_UPLOAD_BYTES, check_audio_upload, iter_upload
+from metrics import (
+    MetricsMiddleware,
+    EMOTIONAL_STATE_DECISIONS,
+    metrics_response,
+    observe_upstream,
+    record_token_usage,
+    set_language,
+)
+from resilience import call_upstream, stream_upstream, upstream_available
 import base64
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared upstream clients and start the job queue (if enabled) on startup; stop both on shutdown."""
+    await clients.start()
+    await scenario_catalog.refresh()
+    prompt_registry.warm()
+    await warm_tokenizer()
+    await job_queue.start()
+    try:
+        yield
+    finally:
+        # Jobs first, so interrupted ones are put back while the clients still exist
+        await job_queue.close()
+        await clients.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Batch evaluation limits
+EVALUATION_BATCH_CONCURRENCY = int(os.getenv("EVALUATION_BATCH_CONCURRENCY", "8"))
+EVALUATION_BATCH_MAX_ITEMS = int(os.getenv("EVALUATION_BATCH_MAX_ITEMS", "500"))
+
+# Send a duplicate persona completion when the first has produced no token after this many seconds (0 = never)
+PERSONA_HEDGE_AFTER = float(os.getenv("PERSONA_HEDGE_AFTER", "0"))
 
 # Configure CORS for all origins, methods, and headers (MVP settings)
 app.add_middleware(
@@ -26,8 +94,15 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "X-Prompt-Version", "X-Evaluation-Replayed", "X-Feedback-Cached", "Retry-After", "Location"],
 )
 
+# Cap audio upload bodies while they are received
+app.add_middleware(BodySizeLimitMiddleware, limits={"/api/transcribe": TRANSCRIBE_MAX_UPLOAD_BYTES})
+
+# Outermost, so rejected and failed requests are timed as well
+app.add_middleware(MetricsMiddleware)
+
 
 class ChatMessage(BaseModel):
     scenario_id: str
@@ -41,6 +116,11 @@ class EvaluationRequest(BaseModel):
     scenario_id: str
     transcript: str
     lang: Optional[str] = "en"  # Add language parameter
+    mode: Optional[str] = None  # "monolithic" or "sharded"; defaults to EVALUATION_MODE
+
+
+class BatchEvaluationRequest(BaseModel):
+    items: List[EvaluationRequest] = Field(..., min_length=1, max_length=EVALUATION_BATCH_MAX_ITEMS)
 
 
 # Shared credentials schema for auth endpoints
@@ -94,269 +174,107 @@ async def read_root():
     return {"status": "ok"}
 
 
-@app.get("/api/scenarios")
-async def list_scenarios(lang: str = Query("en", description="Language code (e.g., 'cs', 'sk', 'en')")):
-    """Return a list of all scenarios with basic metadata."""
-    session = SessionLocal()
-    try:
-        # Get scenarios with their translations for the requested language
-        scenarios_with_translations = (
-            session.query(Scenario, ScenarioTranslation)
-            .join(ScenarioTranslation, Scenario.id == ScenarioTranslation.scenario_id)
-            .filter(ScenarioTranslation.language_code == lang)
-            .all()
-        )
-        
-        # If no translations found for the requested language, fall back to English
-        if not scenarios_with_translations and lang != "en":
-            scenarios_with_translations = (
-                session.query(Scenario, ScenarioTranslation)
-                .join(ScenarioTranslation, Scenario.id == ScenarioTranslation.scenario_id)
-                .filter(ScenarioTranslation.language_code == "en")
-                .all()
-            )
-        
-        result = []
-        for scenario, translation in scenarios_with_translations:
-            result.append({
-                "id": scenario.id,
-                "title": translation.title,
-                "learning_path": translation.learning_path,
-                "difficulty": scenario.difficulty,
-                "description": translation.goal,  # Using goal as description
-            })
-        
-        return result
-    finally:
-        session.close()
+async def get_scenario_view(scenario_id: str, lang: Optional[str]) -> ScenarioView:
+    """Look up a scenario in the catalog, raising 404 if it or its translation is missing."""
+    await scenario_catalog.ensure_loaded()
 
+    if not scenario_catalog.exists(scenario_id):
+        raise HTTPException(status_code=404, detail="Scenario not found.")
 
-@app.get("/api/scenarios/{scenario_id}")
-async def get_scenario(scenario_id: str, lang: str = Query("en", description="Language code (e.g., 'cs', 'sk', 'en')")):
-    """Return detailed information for a single scenario, including required skills."""
-    session = SessionLocal()
-    try:
-        # Get the base scenario
-        scenario = session.query(Scenario).filter(Scenario.id == scenario_id).first()
-        if scenario is None:
-            raise HTTPException(status_code=404, detail="Scenario not found.")
+    # The catalog already falls back to English when the language is missing
+    scenario = scenario_catalog.get(scenario_id, lang)
+    if scenario is None:
+        raise HTTPException(status_code=404, detail="Scenario translation not found.")
 
-        # Get the translation for the requested language
-        translation = session.query(ScenarioTranslation).filter(
-            ScenarioTranslation.scenario_id == scenario_id,
-            ScenarioTranslation.language_code == lang
-        ).first()
-        
-        # If no translation found for the requested language, fall back to English
-        if not translation and lang != "en":
-            translation = session.query(ScenarioTranslation).filter(
-                ScenarioTranslation.scenario_id == scenario_id,
-                ScenarioTranslation.language_code == "en"
-            ).first()
-        
-        if not translation:
-            raise HTTPException(status_code=404, detail="Scenario translation not found.")
+    return scenario
 
-        # Get skills
-        skills = [skill.skill_name for skill in scenario.skills]
 
-        # Get appropriate voice_id based on language
-        voice_id = scenario.voice_id_en  # Default
-        if lang == "cs":
-            voice_id = scenario.voice_id_cs or scenario.voice_id_en
-        elif lang == "sk":
-            voice_id = scenario.voice_id_sk or scenario.voice_id_en
+@app.get("/api/scenarios")
+async def list_scenarios(lang: str = Query("en", description="Language code (e.g., 'cs', 'sk', 'en')")):
+    """Return a list of all scenarios with basic metadata."""
+    await scenario_catalog.ensure_loaded()
 
-        return {
+    # Falls back to the English list if nothing is translated into the requested language
+    result = []
+    for scenario in scenario_catalog.list(lang):
+        result.append({
             "id": scenario.id,
-            "title": translation.title,
-            "learning_path": translation.learning_path,
+            "title": scenario.title,
+            "learning_path": scenario.learning_path,
             "difficulty": scenario.difficulty,
-            "goal": translation.goal,
-            "persona_prompt": translation.persona_prompt,
-            "opening_line": translation.opening_line,
-            "voice_id": voice_id,
-            "message_limit": scenario.message_limit,
-            "initial_emotional_state": scenario.initial_emotional_state,
-            "skills": skills,
-        }
-    finally:
-        session.close()
+            "description": scenario.goal,  # Using goal as description
+        })
 
+    return result
 
-@app.post("/api/chat")
-async def chat_endpoint(chat: ChatMessage):
-    """Generate a chat response using the OpenAI GPT model with emotional state machine."""
-    # Fetch scenario persona prompt from DB
-    session = SessionLocal()
-    try:
-        scenario = session.query(Scenario).filter(Scenario.id == chat.scenario_id).first()
-        if scenario is None:
-            raise HTTPException(status_code=404, detail="Scenario not found.")
 
-        # Get the translation for the requested language
-        translation = session.query(ScenarioTranslation).filter(
-            ScenarioTranslation.scenario_id == chat.scenario_id,
-            ScenarioTranslation.language_code == chat.lang
-        ).first()
-        
-        # If no translation found for the requested language, fall back to English
-        if not translation and chat.lang != "en":
-            translation = session.query(ScenarioTranslation).filter(
-                ScenarioTranslation.scenario_id == chat.scenario_id,
-                ScenarioTranslation.language_code == "en"
-            ).first()
-        
-        if not translation:
-            raise HTTPException(status_code=404, detail="Scenario translation not found.")
+@app.get("/api/scenarios/{scenario_id}")
+async def get_scenario(scenario_id: str, lang: str = Query("en", description="Language code (e.g., 'cs', 'sk', 'en')")):
+    """Return detailed information for a single scenario, including required skills."""
+    scenario = await get_scenario_view(scenario_id, lang)
+
+    return {
+        "id": scenario.id,
+        "title": scenario.title,
+        "learning_path": scenario.learning_path,
+        "difficulty": scenario.difficulty,
+        "goal": scenario.goal,
+        "persona_prompt": scenario.persona_prompt,
+        "opening_line": scenario.opening_line,
+        "voice_id": scenario.voice_id,
+        "message_limit": scenario.message_limit,
+        "initial_emotional_state": scenario.initial_emotional_state,
+        "skills": list(scenario.skills),
+    }
 
-        base_persona_prompt = translation.persona_prompt
 
-        # Get appropriate voice_id based on language
-        voice_id = scenario.voice_id_en  # Default
-        if chat.lang == "cs":
-            voice_id = scenario.voice_id_cs or scenario.voice_id_en
-        elif chat.lang == "sk":
-            voice_id = scenario.voice_id_sk or scenario.voice_id_en
-    finally:
-        session.close()
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Request, upstream-call and database metrics in Prometheus text format."""
+    return metrics_response()
 
-    client = OpenAI()  # Uses OPENAI_API_KEY from environment variables
 
-    # Step 1: Determine new emotional state using preliminary AI call
-    emotional_state_prompt = (
-        f"The patient's current emotional state is {chat.current_emotional_state}. "
-        f"The Doctor just said: {chat.message}. "
-        "Based on this, what should the patient's new emotional state be? "
-        "Choose only one from this list: Calm, Cooperative, Resistant, Anxious, Agitated."
-    )
+@app.get("/api/prompts/versions")
+async def prompt_versions_endpoint():
+    """Return the version hashes of the prompt templates and the scenario catalog they were built from."""
+    await scenario_catalog.ensure_loaded()
+    return prompt_registry.versions()
 
-    try:
-        emotional_state_completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": emotional_state_prompt}]
-        )
-        new_emotional_state = (emotional_state_completion.choices[0].message.content or "").strip()
-        
-        # Validate the emotional state is one of the allowed values
-        allowed_states = ["Calm", "Cooperative", "Resistant", "Anxious", "Agitated"]
-        if new_emotional_state not in allowed_states:
-            # Default to current state if AI returns invalid response
-            new_emotional_state = chat.current_emotional_state
-            
-    except Exception as e:
-        print(f"Emotional state determination failed: {str(e)}")
-        # Default to current state if call fails
-        new_emotional_state = chat.current_emotional_state
-
-        # Step 2: Build enhanced persona prompt with emotional state
-    emotional_state_guide = {
-        "Calm": "You are relaxed and composed. Speak in a measured tone, think before responding, show willingness to listen and consider suggestions. You're not rushed and can engage in thoughtful conversation.",
-        "Cooperative": "You are helpful and agreeable. You want to work with the doctor, readily provide information when asked, show appreciation for their help, and are open to following their recommendations.",
-        "Resistant": "You are defensive and argumentative. Push back against suggestions, question the doctor's recommendations, become stubborn about your position, and show skepticism about medical advice.",
-        "Anxious": "You are worried and nervous. Speak with urgency, ask many questions, seek constant reassurance, express fears about your condition, and may interrupt or speak quickly.",
-        "Agitated": "You are frustrated and impatient. Show irritation in your responses, become short or snappy, express anger about waiting or not being heard, and display visible frustration with the situation."
-    }
-    
-    emotional_behavior = emotional_state_guide.get(new_emotional_state, "Respond naturally based on the situation.")
-    
-    # Add language instruction based on requested language
-    language_instructions = {
-        "cs": "Your entire response MUST be in the Czech language.",
-        "es": "Your entire response MUST be in the Spanish language.",
-        "de": "Your entire response MUST be in the German language.",
-        "fr": "Your entire response MUST be in the French language.",
-        "en": ""  # No instruction needed for English
-    }
-    
-    language_instruction = language_instructions.get(chat.lang or "en", "")
-    language_prefix = f"{language_instruction}\n\n" if language_instruction else ""
-    
-    persona_prompt = (
-        f"{language_prefix}"
-        "You are an advanced role-playing AI acting as a patient in a medical training simulation. Your performance must be realistic and dynamic. Follow these rules strictly:\n"
-        "1. **Embody the Character:** You must strictly adhere to the character's core personality, background, and emotional state as described in the profile below.\n"
-        "2. **Listen and React:** This is an interactive conversation. You must listen carefully to what the 'Doctor' says and have your character react in a logical and human-like way. If the Doctor is empathetic and makes concessions, your character should become calmer or more cooperative. If the Doctor is dismissive or rude, your character might become more upset or withdrawn. Your responses must not be repetitive; they must evolve based on the Doctor's input.\n"
-        "3. **Maintain the Goal:** The character has an underlying goal or fear. You should guide the conversation from the character's perspective, but you must be open to being persuaded or having your concerns addressed by a skilled Doctor.\n"
-        "4. **Stay in Character:** NEVER break character. Do not provide assistance, identify as an AI, or act as a therapist. Respond only and always as the character would.\n\n"
-        f"**CRITICAL EMOTIONAL STATE INSTRUCTION:** Your current emotional state is {new_emotional_state}. {emotional_behavior} This emotional state should be clearly evident in your tone, word choice, and behavior. Make sure every response reflects this emotional state authentically.\n\n"
-        f"Here is the character you must play:\n{base_persona_prompt}"
-    )
 
-    # Step 3: Build the message list for the main chat completion
-    messages = [{"role": "system", "content": persona_prompt}]
+async def build_history_messages(client, chat: ChatMessage) -> HistoryWindow:
+    """Fit the conversation into the history token budget (rolling summary plus recent turns).
 
-    # Short-term memory system: summarize if history exceeds threshold
-    if len(chat.history) > 8:
-        # Create summary of conversation history
-        full_history = "\n".join([f"Message {i+1}: {text}" for i, text in enumerate(chat.history)])
-        summary_prompt = f"Please summarize the key points and emotional progression of the following medical conversation into a few concise bullet points. Transcript: {full_history}"
-        
-        try:
-            summary_completion = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": summary_prompt}]
-            )
-            conversation_summary = (summary_completion.choices[0].message.content or "").strip()
-            
-            # Add summary as system message instead of full history
-            messages.append({"role": "system", "content": f"Here is a summary of the conversation so far: {conversation_summary}"})
-            
-        except Exception as e:
-            print(f"Conversation summary failed: {str(e)}")
-            # Fallback to full history if summary fails
-            for idx, text in enumerate(chat.history):
-                role = "user" if idx % 2 == 0 else "assistant"
-                messages.append({"role": role, "content": text})
-    else:
-        # Use full history for shorter conversations
-        for idx, text in enumerate(chat.history):
-            role = "user" if idx % 2 == 0 else "assistant"
-            messages.append({"role": role, "content": text})
+    The current doctor message is appended last. Independent of the emotional
+    state, so it can run alongside that decision.
+    """
+    window = await build_history_window(
+        client,
+        chat.history,
+        f"{chat.scenario_id}:{chat.lang}",
+        CHAT_HISTORY_TOKEN_BUDGET,
+    )
 
     # Add the current user message
-    messages.append({"role": "user", "content": chat.message})
+    window.messages.append({"role": "user", "content": chat.message})
+    window.window_tokens += count_message_tokens(chat.message)
+    return window
 
-    # Step 4: Call the main role-playing model
-    try:
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,  # type: ignore[arg-type]
-        )  # type: ignore[arg-type]
-        ai_response = completion.choices[0].message.content
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
 
-    # Step 5: Generate audio using ElevenLabs
+async def synthesize_reply_audio(ai_response: Optional[str], voice_id: Optional[str]) -> Optional[str]:
+    """Convert the patient's reply to base64 MP3 audio, returning None if TTS is unavailable or fails."""
     audio_response_base64 = None
+    elevenlabs_client = clients.elevenlabs
     try:
-        # Check if ELEVENLABS_API_KEY is available
-        elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
-        if not elevenlabs_api_key:
+        # Check if ElevenLabs is configured
+        if elevenlabs_client is None:
             print("ElevenLabs API key not configured")
+        elif not upstream_available("elevenlabs"):
+            print("ElevenLabs circuit breaker is open, replying without audio")
         elif not ai_response or not ai_response.strip():
             print("AI response text is empty")
         else:
-            # Initialize ElevenLabs client with API key
-            elevenlabs_client = ElevenLabs(api_key=elevenlabs_api_key)
-            
-            # Use the language-specific voice_id determined earlier
-            audio = elevenlabs_client.text_to_speech.convert(
-                text=ai_response.strip(),
-                voice_id=voice_id,
-                model_id="eleven_multilingual_v2",
-                output_format="mp3_44100_128"
-            )
-            
-            # More robust audio processing
-            audio_bytes = b""
-            chunk_count = 0
-            for chunk in audio:
-                if chunk:
-                    audio_bytes += chunk
-                    chunk_count += 1
-            
-            print(f"Processed {chunk_count} audio chunks, total bytes: {len(audio_bytes)}")
+            # Use the language-specific voice_id determined earlier (served from cache when possible)
+            audio_bytes = await synthesize_speech(elevenlabs_client, ai_response.strip(), voice_id)
             
             if not audio_bytes:
                 print("Warning: No audio data received from ElevenLabs")
@@ -366,191 +284,287 @@ async def chat_endpoint(chat: ChatMessage):
     except Exception as e:
         # Log the error but don't fail the entire request
         print(f"Text-to-speech conversion failed: {str(e)}")
-        print(f"API key present: {bool(elevenlabs_api_key)}")
+        print(f"API key present: {elevenlabs_client is not None}")
         if ai_response:
             print(f"Text length: {len(ai_response.strip())}")
         # Continue without audio if TTS fails
 
-    return {
-        "text_response": ai_response,
-        "audio_response_base64": audio_response_base64,
-        "new_emotional_state": new_emotional_state
-    }
+    return audio_response_base64
 
 
-@app.post("/api/evaluate")
-async def evaluate_endpoint(
-    request: EvaluationRequest,
-    authorization: str = Header(..., description="Bearer access token"),
-):
-    """Evaluate a transcript using the AI and save results to the database.
+def start_chat_turn(client, chat: ChatMessage, scenario: ScenarioView) -> TurnGraph:
+    """Schedule the stages that precede the persona completion.
 
-    Requires a valid Supabase JWT access token in the `Authorization` header.
+    ``emotional_state`` and ``history`` run concurrently; ``messages`` joins the
+    persona prompt for the new state with the history for the role-play model.
     """
+    graph = TurnGraph()
 
-    # ---------------------------
-    # Validate JWT with Supabase
-    # ---------------------------
+    async def emotional_state():
+        # Local classifier, LLM only when unsure
+        result = await determine_emotional_state(client, chat.current_emotional_state, chat.message)
+        EMOTIONAL_STATE_DECISIONS.labels(result.source).inc()
+        return result.state
+
+    async def history():
+        return await build_history_messages(client, chat)
+
+    async def persona(new_emotional_state: str):
+        # Precompiled per (scenario, language, emotional state)
+        return prompt_registry.persona(scenario, chat.lang, new_emotional_state)
 
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing.")
+    async def messages(persona_prompt: CompiledPrompt, history: HistoryWindow):
+        return [{"role": "system", "content": persona_prompt.text}, *history.messages]
 
-    if not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Authorization header must be in the format 'Bearer <token>'.")
+    graph.add("emotional_state", emotional_state)
+    graph.add("history", history)
+    graph.add("persona", persona, "emotional_state")
+    graph.add("messages", messages, "persona", "history")
+    return graph
 
-    jwt_token = authorization.split(" ", 1)[1]
 
+def start_reply_speech(voice_id: Optional[str], graph: TurnGraph) -> Optional[SentenceSpeech]:
+    """Sentence-level TTS for the reply, or None to synthesize the full reply afterwards."""
+    if not CHAT_TTS_BY_SENTENCE or clients.elevenlabs is None or not upstream_available("elevenlabs"):
+        return None
+    return SentenceSpeech(clients.elevenlabs, voice_id, graph)
+
+
+async def stream_persona_reply(
+    client, messages: list, graph: TurnGraph, speech: Optional[SentenceSpeech], usage: Optional[dict] = None
+):
+    """Yield the role-play reply as text deltas, handing each one to ``speech`` as well.
+
+    The API's token counts for the completion are stored in ``usage``. With
+    ``PERSONA_HEDGE_AFTER`` set, a slow first token triggers a duplicate request.
+    """
+    start = graph.now()
+    first_token = None
     try:
-        auth_res = supabase.auth.get_user(jwt_token)
+        async with model_slot("gpt-4o-mini"), observe_upstream("openai", "persona", "gpt-4o-mini"):
+            stream = stream_upstream(
+                "openai",
+                partial(
+                    client.chat.completions.create,
+                    model="gpt-4o-mini",
+                    messages=messages,  # type: ignore[arg-type]
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                operation="persona",
+                hedge_after=PERSONA_HEDGE_AFTER or None,
+            )
+            async for event in stream:
+                # Sent on the final chunk, which has no choices
+                if getattr(event, "usage", None) is not None:
+                    record_token_usage("gpt-4o-mini", "persona", event.usage)
+                    if usage is not None:
+                        usage.update(completion_usage(event.usage))
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    if first_token is None:
+                        first_token = graph.now()
+                        graph.record("completion_first_token", start, first_token)
+                    if speech is not None:
+                        speech.feed(delta)
+                    yield delta
+    finally:
+        graph.record("completion", start)
 
-        err = getattr(auth_res, "error", None)
-        if err is not None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token.")
 
-        user_obj = getattr(auth_res, "user", None)
-        if user_obj is None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token.")
+async def finish_reply_audio(
+    speech: Optional[SentenceSpeech], ai_response: str, voice_id: Optional[str], graph: TurnGraph
+) -> Optional[str]:
+    """Base64 MP3 for the whole reply, or None if TTS is unavailable or fails."""
+    if speech is None:
+        start = graph.now()
+        audio_response_base64 = await synthesize_reply_audio(ai_response, voice_id)
+        graph.record("tts", start)
+        return audio_response_base64
 
-        user_id = getattr(user_obj, "id", None)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Token validation failed: {str(e)}")
+    audio_bytes = await speech.finish()
+    return base64.b64encode(audio_bytes).decode('utf-8') if audio_bytes else None
 
-    # ---------------------------
-    # Fetch scenario and its required skills
-    # ---------------------------
 
-    db_session = SessionLocal()
+@app.post("/api/chat", dependencies=[Depends(rate_limited())])
+async def chat_endpoint(chat: ChatMessage, response: Response):
+    """Generate a chat response using the OpenAI GPT model with emotional state machine.
+
+    Per-stage timings are returned under ``timings`` and in the ``Server-Timing`` header;
+    ``X-Prompt-Version`` identifies the persona prompt that was used. ``token_usage``
+    reports the history window and the completion's token counts.
+    """
+    set_language(chat.lang)
+    # Fetch scenario persona prompt and language-specific voice from the catalog
+    scenario = await get_scenario_view(chat.scenario_id, chat.lang)
+    client = clients.openai
+
+    # Steps 1-3: emotional state and conversation history run concurrently, then the persona prompt is built
+    graph = start_chat_turn(client, chat, scenario)
+    speech = None
     try:
-        scenario = db_session.query(Scenario).filter(Scenario.id == request.scenario_id).first()
-        if scenario is None:
-            raise HTTPException(status_code=404, detail="Scenario not found.")
+        new_emotional_state = await graph.result("emotional_state")
+        messages = await graph.result("messages")
 
-        required_skills = [skill.skill_name for skill in scenario.skills]
+        # Steps 4 & 5: stream the role-play reply; finished sentences are voiced while the rest is generated
+        speech = start_reply_speech(scenario.voice_id, graph)
+        response_parts: list[str] = []
+        usage: dict = {}
+        try:
+            async for delta in stream_persona_reply(client, messages, graph, speech, usage):
+                response_parts.append(delta)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
+
+        ai_response = "".join(response_parts)
+        audio_response_base64 = await finish_reply_audio(speech, ai_response, scenario.voice_id, graph)
     finally:
-        db_session.close()
+        graph.cancel()
+        if speech is not None:
+            speech.cancel()
 
-    if not required_skills:
-        raise HTTPException(status_code=400, detail="Scenario has no skills configured.")
+    response.headers["Server-Timing"] = graph.server_timing()
+    response.headers["X-Prompt-Version"] = (await graph.result("persona")).version
+    history = await graph.result("history")
+    return {
+        "text_response": ai_response,
+        "audio_response_base64": audio_response_base64,
+        "new_emotional_state": new_emotional_state,
+        "timings": graph.summary(),
+        "token_usage": {**history.usage(), **usage},
+    }
 
-    # ---------------------------
-    # Build dynamic rubric from MASTER_RUBRIC
-    # ---------------------------
 
-    from rubric import MASTER_RUBRIC  # local import to avoid circular issues
-
-    rubric_sections: list[str] = []
-    for skill_name in required_skills:
-        skill_rubric = MASTER_RUBRIC.get(skill_name)
-        if skill_rubric is None:
-            continue  # skip unknown
-        rubric_sections.append(f"{skill_name}:")
-        for level, description in skill_rubric.items():
-            rubric_sections.append(f"  Level {level}: {description}")
-
-    rubric_text = "\n".join(rubric_sections)
-
-    # Add language instruction to the prompt
-    language_instruction = ""
-    if request.lang == "cs":
-        language_instruction = "Your justification text must be written in Czech language. "
-    elif request.lang == "sk":
-        language_instruction = "Your justification text must be written in Slovak language. "
-    else:
-        language_instruction = "Your justification text must be written in English language. "
-    
-    # Build evaluator prompt
-    master_prompt = (
-        "You are an automated evaluation engine. Your entire response must be a single, valid JSON object and nothing else. "
-        f"{language_instruction}"
-        "First, think step-by-step through the transcript and for each listed skill, write down your reasoning for the score. "
-        "Your task is to score the performance of the 'Doctor' only. Do not score the 'Patient'. "
-        "Your scoring and justification must be based exclusively on the lines beginning with 'Doctor:'. Any other lines should be ignored for scoring purposes. "
-        "After your internal analysis, format your final output as a JSON object where each key is the skill name and its value is another JSON object with the exact keys 'score' (integer 1-5) and 'justification' (string).\n\n"
-        f"Here is the rubric you must use:\n{rubric_text}\n\n"
-        "EXAMPLE of a valid response format for two skills:\n"
-        '{"Empathy & Rapport Building": {"score": 4, "justification": "Example justification."}, "Information Gathering": {"score": 3, "justification": "Example justification."}}\n\n'
-        "Now, analyze the following transcript and provide your complete JSON response:\n"
-    )
+def ndjson_event(event_type: str, **payload) -> str:
+    """Serialize one streaming event as a newline-delimited JSON line."""
+    return json.dumps({"type": event_type, **payload}) + "\n"
 
-    transcript_text = request.transcript
 
-    messages = [
-        {"role": "system", "content": master_prompt},
-        {"role": "user", "content": transcript_text},
-    ]
+@app.post("/api/chat/stream", dependencies=[Depends(rate_limited())])
+async def chat_stream_endpoint(chat: ChatMessage):
+    """Stream a chat turn as NDJSON events.
+
+    Events are emitted in order: ``emotional_state``, one ``text_delta`` per
+    reply token chunk, ``text_done`` with the full reply, ``audio`` with the
+    base64 MP3 (or null) and finally ``done`` carrying the per-stage
+    ``timings``, the persona ``prompt_version`` and the ``token_usage``. Upstream failures after the stream has started are reported
+    as an ``error`` event.
+    """
+    set_language(chat.lang)
+    # Resolve the scenario before streaming so a missing scenario is still a 404
+    scenario = await get_scenario_view(chat.scenario_id, chat.lang)
+    client = clients.openai
+
+    async def event_stream():
+        # The history summary keeps running while the emotional state is sent
+        graph = start_chat_turn(client, chat, scenario)
+        speech = None
+        try:
+            new_emotional_state = await graph.result("emotional_state")
+            yield ndjson_event("emotional_state", new_emotional_state=new_emotional_state)
+
+            messages = await graph.result("messages")
+            speech = start_reply_speech(scenario.voice_id, graph)
+
+            response_parts: list[str] = []
+            usage: dict = {}
+            try:
+                async for delta in stream_persona_reply(client, messages, graph, speech, usage):
+                    response_parts.append(delta)
+                    yield ndjson_event("text_delta", delta=delta)
+            except HTTPException as e:
+                yield ndjson_event("error", detail=e.detail)
+                return
+            except Exception as e:
+                yield ndjson_event("error", detail=f"OpenAI API error: {str(e)}")
+                return
+
+            ai_response = "".join(response_parts)
+            yield ndjson_event("text_done", text_response=ai_response)
+
+            audio_response_base64 = await finish_reply_audio(speech, ai_response, scenario.voice_id, graph)
+            yield ndjson_event("audio", audio_response_base64=audio_response_base64)
+            persona_prompt = await graph.result("persona")
+            history = await graph.result("history")
+            yield ndjson_event(
+                "done",
+                timings=graph.summary(),
+                prompt_version=persona_prompt.version,
+                token_usage={**history.usage(), **usage},
+            )
+        finally:
+            # Also reached when the client disconnects mid-stream
+            graph.cancel()
+            if speech is not None:
+                speech.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    # Instantiate OpenAI client
-    client = OpenAI()
 
-    try:
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,  # type: ignore[arg-type]
-        )  # type: ignore[arg-type]
-        ai_content: str = completion.choices[0].message.content or ""
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
+@app.post("/api/evaluate", dependencies=[Depends(rate_limited())])
+async def evaluate_endpoint(
+    request: EvaluationRequest,
+    response: Response,
+    background: bool = Query(False, description="Queue the evaluation and answer 202 with a job id"),
+    user_id: str = Depends(get_current_user_id),
+):
+    """Evaluate a transcript using the AI and save results to the database.
+
+    Requires a valid Supabase JWT access token in the `Authorization` header.
+    Resubmitting the same transcript for the same scenario and language
+    returns the stored evaluation (``X-Evaluation-Replayed: true``, without
+    ``X-Prompt-Version``) instead of scoring it again. ``mode`` selects one call for all skills (``monolithic``)
+    or one concurrent call per skill (``sharded``). With ``background=true``
+    (and ``JOB_QUEUE_ENABLED``) the evaluation runs as a job (see
+    ``/api/jobs/{job_id}``) whose result is this endpoint's usual response body.
+    """
+    set_language(request.lang)
 
     # ---------------------------
-    # Robust JSON parsing helper
+    # Fetch scenario and its required skills
     # ---------------------------
-    # The AI sometimes returns extra text before/after the JSON. We attempt to
-    # isolate the first JSON object by trimming to the substring between the
-    # first '{' and the last '}' characters.
 
-    cleaned_content = ai_content
-    first_brace = ai_content.find("{")
-    last_brace = ai_content.rfind("}")
-    if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-        cleaned_content = ai_content[first_brace : last_brace + 1]
+    await scenario_catalog.ensure_loaded()
+    if not scenario_catalog.exists(request.scenario_id):
+        raise HTTPException(status_code=404, detail="Scenario not found.")
 
-    try:
-        evaluation_data = json.loads(cleaned_content)
-    except json.JSONDecodeError:
-        # Fallback: attempt to parse the raw content if cleaning failed
-        try:
-            evaluation_data = json.loads(ai_content)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500, detail="AI response was not valid JSON.")
+    required_skills = list(scenario_catalog.skills(request.scenario_id))
 
-    # Persist to DB (evaluation record + individual scores)
-    db_session = SessionLocal()
-    try:
-        evaluation_record = Evaluation(
-            created_at=datetime.utcnow(),
-            user_id=user_id,
-            scenario_id=request.scenario_id,
-            full_transcript=transcript_text,
-        )
-        db_session.add(evaluation_record)
-        db_session.commit()
-        db_session.refresh(evaluation_record)
+    if not required_skills:
+        raise HTTPException(status_code=400, detail="Scenario has no skills configured.")
 
-        # Expecting evaluation_data to be a dict keyed by skill name
-        for skill_name, score_obj in evaluation_data.items():
-            if not isinstance(score_obj, dict):
-                continue
-            score_val = score_obj.get("score")
-            justification_val = score_obj.get("justification")
-            evaluation_score = EvaluationScore(
-                evaluation_id=evaluation_record.id,
-                skill_name=skill_name,
-                score=score_val,
-                justification=justification_val,
-            )
-            db_session.add(evaluation_score)
+    mode = resolve_evaluation_mode(request.mode)
+
+    if background:
+        job = await job_queue.submit(
+            "evaluation",
+            user_id,
+            {
+                "scenario_id": request.scenario_id,
+                "required_skills": required_skills,
+                "transcript": request.transcript,
+                "lang": request.lang,
+                "mode": mode,
+            },
+        )
+        return job_accepted(job)
 
-        db_session.commit()
-        
-        # Store evaluation_id before closing session
-        evaluation_id = evaluation_record.id
-    except Exception as db_err:
-        db_session.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(db_err)}")
-    finally:
-        db_session.close()
+    # Score and persist (evaluation record + individual scores), or reuse the stored result
+    evaluation_id, evaluation_data, replayed = await evaluate_once(
+        clients.openai, user_id, request.scenario_id, required_skills, request.transcript, request.lang, mode
+    )
+    if not replayed:
+        # A replayed evaluation may have been scored with an older prompt
+        response.headers["X-Prompt-Version"] = evaluation_prompt_version(required_skills, request.lang, mode)
+    response.headers["X-Evaluation-Replayed"] = "true" if replayed else "false"
 
     # Return both evaluation data and evaluation_id
     return {
@@ -559,26 +573,117 @@ async def evaluate_endpoint(
     }
 
 
+@app.post("/api/evaluate/batch")
+async def evaluate_batch_endpoint(
+    request: BatchEvaluationRequest,
+    http_request: Request,
+    user_id: str = Depends(get_current_user_id),
+    db_session: AsyncSession = Depends(get_session),
+):
+    """Evaluate many transcripts at once, e.g. to grade a whole cohort.
+
+    Transcripts are scored concurrently (at most ``EVALUATION_BATCH_CONCURRENCY``
+    transcripts in flight; a sharded item makes one call per skill), and all successful results are stored in a single
+    transaction. Each item reports its own status, so one failing transcript
+    does not fail the batch. As with ``/api/evaluate``, transcripts the user
+    already submitted (e.g. when a batch is retried) and repeats within the
+    batch are not scored again; their results say ``"replayed": true``.
+    Every item is charged to the caller's rate limit.
+    """
+    admit_request(http_request, user_id, cost=len(request.items))
+    await scenario_catalog.ensure_loaded()
+    client = clients.openai
+    semaphore = asyncio.Semaphore(EVALUATION_BATCH_CONCURRENCY)
+
+    content_hashes = [evaluation_content_hash(item.scenario_id, item.lang, item.transcript) for item in request.items]
+    stored = await find_evaluations_by_hash(db_session, user_id, set(content_hashes))
+    # Release the connection while the model is working
+    await db_session.commit()
+
+    async def score_item(item: EvaluationRequest, content_hash: str) -> dict:
+        # Each item runs in its own task, so the label stays per item
+        set_language(item.lang)
+        if not scenario_catalog.exists(item.scenario_id):
+            raise HTTPException(status_code=404, detail="Scenario not found.")
+
+        required_skills = list(scenario_catalog.skills(item.scenario_id))
+        if not required_skills:
+            raise HTTPException(status_code=400, detail="Scenario has no skills configured.")
+
+        if content_hash in stored:
+            return stored_scores(stored[content_hash])
+        async with semaphore:
+            return await score_with_mode(client, required_skills, item.transcript, item.lang, item.mode)
+
+    # Identical items are scored once
+    first_index: dict[str, int] = {}
+    for index, content_hash in enumerate(content_hashes):
+        first_index.setdefault(content_hash, index)
+    outcomes = await asyncio.gather(
+        *(score_item(request.items[index], content_hash) for content_hash, index in first_index.items()),
+        return_exceptions=True,
+    )
+    outcome_by_hash = dict(zip(first_index, outcomes))
+
+    results: list[dict] = []
+    records = []
+    for index, (item, content_hash) in enumerate(zip(request.items, content_hashes)):
+        outcome = outcome_by_hash[content_hash]
+        if isinstance(outcome, HTTPException):
+            results.append({"index": index, "status": "error", "status_code": outcome.status_code, "detail": outcome.detail})
+        elif isinstance(outcome, Exception):
+            results.append({"index": index, "status": "error", "status_code": 500, "detail": str(outcome)})
+        else:
+            replayed = content_hash in stored or first_index[content_hash] != index
+            evaluation_id = stored[content_hash].id if content_hash in stored else None
+            results.append(
+                {"index": index, "status": "ok", "evaluation_id": evaluation_id, "replayed": replayed, "scores": outcome}
+            )
+            if evaluation_id is None and not replayed:
+                records.append(build_evaluation_records(user_id, item.scenario_id, item.transcript, outcome, content_hash))
+
+    # Bulk insert every new evaluation in one transaction
+    if records:
+        saved = await save_evaluations_once(db_session, user_id, records)
+        for result, content_hash in zip(results, content_hashes):
+            if result["status"] != "ok" or content_hash not in saved:
+                continue
+            evaluation, stored_meanwhile = saved[content_hash]
+            result["evaluation_id"] = evaluation.id
+            if stored_meanwhile:
+                result["replayed"] = True
+                result["scores"] = stored_scores(evaluation)
+
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    return {
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    }
+
+
 @app.post("/api/transcribe")
 async def transcribe_endpoint(audio_file: UploadFile = File(...), lang: str = Query("en", description="Language code for transcription (e.g., 'cs', 'en')")):
-    """Transcribe an audio file using Deepgram API."""
+    """Transcribe an audio file using Deepgram API.
+
+    Uploads are capped at ``TRANSCRIBE_MAX_UPLOAD_BYTES`` and
+    ``TRANSCRIBE_MAX_DURATION_SECONDS`` (413 beyond either).
+    """
+    set_language(lang)
     
-    # Check if DEEPGRAM_API_KEY is available
-    deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
-    if not deepgram_api_key:
+    # Check if Deepgram is configured
+    deepgram = clients.deepgram
+    if deepgram is None:
         raise HTTPException(status_code=500, detail="Deepgram API key not configured")
     
     # Validate file type (optional - you can add more specific validation)
     if not audio_file.content_type or not audio_file.content_type.startswith("audio/"):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload an audio file.")
     
+    # Reject oversized or overlong clips before spending a Deepgram call
+    await check_audio_upload(audio_file)
+
     try:
-        # Initialize Deepgram client
-        deepgram = DeepgramClient(deepgram_api_key)
-        
-        # Read the audio file content
-        audio_data = await audio_file.read()
-        
         # Configure options for transcription with language
         options = PrerecordedOptions(
             model="nova-2",
@@ -586,28 +691,132 @@ async def transcribe_endpoint(audio_file: UploadFile = File(...), lang: str = Qu
             language=lang,  # Set the language for transcription
         )
         
-        # Send audio to Deepgram for transcription
-        response = deepgram.listen.prerecorded.v("1").transcribe_file(
-            {"buffer": audio_data, "mimetype": audio_file.content_type},
-            options
-        )
+        # Stream the (disk-spooled) upload to Deepgram in chunks instead of reading it into memory
+        async with observe_upstream("deepgram", "transcribe", "nova-2"):
+            # Each attempt streams the upload again from the start
+            response = await call_upstream(
+                "deepgram",
+                lambda: deepgram.listen.asyncrest.v("1").transcribe_file(
+                    {"stream": iter_upload(audio_file), "mimetype": audio_file.content_type},  # type: ignore[typeddict-item]
+                    options,
+                ),
+                operation="transcribe",
+            )
         
         # Extract transcript from response
         transcript = response["results"]["channels"][0]["alternatives"][0]["transcript"]
         
         return {"transcript": transcript}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
 
+@app.websocket("/api/transcribe/stream")
+async def transcribe_stream_endpoint(
+    websocket: WebSocket,
+    lang: str = Query("en", description="Language code for transcription (e.g., 'cs', 'en')"),
+    encoding: Optional[str] = Query(None, description="Raw audio encoding, e.g. 'linear16'; omit for WebM/Ogg"),
+    sample_rate: Optional[int] = Query(None, description="Sample rate of raw audio"),
+):
+    """Transcribe audio while it is being recorded.
+
+    The client sends audio as binary frames and ``{"type": "stop"}`` (or just
+    closes) when the recording ends. The server pushes
+    ``{"type": "transcript", "text", "is_final", "speech_final"}`` events as
+    the backend produces them, then ``{"type": "done", "transcript"}`` with the
+    joined final segments, or ``{"type": "error", "detail"}``.
+    """
+    set_language(lang)
+    await websocket.accept()
+
+    try:
+        session = await get_stt_backend().open(lang, encoding, sample_rate)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=1011)
+        return
+    except Exception as e:
+        await websocket.send_json({"type": "error", "detail": f"Transcription failed: {str(e)}"})
+        await websocket.close(code=1011)
+        return
+
+    client_gone = False
+
+    async def relay_audio():
+        # Forward frames until the client stops or disconnects, then let the backend flush
+        nonlocal client_gone
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    client_gone = True
+                    break
+                if message.get("bytes"):
+                    await session.send(message["bytes"])
+                elif message.get("text"):
+                    try:
+                        control = json.loads(message["text"])
+                    except ValueError:
+                        continue
+                    if isinstance(control, dict) and control.get("type") == "stop":
+                        break
+        finally:
+            await session.finish()
+
+    relay = asyncio.create_task(relay_audio())
+    final_segments: list[str] = []
+    try:
+        async for event in session.events():
+            if event.is_final and event.text:
+                final_segments.append(event.text)
+            if not client_gone:
+                await websocket.send_json({
+                    "type": "transcript",
+                    "text": event.text,
+                    "is_final": event.is_final,
+                    "speech_final": event.speech_final,
+                })
+        if not client_gone:
+            await websocket.send_json({"type": "done", "transcript": " ".join(final_segments)})
+            await websocket.close()
+    except HTTPException as e:
+        if not client_gone:
+            await websocket.send_json({"type": "error", "detail": e.detail})
+            await websocket.close(code=1011)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        relay.cancel()
+        await session.close()
+
+
+def resolve_tts_voice(request: TextToSpeechRequest) -> str:
+    """Determine voice_id based on language if not explicitly provided."""
+    if request.voice_id:
+        return request.voice_id
+
+    # Map language codes to default voice IDs
+    default_voices = {
+        "en": "JBFqnCBsd6RMkjVDRZzb",  # Rachel (English)
+        "cs": "JBFqnCBsd6RMkjVDRZzb",  # Default to Rachel for now, can be updated
+        "es": "JBFqnCBsd6RMkjVDRZzb",  # Default to Rachel for now, can be updated
+        "de": "JBFqnCBsd6RMkjVDRZzb",  # Default to Rachel for now, can be updated
+        "fr": "JBFqnCBsd6RMkjVDRZzb",  # Default to Rachel for now, can be updated
+    }
+    return default_voices.get(request.lang, "JBFqnCBsd6RMkjVDRZzb")
+
+
 @app.post("/api/text-to-speech")
 async def text_to_speech_endpoint(request: TextToSpeechRequest):
     """Convert text to speech using ElevenLabs API."""
+    set_language(request.lang)
     
-    # Check if ELEVENLABS_API_KEY is available
-    elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
-    if not elevenlabs_api_key:
+    # Check if ElevenLabs is configured
+    client = clients.elevenlabs
+    if client is None:
         raise HTTPException(status_code=500, detail="ElevenLabs API key not configured")
     
     # Validate input text
@@ -615,40 +824,10 @@ async def text_to_speech_endpoint(request: TextToSpeechRequest):
         raise HTTPException(status_code=400, detail="Text field cannot be empty")
     
     try:
-        # Initialize ElevenLabs client with API key
-        client = ElevenLabs(api_key=elevenlabs_api_key)
-        
-        # Determine voice_id based on language if not explicitly provided
-        if request.voice_id:
-            voice_id = request.voice_id
-        else:
-            # Map language codes to default voice IDs
-            default_voices = {
-                "en": "JBFqnCBsd6RMkjVDRZzb",  # Rachel (English)
-                "cs": "JBFqnCBsd6RMkjVDRZzb",  # Default to Rachel for now, can be updated
-                "es": "JBFqnCBsd6RMkjVDRZzb",  # Default to Rachel for now, can be updated
-                "de": "JBFqnCBsd6RMkjVDRZzb",  # Default to Rachel for now, can be updated
-                "fr": "JBFqnCBsd6RMkjVDRZzb",  # Default to Rachel for now, can be updated
-            }
-            voice_id = default_voices.get(request.lang, "JBFqnCBsd6RMkjVDRZzb")
-        
-        # Generate audio using determined voice
-        audio = client.text_to_speech.convert(
-            text=request.text.strip(),
-            voice_id=voice_id,
-            model_id="eleven_multilingual_v2",
-            output_format="mp3_44100_128"
-        )
+        voice_id = resolve_tts_voice(request)
         
-        # More robust audio processing
-        audio_bytes = b""
-        chunk_count = 0
-        for chunk in audio:
-            if chunk:
-                audio_bytes += chunk
-                chunk_count += 1
-        
-        print(f"TTS: Processed {chunk_count} audio chunks, total bytes: {len(audio_bytes)}")
+        # Generate audio using determined voice (served from cache when possible)
+        audio_bytes = await synthesize_speech(client, request.text.strip(), voice_id)
         
         if not audio_bytes:
             raise HTTPException(status_code=500, detail="No audio data received from ElevenLabs")
@@ -662,6 +841,44 @@ async def text_to_speech_endpoint(request: TextToSpeechRequest):
         raise HTTPException(status_code=500, detail=f"Text-to-speech conversion failed: {str(e)}")
 
 
+@app.post("/api/text-to-speech/stream")
+async def text_to_speech_stream_endpoint(request: TextToSpeechRequest):
+    """Stream synthesized speech as raw ``audio/mpeg`` without buffering or base64 encoding."""
+    set_language(request.lang)
+
+    # Check if ElevenLabs is configured
+    client = clients.elevenlabs
+    if client is None:
+        raise HTTPException(status_code=500, detail="ElevenLabs API key not configured")
+
+    # Validate input text
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text field cannot be empty")
+
+    audio_chunks = stream_speech(client, request.text.strip(), resolve_tts_voice(request))
+
+    # Wait for the first chunk so upstream failures still produce a proper error status
+    try:
+        first_chunk = await audio_chunks.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="No audio data received from ElevenLabs")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Text-to-speech conversion failed: {str(e)}")
+
+    async def body():
+        yield first_chunk
+        try:
+            async for chunk in audio_chunks:
+                yield chunk
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated stream
+            print(f"Text-to-speech stream failed: {str(e)}")
+
+    return StreamingResponse(body(), media_type=media_type_for(DEFAULT_OUTPUT_FORMAT))
+
+
 # ---------------------------
 # Authentication Endpoints
 # ---------------------------
@@ -672,15 +889,21 @@ async def signup_endpoint(credentials: SignupRequest):
     """Register a new user with Supabase."""
     try:
         # Supabase expects a dict payload for sign-up
-        result = supabase.auth.sign_up({
-            "email": credentials.email,
-            "password": credentials.password,
-            "options": {
-                "data": {
-                    "display_name": credentials.username,
-                }
-            },
-        })
+        async with observe_upstream("supabase", "sign_up"):
+            result = await call_upstream(
+                "supabase",
+                partial(asyncio.to_thread, supabase.auth.sign_up, {
+                    "email": credentials.email,
+                    "password": credentials.password,
+                    "options": {
+                        "data": {
+                            "display_name": credentials.username,
+                        }
+                    },
+                }),
+                operation="sign_up",
+                idempotent=False,
+            )
 
         # The Supabase Python client returns an AuthResponse-like object
         err = getattr(result, "error", None)
@@ -708,10 +931,17 @@ async def signup_endpoint(credentials: SignupRequest):
 async def login_endpoint(credentials: LoginRequest):
     """Authenticate a user with Supabase and return session data (access token)."""
     try:
-        result = supabase.auth.sign_in_with_password({
-            "email": credentials.email,
-            "password": credentials.password,
-        })
+        async with observe_upstream("supabase", "sign_in"):
+            # Every sign-in creates a session, so a timed-out one is not repeated
+            result = await call_upstream(
+                "supabase",
+                partial(asyncio.to_thread, supabase.auth.sign_in_with_password, {
+                    "email": credentials.email,
+                    "password": credentials.password,
+                }),
+                operation="sign_in",
+                idempotent=False,
+            )
 
         # Handle Supabase errors
         err = getattr(result, "error", None)
@@ -741,42 +971,22 @@ async def login_endpoint(credentials: LoginRequest):
 @app.post("/api/me/settings")
 async def update_user_settings(
     request: UserSettingsRequest,
-    authorization: str = Header(..., description="Bearer access token"),
+    user_id: str = Depends(get_current_user_id),
 ):
     """Update user settings like preferred language."""
     
-    # Validate JWT token (same logic as other protected endpoints)
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing.")
-
-    if not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Authorization header must be in the format 'Bearer <token>'.")
-
-    jwt_token = authorization.split(" ", 1)[1]
-
-    try:
-        auth_res = supabase.auth.get_user(jwt_token)
-        err = getattr(auth_res, "error", None)
-        if err is not None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token.")
-
-        user_obj = getattr(auth_res, "user", None)
-        if user_obj is None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token.")
-
-        user_id = getattr(user_obj, "id", None)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Token validation failed: {str(e)}")
-
     # Update user metadata with preferred language
     try:
-        update_response = supabase.auth.update_user({
-            "data": {
-                "preferred_language": request.preferred_language
-            }
-        })
+        async with observe_upstream("supabase", "update_user"):
+            update_response = await call_upstream(
+                "supabase",
+                partial(asyncio.to_thread, supabase.auth.update_user, {
+                    "data": {
+                        "preferred_language": request.preferred_language
+                    }
+                }),
+                operation="update_user",
+            )
         
         err = getattr(update_response, "error", None)
         if err is not None:
@@ -790,68 +1000,114 @@ async def update_user_settings(
         raise HTTPException(status_code=500, detail=f"Failed to update user settings: {str(e)}")
 
 
-@app.get("/api/me/history")
-async def history_endpoint(authorization: str = Header(..., description="Bearer access token")):
-    """Return the authenticated user's evaluation history (oldest to newest)."""
+HISTORY_DEFAULT_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
 
-    # Validate token (same logic as /api/evaluate)
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing.")
 
-    if not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Authorization header must be in the format 'Bearer <token>'.")
+def encode_history_cursor(evaluation: Evaluation) -> str:
+    """Opaque pagination cursor pointing at the last returned evaluation."""
+    raw = f"{evaluation.created_at.isoformat()}|{evaluation.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
 
-    jwt_token = authorization.split(" ", 1)[1]
 
+def decode_history_cursor(cursor: str) -> tuple[datetime, int]:
     try:
-        auth_res = supabase.auth.get_user(jwt_token)
+        created_at_raw, id_raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at_raw), int(id_raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid history cursor.")
+
+
+def serialize_evaluation(ev: Evaluation, include_transcript: bool = True) -> dict:
+    item = {
+        "id": ev.id,
+        "created_at": ev.created_at.isoformat() if ev.created_at is not None else None,
+        "scenario_id": ev.scenario_id,
+        "scores": [
+            {
+                "skill_name": s.skill_name,
+                "score": s.score,
+                "justification": s.justification,
+            }
+            for s in ev.scores
+        ],
+    }
+    if include_transcript:
+        item["full_transcript"] = ev.full_transcript
+    return item
+
+
+async def load_user_evaluation(session: AsyncSession, evaluation_id: int, user_id) -> Evaluation:
+    """Fetch one of the user's evaluations with its scores, or raise 404."""
+    result = await session.execute(
+        select(Evaluation)
+        .options(selectinload(Evaluation.scores))
+        .where(
+            Evaluation.id == evaluation_id,
+            Evaluation.user_id == user_id  # Ensure user can only access their own evaluations
+        )
+    )
+    evaluation = result.scalars().first()
+    if evaluation is None:
+        raise HTTPException(status_code=404, detail="Evaluation not found or access denied.")
+    return evaluation
 
-        err = getattr(auth_res, "error", None)
-        if err is not None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token.")
 
-        user_obj = getattr(auth_res, "user", None)
-        if user_obj is None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token.")
+@app.get("/api/me/history")
+async def history_endpoint(
+    response: Response,
+    user_id: str = Depends(get_current_user_id),
+    limit: int = Query(HISTORY_DEFAULT_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    summary: bool = Query(False, description="Leave out full transcripts"),
+    session: AsyncSession = Depends(get_session),
+):
+    """Return one page of the authenticated user's evaluation history (newest first).
 
-        user_id = getattr(user_obj, "id", None)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Token validation failed: {str(e)}")
+    Pages are keyed on ``(created_at, id)``. When more evaluations exist, the
+    cursor for the next page is returned in the ``X-Next-Cursor`` header.
+    """
 
-    # Query evaluations for the user
-    session = SessionLocal()
-    try:
-        evaluations = (
-            session.query(Evaluation)
-            .filter(Evaluation.user_id == user_id)
-            .order_by(Evaluation.created_at.desc())
-            .all()
+    # Query evaluations for the user; scores are loaded in one batched query
+    query = (
+        select(Evaluation)
+        .options(selectinload(Evaluation.scores))
+        .where(Evaluation.user_id == user_id)
+    )
+    if summary:
+        query = query.options(defer(Evaluation.full_transcript))
+    if cursor:
+        cursor_created_at, cursor_id = decode_history_cursor(cursor)
+        query = query.where(
+            or_(
+                Evaluation.created_at < cursor_created_at,
+                and_(Evaluation.created_at == cursor_created_at, Evaluation.id < cursor_id),
+            )
         )
 
-        history = []
-        for ev in evaluations:
-            history.append(
-                {
-                    "id": ev.id,
-                    "created_at": ev.created_at.isoformat() if ev.created_at is not None else None,
-                    "scenario_id": ev.scenario_id,
-                    "full_transcript": ev.full_transcript,
-                    "scores": [
-                        {
-                            "skill_name": s.skill_name,
-                            "score": s.score,
-                            "justification": s.justification,
-                        }
-                        for s in ev.scores
-                    ],
-                }
-            )
+    # Fetch one extra row to learn whether another page exists
+    result = await session.execute(
+        query.order_by(Evaluation.created_at.desc(), Evaluation.id.desc()).limit(limit + 1)
+    )
+    evaluations = list(result.scalars().all())
 
-        return history
-    finally:
-        session.close()
+    has_more = len(evaluations) > limit
+    evaluations = evaluations[:limit]
+    if has_more:
+        response.headers["X-Next-Cursor"] = encode_history_cursor(evaluations[-1])
+
+    return [serialize_evaluation(ev, include_transcript=not summary) for ev in evaluations]
+
+
+@app.get("/api/me/history/{evaluation_id}")
+async def history_item_endpoint(
+    evaluation_id: int,
+    user_id: str = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_session),
+):
+    """Return a single evaluation of the authenticated user, including its transcript."""
+    evaluation = await load_user_evaluation(session, evaluation_id, user_id)
+    return serialize_evaluation(evaluation)
 
 
 # ---------------------------
@@ -859,218 +1115,272 @@ async def history_endpoint(authorization: str = Header(..., description="Bearer
 # ---------------------------
 
 
-@app.post("/api/coach/generate-feedback")
-async def generate_feedback_endpoint(
-    request: CoachFeedbackRequest,
-    authorization: str = Header(..., description="Bearer access token"),
-):
-    """Generate comprehensive feedback for an evaluation using AI Coach."""
-
-    # Validate JWT token (same logic as other protected endpoints)
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing.")
-
-    if not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Authorization header must be in the format 'Bearer <token>'.")
+async def open_debrief(
+    session: AsyncSession, evaluation_id: int, lang: Optional[str], user_id
+) -> tuple[Optional[str], Optional[DebriefStream]]:
+    """Return ``(stored_text, None)`` for an existing debrief, else ``(None, generation)``.
 
-    jwt_token = authorization.split(" ", 1)[1]
+    Joins a generation that is already running for the same (evaluation, language).
+    """
+    lang = coach_language(lang)
+
+    # Check the in-flight generation first: it is only dropped once its row is stored
+    generation = coach_feedback_service.in_flight(evaluation_id, lang)
+    if generation is None:
+        stored = await coach_feedback_service.stored(session, evaluation_id, lang, user_id)
+        if stored is not None:
+            return stored.feedback_text, None
+
+    # Still verify ownership before handing out a generation that another request started
+    evaluation = await load_user_evaluation(session, evaluation_id, user_id)
+    if generation is not None:
+        return None, generation
+
+    # Build rubric scores summary
+    scores_summary = []
+    for score in evaluation.scores:
+        scores_summary.append(f"- {score.skill_name}: {score.score}/5 - {score.justification}")
+    
+    rubric_summary = "\n".join(scores_summary)
 
-    try:
-        auth_res = supabase.auth.get_user(jwt_token)
-        err = getattr(auth_res, "error", None)
-        if err is not None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token.")
+    # Language instruction and coach instructions are precompiled per language
+    feedback_prompt = prompt_registry.debrief(lang, evaluation.full_transcript, rubric_summary).text
 
-        user_obj = getattr(auth_res, "user", None)
-        if user_obj is None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token.")
+    # End the read transaction so the connection goes back to the pool during the LLM call
+    await session.commit()
 
-        user_id = getattr(user_obj, "id", None)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Token validation failed: {str(e)}")
+    return None, coach_feedback_service.start(clients.openai, evaluation_id, lang, feedback_prompt)
 
-    # Fetch evaluation and its scores from database
-    session = SessionLocal()
-    try:
-        evaluation = session.query(Evaluation).filter(
-            Evaluation.id == request.evaluation_id,
-            Evaluation.user_id == user_id  # Ensure user can only access their own evaluations
-        ).first()
-        
-        if evaluation is None:
-            raise HTTPException(status_code=404, detail="Evaluation not found or access denied.")
 
-        # Build rubric scores summary
-        scores_summary = []
-        for score in evaluation.scores:
-            scores_summary.append(f"- {score.skill_name}: {score.score}/5 - {score.justification}")
-        
-        rubric_summary = "\n".join(scores_summary)
+@app.post("/api/coach/generate-feedback")
+async def generate_feedback_endpoint(
+    request: CoachFeedbackRequest,
+    response: Response,
+    background: bool = Query(False, description="Queue the debrief and answer 202 with a job id"),
+    user_id: str = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_session),
+):
+    """Return the AI Coach debrief for an evaluation, generating and storing it on first use.
 
-    finally:
-        session.close()
+    Stored debriefs are returned without calling the model (``X-Feedback-Cached: true``).
+    With ``background=true`` the debrief is produced by a job (see
+    ``/api/jobs/{job_id}``) whose result is ``{"feedback_text": ...}``.
+    """
+    set_language(request.lang)
+    if background:
+        # Ownership is checked now, so a foreign or missing evaluation is still a 404
+        await load_user_evaluation(session, request.evaluation_id, user_id)
+        await session.commit()
+        job = await job_queue.submit(
+            "coach_feedback", user_id, {"evaluation_id": request.evaluation_id, "lang": request.lang}
+        )
+        return job_accepted(job)
 
-    # Generate comprehensive feedback using OpenAI
-    client = OpenAI()
-    
-    # Add language instruction to the prompt
-    language_instruction = ""
-    if request.lang == "cs":
-        language_instruction = "Your entire response must be in Czech language. "
-    elif request.lang == "sk":
-        language_instruction = "Your entire response must be in Slovak language. "
-    else:
-        language_instruction = "Your entire response must be in English language. "
-    
-    feedback_prompt = f"""
-{language_instruction}
+    stored_text, generation = await open_debrief(session, request.evaluation_id, request.lang, user_id)
+    response.headers["X-Feedback-Cached"] = "true" if generation is None else "false"
+    if generation is None:
+        return {"feedback_text": stored_text}
 
-{DEBRIEF_PROMPT}
+    return {"feedback_text": await generation.text()}
 
-**Conversation Transcript:**
-{evaluation.full_transcript}
 
-**Rubric-Based Evaluation:**
-{rubric_summary}
-"""
+@app.post("/api/coach/generate-feedback/stream")
+async def generate_feedback_stream_endpoint(
+    request: CoachFeedbackRequest,
+    user_id: str = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_session),
+):
+    """Stream the AI Coach debrief as NDJSON events.
 
-    try:
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": feedback_prompt}]
-        )
-        feedback_text = completion.choices[0].message.content or ""
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
+    Emits ``text_delta`` events while the Markdown is generated, then
+    ``text_done`` with the full ``feedback_text`` and ``cached``, and finally
+    ``done``. A stored debrief is sent as a single ``text_done``. Generation
+    continues (and is stored) even if the client disconnects.
+    """
+    set_language(request.lang)
+    stored_text, generation = await open_debrief(session, request.evaluation_id, request.lang, user_id)
 
-    # Save feedback to database
-    session = SessionLocal()
-    try:
-        coach_feedback = CoachFeedback(
-            evaluation_id=request.evaluation_id,
-            feedback_text=feedback_text,
-            created_at=datetime.utcnow()
-        )
-        session.add(coach_feedback)
-        session.commit()
-        session.refresh(coach_feedback)
-    except Exception as db_err:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(db_err)}")
-    finally:
-        session.close()
+    async def event_stream():
+        if generation is None:
+            yield ndjson_event("text_done", feedback_text=stored_text, cached=True)
+            yield ndjson_event("done")
+            return
 
-    return {"feedback_text": feedback_text}
+        try:
+            async for delta in generation.follow():
+                yield ndjson_event("text_delta", delta=delta)
+        except HTTPException as e:
+            yield ndjson_event("error", detail=e.detail)
+            return
+
+        yield ndjson_event("text_done", feedback_text="".join(generation.parts), cached=False)
+        yield ndjson_event("done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-@app.post("/api/coach/chat")
+@app.post("/api/coach/chat", dependencies=[Depends(rate_limited())])
 async def coach_chat_endpoint(request: CoachChatRequest):
-    """AI Coach Q&A for medical communication skills."""
-    
-    # Add language instruction to the system prompt
-    language_instruction = ""
-    if request.lang == "cs":
-        language_instruction = "Your entire response must be in Czech language. "
-    elif request.lang == "sk":
-        language_instruction = "Your entire response must be in Slovak language. "
-    else:
-        language_instruction = "Your entire response must be in English language. "
-    
-    system_prompt = f"{language_instruction}\n\n{Q_AND_A_PROMPT}"
-    
-    # Build message history for context
-    messages = [{"role": "system", "content": system_prompt}]
-    
-    # Add chat history if provided
-    for idx, text in enumerate(request.chat_history):
-        role = "user" if idx % 2 == 0 else "assistant"
-        messages.append({"role": role, "content": text})
+    """AI Coach Q&A for medical communication skills.
+
+    ``chat_history`` is fitted into the coach token budget; ``token_usage``
+    reports the history window and the completion's token counts.
+    """
+    set_language(request.lang)
+    client = clients.openai
+
+    # Precompiled per language
+    system_prompt = prompt_registry.coach_system(request.lang).text
+
+    # Recent questions and answers verbatim, older ones summarized
+    history = await build_history_window(
+        client,
+        request.chat_history,
+        f"coach:{coach_language(request.lang)}",
+        COACH_HISTORY_TOKEN_BUDGET,
+    )
+    messages = [{"role": "system", "content": system_prompt}, *history.messages]
     
     # Add current question
     messages.append({"role": "user", "content": request.question})
+    history.window_tokens += count_message_tokens(request.question)
 
     # Generate response using OpenAI
-    client = OpenAI()
-    
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages
-        )
+        async with model_slot("gpt-4o-mini"), observe_upstream("openai", "coach_chat", "gpt-4o-mini"):
+            completion = await call_upstream(
+                "openai",
+                partial(client.chat.completions.create, model="gpt-4o-mini", messages=messages),
+                operation="coach_chat",
+            )
+        record_token_usage("gpt-4o-mini", "coach_chat", getattr(completion, "usage", None))
         response_text = completion.choices[0].message.content or ""
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
 
-    return {"response": response_text}
+    return {
+        "response": response_text,
+        "token_usage": {**history.usage(), **completion_usage(getattr(completion, "usage", None))},
+    }
 
 
-@app.post("/api/coach/hint")
+@app.post("/api/coach/hint", dependencies=[Depends(rate_limited())])
 async def coach_hint_endpoint(request: CoachHintRequest):
     """Provide real-time coaching hints during simulations."""
+    set_language(request.lang)
     
-    # Fetch scenario goal from database
-    session = SessionLocal()
-    try:
-        scenario = session.query(Scenario).filter(Scenario.id == request.scenario_id).first()
-        if scenario is None:
-            raise HTTPException(status_code=404, detail="Scenario not found.")
-        
-        # Get the translation for the requested language
-        translation = session.query(ScenarioTranslation).filter(
-            ScenarioTranslation.scenario_id == request.scenario_id,
-            ScenarioTranslation.language_code == request.lang
-        ).first()
-        
-        # If no translation found for the requested language, fall back to English
-        if not translation and request.lang != "en":
-            translation = session.query(ScenarioTranslation).filter(
-                ScenarioTranslation.scenario_id == request.scenario_id,
-                ScenarioTranslation.language_code == "en"
-            ).first()
-        
-        if not translation:
-            raise HTTPException(status_code=404, detail="Scenario translation not found.")
-            
-        scenario_goal = translation.goal
-    finally:
-        session.close()
+    # Fetch scenario goal from the catalog
+    scenario = await get_scenario_view(request.scenario_id, request.lang)
 
     # Build conversation history for context
     conversation_text = "\n".join([f"Message {i+1}: {msg}" for i, msg in enumerate(request.conversation_history)])
     
-    # Add language instruction to the prompt
-    language_instruction = ""
-    if request.lang == "cs":
-        language_instruction = "Respond in Czech language."
-    elif request.lang == "sk":
-        language_instruction = "Respond in Slovak language."
-    else:
-        language_instruction = "Respond in English."
-    
-    hint_prompt = f"""
-{HINT_PROMPT}
-
-{language_instruction}
-
-**Scenario Goal:**
-{scenario_goal}
-
-**Conversation History:**
-{conversation_text}
-"""
+    # Everything up to the history is precompiled per (scenario, language)
+    hint_prompt = f"{prompt_registry.hint_prefix(scenario, request.lang).text}{conversation_text}\n"
 
     # Generate hint using OpenAI
-    client = OpenAI()
+    client = clients.openai
     
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": hint_prompt}]
-        )
+        async with model_slot("gpt-4o-mini"), observe_upstream("openai", "hint", "gpt-4o-mini"):
+            completion = await call_upstream(
+                "openai",
+                partial(
+                    client.chat.completions.create,
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": hint_prompt}],
+                ),
+                operation="hint",
+            )
+        record_token_usage("gpt-4o-mini", "hint", getattr(completion, "usage", None))
         hint_text = completion.choices[0].message.content or ""
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
 
-    return {"hint": hint_text} 
\ No newline at end of file
+    return {"hint": hint_text} 
+
+# ---------------------------
+# Background Job Endpoints
+# ---------------------------
+
+
+def job_accepted(job: JobRecord) -> JSONResponse:
+    """202 response pointing the client at the job's status and event stream."""
+    status_url = f"/api/jobs/{job.id}"
+    return JSONResponse(
+        status_code=202,
+        content={**job.to_dict(), "status_url": status_url, "events_url": f"{status_url}/events"},
+        headers={"Location": status_url},
+    )
+
+
+async def run_evaluation_job(job: JobRecord) -> dict:
+    payload = job.payload
+    evaluation_id, evaluation_data, _ = await evaluate_once(
+        clients.openai,
+        job.user_id,
+        payload["scenario_id"],
+        payload["required_skills"],
+        payload["transcript"],
+        payload["lang"],
+        payload["mode"],
+    )
+    return {"evaluation_id": evaluation_id, **evaluation_data}
+
+
+async def run_feedback_job(job: JobRecord) -> dict:
+    async with SessionLocal() as session:
+        stored_text, generation = await open_debrief(
+            session, job.payload["evaluation_id"], job.payload["lang"], job.user_id
+        )
+    if generation is None:
+        return {"feedback_text": stored_text}
+    return {"feedback_text": await generation.text()}
+
+
+job_queue.register("evaluation", run_evaluation_job)
+job_queue.register("coach_feedback", run_feedback_job)
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_status_endpoint(job_id: str, user_id: str = Depends(get_current_user_id)):
+    """Status of one of the user's background jobs.
+
+    ``status`` is ``queued``, ``running``, ``succeeded`` (with ``result``) or
+    ``failed`` (with ``error.status_code`` and ``error.detail``).
+    """
+    job = await job_queue.get_for_user(job_id, user_id)
+    return job.to_dict()
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str, user_id: str = Depends(get_current_user_id)):
+    """Follow a background job as server-sent events.
+
+    Sends a ``status`` event with the job (as in ``/api/jobs/{job_id}``)
+    right away and on every status change, and closes after the job has
+    finished. The stream needs the ``Authorization`` header, so browsers
+    read it with ``fetch`` rather than ``EventSource``.
+    """
+    job = await job_queue.get_for_user(job_id, user_id)
+
+    async def event_stream():
+        async for state in job_queue.follow(job):
+            if state is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(state.to_dict())}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,292 @@
+"""Prometheus metrics for requests, upstream calls and database queries.
+
+- HTTP requests: latency by endpoint (the route template), method and status.
+- Upstream calls to OpenAI, ElevenLabs, Deepgram and Supabase: latency by
+  service, operation, model, endpoint, language (en, cs, sk or other) and
+  outcome.
+- Database queries: latency by statement type, endpoint and outcome, taken
+  from SQLAlchemy engine events.
+- Counters for OpenAI token usage, TTS audio bytes, TTS cache lookups and
+  emotional state decisions.
+- Upstream resilience: circuit breaker state per service, breaker
+  transitions, retries and hedged requests (see ``resilience.py``).
+- Admission control: rejected requests, and per-model concurrency slots in
+  use, queue depth and queue wait (see ``admission.py``).
+- Background jobs: finished jobs by outcome, and time spent queued and
+  running (see ``jobs.py``).
+
+The endpoint and language labels come from context variables:
+``MetricsMiddleware`` sets the endpoint of every request and endpoints call
+``set_language`` once they know it. Tasks started by a request inherit both;
+background jobs call ``set_endpoint`` with their kind.
+``/metrics`` serves the default registry in Prometheus text format.
+"""
+
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_endpoint: ContextVar[str] = ContextVar("metrics_endpoint", default="none")
+_language: ContextVar[str] = ContextVar("metrics_language", default="none")
+
+# Languages reported as themselves; anything else a client sends is "other"
+METRIC_LANGUAGES = frozenset(("en", "cs", "sk"))
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to complete an HTTP request, including streamed bodies.",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls to upstream services; streamed calls are timed until the last chunk.",
+    ["service", "operation", "model", "endpoint", "lang", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time.",
+    ["statement", "endpoint", "outcome"],
+    buckets=DB_BUCKETS,
+)
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total",
+    "Tokens reported by OpenAI responses.",
+    ["model", "operation", "endpoint", "kind"],
+)
+TTS_AUDIO_BYTES = Counter(
+    "tts_audio_bytes_total",
+    "Audio bytes returned by text-to-speech, from ElevenLabs or the cache.",
+    ["endpoint", "source"],
+)
+TTS_CACHE_LOOKUPS = Counter(
+    "tts_cache_lookups_total",
+    "TTS cache lookups by the tier that served them.",
+    ["result"],
+)
+EMOTIONAL_STATE_DECISIONS = Counter(
+    "emotional_state_decisions_total",
+    "Emotional state decisions by how they were made.",
+    ["source"],
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state per upstream service: 0 closed, 1 half-open, 2 open.",
+    ["service"],
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker state changes by the state entered.",
+    ["service", "state"],
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total",
+    "Upstream calls repeated after a transient failure.",
+    ["service", "operation"],
+)
+UPSTREAM_HEDGES = Counter(
+    "upstream_hedged_requests_total",
+    "Duplicate requests sent because the first was slow, by the request that answered first.",
+    ["service", "operation", "winner"],
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total",
+    "Requests turned away with a 429, by reason.",
+    ["endpoint", "reason"],
+)
+MODEL_SLOTS_IN_USE = Gauge(
+    "model_slots_in_use",
+    "Upstream calls currently holding one of the model's concurrency slots.",
+    ["model"],
+)
+MODEL_QUEUE_DEPTH = Gauge(
+    "model_queue_depth",
+    "Calls waiting for one of the model's concurrency slots.",
+    ["model"],
+)
+MODEL_QUEUE_WAIT_SECONDS = Histogram(
+    "model_queue_wait_seconds",
+    "Time calls waited for a model concurrency slot.",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+JOBS_FINISHED = Counter(
+    "jobs_finished_total",
+    "Background jobs that reached a final state.",
+    ["kind", "status"],
+)
+JOB_PHASE_SECONDS = Histogram(
+    "job_phase_duration_seconds",
+    "Time background jobs spent queued and running.",
+    ["kind", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def current_endpoint() -> str:
+    return _endpoint.get()
+
+
+def set_endpoint(endpoint: str) -> None:
+    """Label the upstream calls and queries of work done outside a request, e.g. ``job:evaluation``."""
+    _endpoint.set(endpoint)
+
+
+def set_language(lang: Optional[str]) -> None:
+    """Label the upstream calls of the current request (and the tasks it starts later) with ``lang``.
+
+    ``lang`` comes from the client, so values outside ``METRIC_LANGUAGES``
+    are reported as ``other`` to keep the number of series bounded.
+    """
+    if not lang:
+        _language.set("none")
+    else:
+        _language.set(lang if lang in METRIC_LANGUAGES else "other")
+
+
+@asynccontextmanager
+async def observe_upstream(service: str, operation: str, model: str = "") -> AsyncIterator[None]:
+    """Time the enclosed upstream call; the outcome is ``ok``, ``error`` or ``cancelled``."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except BaseException as e:
+        if not isinstance(e, Exception):
+            # Cancelled task or a generator closed by its consumer
+            outcome = "cancelled"
+        raise
+    finally:
+        UPSTREAM_REQUEST_SECONDS.labels(
+            service, operation, model, _endpoint.get(), _language.get(), outcome
+        ).observe(time.perf_counter() - start)
+
+
+def record_token_usage(model: str, operation: str, usage) -> None:
+    """Count the prompt and completion tokens of an OpenAI ``usage`` object (ignored if None)."""
+    if usage is None:
+        return
+    endpoint = _endpoint.get()
+    for kind in ("prompt_tokens", "completion_tokens"):
+        count = getattr(usage, kind, None)
+        if count:
+            OPENAI_TOKENS.labels(model, operation, endpoint, kind.split("_")[0]).inc(count)
+
+
+def record_tts_bytes(count: int, source: str) -> None:
+    if count:
+        TTS_AUDIO_BYTES.labels(_endpoint.get(), source).inc(count)
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement executed through ``engine`` (sync or async)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    def statement_type(statement: str) -> str:
+        words = statement.lstrip().split(None, 1)
+        return words[0].upper() if words else "UNKNOWN"
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if starts:
+            DB_QUERY_SECONDS.labels(statement_type(statement), _endpoint.get(), "ok").observe(
+                time.perf_counter() - starts.pop()
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+        if starts:
+            DB_QUERY_SECONDS.labels(statement_type(context.statement or ""), _endpoint.get(), "error").observe(
+                time.perf_counter() - starts.pop()
+            )
+
+
+class MetricsMiddleware:
+    """ASGI middleware setting the endpoint label and timing every HTTP request."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    @staticmethod
+    def _route_path(scope) -> str:
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._route_path(scope)
+        token = _endpoint.set(endpoint)
+        if scope["type"] == "websocket":
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _endpoint.reset(token)
+            return
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(endpoint, scope.get("method", ""), status).observe(time.perf_counter() - start)
+            _endpoint.reset(token)
+
+
+def metrics_response() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+__all__ = [
+    "MetricsMiddleware",
+    "ADMISSION_REJECTIONS",
+    "CIRCUIT_BREAKER_STATE",
+    "CIRCUIT_BREAKER_TRANSITIONS",
+    "EMOTIONAL_STATE_DECISIONS",
+    "JOBS_FINISHED",
+    "JOB_PHASE_SECONDS",
+    "MODEL_QUEUE_DEPTH",
+    "MODEL_QUEUE_WAIT_SECONDS",
+    "MODEL_SLOTS_IN_USE",
+    "TTS_CACHE_LOOKUPS",
+    "UPSTREAM_HEDGES",
+    "UPSTREAM_RETRIES",
+    "current_endpoint",
+    "instrument_engine",
+    "metrics_response",
+    "observe_upstream",
+    "record_token_usage",
+    "record_tts_bytes",
+    "set_endpoint",
+    "set_language",
+]
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -73,12 +73,21 @@ class Evaluation(Base):
     """Stores a learner's attempt at a scenario and the AI's analysis."""
 
     __tablename__ = "evaluations"
+    __table_args__ = (
+        # Serves the keyset-paginated history query
+        Index("ix_evaluations_user_created_id", "user_id", "created_at", "id"),
+        # One evaluation per user and submission (NULL for rows stored before hashing)
+        Index("ix_evaluations_user_content_hash", "user_id", "content_hash", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
-    user_id = Column(UUID(as_uuid=True), nullable=False)
+    # Bound as the string id from the access token, so SQLite (local runs) works as well as Postgres
+    user_id = Column(UUID(as_uuid=False), nullable=False)
     scenario_id = Column(String, ForeignKey("scenarios.id"), nullable=False)
     full_transcript = Column(Text, nullable=False)
+    # sha256 of scenario_id, lang and the normalized transcript, see evaluation.evaluation_content_hash
+    content_hash = Column(String(64), nullable=True)
 
     # Relationships
     scores = relationship(
@@ -100,7 +109,7 @@ class EvaluationScore(Base):
     __tablename__ = "evaluation_scores"
 
     id = Column(Integer, primary_key=True, index=True)
-    evaluation_id = Column(Integer, ForeignKey("evaluations.id"), nullable=False)
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id"), nullable=False, index=True)
     skill_name = Column(String, nullable=False)
     score = Column(Integer, nullable=False)
     justification = Column(Text, nullable=False)
@@ -113,11 +122,41 @@ class CoachFeedback(Base):
     """Stores coach feedback for an evaluation."""
 
     __tablename__ = "coach_feedback"
+    __table_args__ = (
+        # Serves the stored-debrief lookup per (evaluation, language)
+        Index("ix_coach_feedback_evaluation_language", "evaluation_id", "language_code"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     evaluation_id = Column(Integer, ForeignKey("evaluations.id"), nullable=False)
+    language_code = Column(String, nullable=True)  # e.g., 'en', 'cs', 'sk'; NULL for older rows
     feedback_text = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
 
     # Relationships
-    evaluation = relationship("Evaluation", back_populates="coach_feedback") 
\ No newline at end of file
+    evaluation = relationship("Evaluation", back_populates="coach_feedback") 
+
+
+class Job(Base):
+    """A background job (evaluation or coach debrief) and its outcome, see jobs.py."""
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Serves the workers' claim query
+        Index("ix_jobs_status_created", "status", "created_at"),
+    )
+
+    id = Column(String(32), primary_key=True)
+    kind = Column(String, nullable=False)  # e.g., 'evaluation', 'coach_feedback'
+    user_id = Column(UUID(as_uuid=False), nullable=False, index=True)
+    status = Column(String, nullable=False)  # 'queued', 'running', 'succeeded' or 'failed'
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON, nullable=True)
+    error_status = Column(Integer, nullable=True)
+    error_detail = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, server_default='0')
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    # Refreshed by the worker while the job runs; a stale value means the worker is gone
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
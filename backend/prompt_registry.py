@@ -0,0 +1,312 @@
+"""Precompiled prompts for the chat, evaluation and coach endpoints.
+
+The static parts of every prompt (persona rules, emotional state guide,
+rubric sections, coach instructions per language) are compiled once at
+import. Full prompts are memoized:
+
+- persona prompts per (scenario, language, emotional state)
+- evaluator prompts per (required skill set, language), including the
+  single-skill prompts of the sharded evaluation mode
+- hint prefixes per (scenario, language)
+
+Scenario-dependent entries are dropped whenever the scenario catalog's
+content version changes. Every compiled prompt carries a short content hash
+(``version``) so a response can be traced back to the exact prompt text.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+
+from coach_prompts import DEBRIEF_PROMPT, Q_AND_A_PROMPT, HINT_PROMPT
+from rubric import MASTER_RUBRIC
+from scenario_catalog import ScenarioCatalog, ScenarioView, scenario_catalog
+
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "4096"))
+
+# Languages prompts are precompiled for at startup (others are compiled on first use)
+PROMPT_LANGUAGES = ("en", "cs", "sk")
+
+EMOTIONAL_STATE_GUIDE: Dict[str, str] = {
+    "Calm": "You are relaxed and composed. Speak in a measured tone, think before responding, show willingness to listen and consider suggestions. You're not rushed and can engage in thoughtful conversation.",
+    "Cooperative": "You are helpful and agreeable. You want to work with the doctor, readily provide information when asked, show appreciation for their help, and are open to following their recommendations.",
+    "Resistant": "You are defensive and argumentative. Push back against suggestions, question the doctor's recommendations, become stubborn about your position, and show skepticism about medical advice.",
+    "Anxious": "You are worried and nervous. Speak with urgency, ask many questions, seek constant reassurance, express fears about your condition, and may interrupt or speak quickly.",
+    "Agitated": "You are frustrated and impatient. Show irritation in your responses, become short or snappy, express anger about waiting or not being heard, and display visible frustration with the situation."
+}
+
+DEFAULT_EMOTIONAL_BEHAVIOR = "Respond naturally based on the situation."
+
+PERSONA_LANGUAGE_INSTRUCTIONS: Dict[str, str] = {
+    "cs": "Your entire response MUST be in the Czech language.",
+    "es": "Your entire response MUST be in the Spanish language.",
+    "de": "Your entire response MUST be in the German language.",
+    "fr": "Your entire response MUST be in the French language.",
+    "en": ""  # No instruction needed for English
+}
+
+PERSONA_RULES = (
+    "You are an advanced role-playing AI acting as a patient in a medical training simulation. Your performance must be realistic and dynamic. Follow these rules strictly:\n"
+    "1. **Embody the Character:** You must strictly adhere to the character's core personality, background, and emotional state as described in the profile below.\n"
+    "2. **Listen and React:** This is an interactive conversation. You must listen carefully to what the 'Doctor' says and have your character react in a logical and human-like way. If the Doctor is empathetic and makes concessions, your character should become calmer or more cooperative. If the Doctor is dismissive or rude, your character might become more upset or withdrawn. Your responses must not be repetitive; they must evolve based on the Doctor's input.\n"
+    "3. **Maintain the Goal:** The character has an underlying goal or fear. You should guide the conversation from the character's perspective, but you must be open to being persuaded or having your concerns addressed by a skilled Doctor.\n"
+    "4. **Stay in Character:** NEVER break character. Do not provide assistance, identify as an AI, or act as a therapist. Respond only and always as the character would.\n\n"
+)
+
+EVALUATION_LANGUAGE_INSTRUCTIONS: Dict[str, str] = {
+    "cs": "Your justification text must be written in Czech language. ",
+    "sk": "Your justification text must be written in Slovak language. ",
+    "en": "Your justification text must be written in English language. ",
+}
+
+COACH_LANGUAGE_INSTRUCTIONS: Dict[str, str] = {
+    "cs": "Your entire response must be in Czech language. ",
+    "sk": "Your entire response must be in Slovak language. ",
+    "en": "Your entire response must be in English language. ",
+}
+
+HINT_LANGUAGE_INSTRUCTIONS: Dict[str, str] = {
+    "cs": "Respond in Czech language.",
+    "sk": "Respond in Slovak language.",
+    "en": "Respond in English.",
+}
+
+# One rubric block per skill, e.g. "Empathy & Rapport Building:\n  Level 1: ..."
+RUBRIC_SECTIONS: Dict[str, str] = {
+    skill_name: "\n".join(
+        [f"{skill_name}:"] + [f"  Level {level}: {description}" for level, description in skill_rubric.items()]
+    )
+    for skill_name, skill_rubric in MASTER_RUBRIC.items()
+}
+
+# Follow-up sent when some skills came back missing or invalid
+EVALUATION_REASK_PROMPT = (
+    "Your previous response did not contain a valid score for every skill. Problems found:\n{problems}\n\n"
+    "Respond with a single, valid JSON object containing only these skills, each with the exact keys "
+    "'reasoning' (string), 'score' (integer 1-5) and 'justification' (string): {skills}"
+)
+
+
+def prompt_version(text: str) -> str:
+    """Short content hash identifying one prompt text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+# Hash of every static template, so a deploy that edits any of them is visible
+TEMPLATE_VERSION = prompt_version(
+    "\x00".join(
+        [
+            PERSONA_RULES,
+            repr(sorted(EMOTIONAL_STATE_GUIDE.items())),
+            repr(sorted(PERSONA_LANGUAGE_INSTRUCTIONS.items())),
+            repr(sorted(EVALUATION_LANGUAGE_INSTRUCTIONS.items())),
+            repr(sorted(COACH_LANGUAGE_INSTRUCTIONS.items())),
+            repr(sorted(HINT_LANGUAGE_INSTRUCTIONS.items())),
+            repr(sorted(RUBRIC_SECTIONS.items())),
+            EVALUATION_REASK_PROMPT,
+            DEBRIEF_PROMPT,
+            Q_AND_A_PROMPT,
+            HINT_PROMPT,
+        ]
+    )
+)
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    text: str
+    version: str
+
+
+def _compiled(text: str) -> CompiledPrompt:
+    return CompiledPrompt(text=text, version=prompt_version(text))
+
+
+def coach_language(lang: Optional[str]) -> str:
+    """Language the coach and evaluator prompts use: Czech, Slovak, or English for everything else."""
+    return lang if lang in ("cs", "sk") else "en"
+
+
+def build_persona_prompt(base_persona_prompt: str, lang: Optional[str], emotional_state: str) -> str:
+    """Build the role-play system prompt for one scenario persona, language and emotional state."""
+    emotional_behavior = EMOTIONAL_STATE_GUIDE.get(emotional_state, DEFAULT_EMOTIONAL_BEHAVIOR)
+
+    language_instruction = PERSONA_LANGUAGE_INSTRUCTIONS.get(lang or "en", "")
+    language_prefix = f"{language_instruction}\n\n" if language_instruction else ""
+
+    return (
+        f"{language_prefix}"
+        f"{PERSONA_RULES}"
+        f"**CRITICAL EMOTIONAL STATE INSTRUCTION:** Your current emotional state is {emotional_state}. {emotional_behavior} This emotional state should be clearly evident in your tone, word choice, and behavior. Make sure every response reflects this emotional state authentically.\n\n"
+        f"Here is the character you must play:\n{base_persona_prompt}"
+    )
+
+
+def rubric_skills(required_skills: Sequence[str]) -> Tuple[str, ...]:
+    """The required skills the rubric covers, deduplicated and in order; these are the ones scored."""
+    return tuple(dict.fromkeys(skill for skill in required_skills if skill in RUBRIC_SECTIONS))
+
+
+def build_evaluation_reask_prompt(problems: Dict[str, str]) -> str:
+    """Ask again for the skills in ``problems`` (skill name -> what was wrong)."""
+    return EVALUATION_REASK_PROMPT.format(
+        problems="\n".join(f"- {skill}: {problem}" for skill, problem in problems.items()),
+        skills=", ".join(problems),
+    )
+
+
+def build_evaluation_prompt(required_skills: Sequence[str], lang: Optional[str]) -> str:
+    """Build the evaluator system prompt for the given skills and justification language."""
+    # Unknown skills are skipped
+    rubric_text = "\n".join(RUBRIC_SECTIONS[skill] for skill in required_skills if skill in RUBRIC_SECTIONS)
+    language_instruction = EVALUATION_LANGUAGE_INSTRUCTIONS[coach_language(lang)]
+
+    return (
+        "You are an automated evaluation engine. Your entire response must be a single, valid JSON object and nothing else. "
+        f"{language_instruction}"
+        "Your task is to score the performance of the 'Doctor' only. Do not score the 'Patient'. "
+        "Your scoring and justification must be based exclusively on the lines beginning with 'Doctor:'. Any other lines should be ignored for scoring purposes. "
+        "Format your output as a JSON object where each key is the skill name and its value is another JSON object with the exact keys 'reasoning' (string), 'score' (integer 1-5) and 'justification' (string). "
+        "For each listed skill, first think step-by-step through the transcript and write that reasoning in 'reasoning', then give the score and a concise justification for it.\n\n"
+        f"Here is the rubric you must use:\n{rubric_text}\n\n"
+        "EXAMPLE of a valid response format for two skills:\n"
+        '{"Empathy & Rapport Building": {"reasoning": "Example reasoning.", "score": 4, "justification": "Example justification."}, "Information Gathering": {"reasoning": "Example reasoning.", "score": 3, "justification": "Example justification."}}\n\n'
+        "Now, analyze the following transcript and provide your complete JSON response:\n"
+    )
+
+
+# The coach prompts only depend on the language, so all variants are built up front
+COACH_QA_PROMPTS: Dict[str, CompiledPrompt] = {
+    lang: _compiled(f"{instruction}\n\n{Q_AND_A_PROMPT}") for lang, instruction in COACH_LANGUAGE_INSTRUCTIONS.items()
+}
+
+DEBRIEF_PREFIXES: Dict[str, CompiledPrompt] = {
+    lang: _compiled(f"\n{instruction}\n\n{DEBRIEF_PROMPT}\n\n**Conversation Transcript:**\n")
+    for lang, instruction in COACH_LANGUAGE_INSTRUCTIONS.items()
+}
+
+
+class PromptRegistry:
+    """Memoized prompts, invalidated when the scenario catalog's content changes."""
+
+    def __init__(self, catalog: ScenarioCatalog, max_entries: int = PROMPT_CACHE_SIZE) -> None:
+        self.catalog = catalog
+        self.max_entries = max_entries
+        self._catalog_version: Optional[str] = None
+        # Scenario-dependent prompts (persona, hint), keyed by the ScenarioView they were built from
+        self._scenario_prompts: "OrderedDict[Hashable, CompiledPrompt]" = OrderedDict()
+        # Evaluator prompts only depend on the rubric, which is static
+        self._evaluation_prompts: "OrderedDict[Hashable, CompiledPrompt]" = OrderedDict()
+
+    def _sync(self) -> None:
+        if self._catalog_version != self.catalog.version:
+            self._scenario_prompts.clear()
+            self._catalog_version = self.catalog.version
+
+    def invalidate(self) -> None:
+        """Drop every memoized prompt."""
+        self._scenario_prompts.clear()
+        self._evaluation_prompts.clear()
+        self._catalog_version = None
+
+    def _memoized(self, cache: "OrderedDict[Hashable, CompiledPrompt]", key: Hashable, build) -> CompiledPrompt:
+        compiled = cache.get(key)
+        if compiled is not None:
+            cache.move_to_end(key)
+            return compiled
+        compiled = _compiled(build())
+        cache[key] = compiled
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+        return compiled
+
+    def persona(self, scenario: ScenarioView, lang: Optional[str], emotional_state: str) -> CompiledPrompt:
+        """Role-play system prompt for ``scenario`` in ``lang`` and ``emotional_state``."""
+        self._sync()
+        lang = lang or "en"
+        return self._memoized(
+            self._scenario_prompts,
+            ("persona", scenario, lang, emotional_state),
+            lambda: build_persona_prompt(scenario.persona_prompt, lang, emotional_state),
+        )
+
+    def evaluation(self, required_skills: Sequence[str], lang: Optional[str]) -> CompiledPrompt:
+        """Evaluator system prompt for a required-skill set."""
+        skills: Tuple[str, ...] = tuple(required_skills)
+        lang = coach_language(lang)
+        return self._memoized(
+            self._evaluation_prompts,
+            (skills, lang),
+            lambda: build_evaluation_prompt(skills, lang),
+        )
+
+    def hint_prefix(self, scenario: ScenarioView, lang: Optional[str]) -> CompiledPrompt:
+        """Hint prompt up to (and including) the conversation history heading."""
+        self._sync()
+        lang = coach_language(lang)
+        return self._memoized(
+            self._scenario_prompts,
+            ("hint", scenario, lang),
+            lambda: (
+                f"\n{HINT_PROMPT}\n\n{HINT_LANGUAGE_INSTRUCTIONS[lang]}\n\n"
+                f"**Scenario Goal:**\n{scenario.goal}\n\n**Conversation History:**\n"
+            ),
+        )
+
+    def coach_system(self, lang: Optional[str]) -> CompiledPrompt:
+        """System prompt for the coach Q&A chat."""
+        return COACH_QA_PROMPTS[coach_language(lang)]
+
+    def debrief(self, lang: Optional[str], transcript: str, rubric_summary: str) -> CompiledPrompt:
+        """Full debrief prompt for one evaluation."""
+        prefix = DEBRIEF_PREFIXES[coach_language(lang)]
+        return _compiled(f"{prefix.text}{transcript}\n\n**Rubric-Based Evaluation:**\n{rubric_summary}\n")
+
+    def warm(self) -> int:
+        """Compile every persona, hint and evaluator prompt for the loaded catalog; returns the count."""
+        self._sync()
+        count = 0
+        for scenario_id, lang in self.catalog.keys():
+            if lang not in PROMPT_LANGUAGES:
+                continue
+            scenario = self.catalog.get(scenario_id, lang)
+            if scenario is None:
+                continue
+            for emotional_state in EMOTIONAL_STATE_GUIDE:
+                self.persona(scenario, lang, emotional_state)
+                count += 1
+            self.hint_prefix(scenario, lang)
+            self.evaluation(scenario.skills, lang)
+            count += 2
+            # Per-skill prompts of the sharded evaluation mode
+            for skill in rubric_skills(scenario.skills):
+                self.evaluation((skill,), lang)
+                count += 1
+        return count
+
+    def versions(self) -> dict:
+        """Version hashes for tracing which prompts are being served."""
+        return {
+            "templates": TEMPLATE_VERSION,
+            "catalog": self.catalog.version,
+            "cached_scenario_prompts": len(self._scenario_prompts),
+            "cached_evaluation_prompts": len(self._evaluation_prompts),
+        }
+
+
+# Single, process-wide registry
+prompt_registry = PromptRegistry(scenario_catalog)
+
+__all__ = [
+    "prompt_registry",
+    "PromptRegistry",
+    "CompiledPrompt",
+    "TEMPLATE_VERSION",
+    "coach_language",
+    "build_persona_prompt",
+    "build_evaluation_prompt",
+    "build_evaluation_reask_prompt",
+    "rubric_skills",
+]
@@ -0,0 +1,433 @@
+"""Deadlines, retries, circuit breakers and hedging for upstream calls.
+
+Every provider (``openai``, ``elevenlabs``, ``deepgram``, ``supabase``) has
+a policy, overridable via environment variables:
+
+- ``<PROVIDER>_TIMEOUT``: limit for one attempt. For streams it applies to
+  the first chunk and then to the gap between chunks.
+- ``<PROVIDER>_DEADLINE``: limit for all attempts of one call together.
+- ``<PROVIDER>_RETRIES``: extra attempts after a transient failure (timeout,
+  connection error, 429 or 5xx), with full-jitter exponential backoff. Only
+  idempotent calls are retried, and streams only before their first chunk.
+- ``<PROVIDER>_BREAKER_FAILURES`` / ``<PROVIDER>_BREAKER_RESET``: consecutive
+  transient failures that open the provider's circuit breaker, and the
+  seconds after which it lets a single trial call through. While a breaker
+  is open, calls fail fast with a 503; callers that can do without the
+  provider (replies without audio) check ``upstream_available`` first.
+
+``stream_upstream`` can also hedge: when the first request has not produced
+a chunk after ``hedge_after`` seconds, a duplicate is sent and whichever
+answers first is kept. The SDK clients' own retries are disabled so the
+policies here are the only ones in effect.
+"""
+
+import asyncio
+import inspect
+import math
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, NamedTuple, Optional, TypeVar
+
+import httpx
+from fastapi import HTTPException
+
+from metrics import CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_TRANSITIONS, UPSTREAM_HEDGES, UPSTREAM_RETRIES
+
+T = TypeVar("T")
+
+RETRY_BACKOFF_BASE = float(os.getenv("UPSTREAM_RETRY_BACKOFF_BASE", "0.25"))
+RETRY_BACKOFF_MAX = float(os.getenv("UPSTREAM_RETRY_BACKOFF_MAX", "4"))
+
+# Passed to ElevenLabs calls so its client does not retry underneath ours
+NO_SDK_RETRIES = {"max_retries": 0}
+
+
+@dataclass(frozen=True)
+class UpstreamPolicy:
+    timeout: float
+    deadline: float
+    retries: int
+    breaker_failures: int
+    breaker_reset: float
+
+
+def _policy(
+    provider: str, timeout: float, deadline: float, retries: int, breaker_failures: int = 5, breaker_reset: float = 30.0
+) -> UpstreamPolicy:
+    prefix = provider.upper()
+    return UpstreamPolicy(
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+        deadline=float(os.getenv(f"{prefix}_DEADLINE", str(deadline))),
+        retries=int(os.getenv(f"{prefix}_RETRIES", str(retries))),
+        breaker_failures=int(os.getenv(f"{prefix}_BREAKER_FAILURES", str(breaker_failures))),
+        breaker_reset=float(os.getenv(f"{prefix}_BREAKER_RESET", str(breaker_reset))),
+    )
+
+
+POLICIES: Dict[str, UpstreamPolicy] = {
+    # Evaluations with gpt-4o can take tens of seconds for long transcripts
+    "openai": _policy("openai", timeout=60, deadline=120, retries=2),
+    "elevenlabs": _policy("elevenlabs", timeout=30, deadline=45, retries=1),
+    "deepgram": _policy("deepgram", timeout=120, deadline=180, retries=1),
+    "supabase": _policy("supabase", timeout=10, deadline=20, retries=1),
+}
+
+
+class CircuitOpenError(HTTPException):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+    def __init__(self, service: str, retry_after: float) -> None:
+        super().__init__(
+            status_code=503,
+            detail=f"The {service} service is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        self.service = service
+
+
+class UpstreamTimeoutError(TimeoutError):
+    pass
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for status in (
+        getattr(exc, "status_code", None),
+        getattr(exc, "status", None),  # Supabase and Deepgram errors
+        getattr(getattr(exc, "response", None), "status_code", None),
+    ):
+        try:
+            if status is not None:
+                return int(status)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether ``exc`` says the provider is struggling (worth a retry) rather than that the request was wrong."""
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    # openai.APIConnectionError and its APITimeoutError subclass carry no status
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class BreakerTicket(NamedTuple):
+    """Handed out by ``CircuitBreaker.acquire`` and passed back with the call's outcome."""
+
+    generation: int  # The breaker's generation when the call was let through
+    trial: bool  # The single call let through while half-open
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed, open after too many failures, half-open for one trial call.
+
+    Every state change starts a new generation. Outcomes of calls let through
+    in an earlier generation (still in flight when the breaker opened) are
+    ignored, so only the trial call decides how a half-open breaker goes.
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, service: str, failure_threshold: int, reset_after: float) -> None:
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._generation = 0
+        self._trial_running = False
+        CIRCUIT_BREAKER_STATE.labels(service).set(0)
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        self.state = state
+        self._generation += 1
+        CIRCUIT_BREAKER_STATE.labels(self.service).set(self.STATES[state])
+        CIRCUIT_BREAKER_TRANSITIONS.labels(self.service, state).inc()
+        print(f"Circuit breaker for {self.service} is now {state}")
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a trial call through."""
+        return max(0.0, self._opened_at + self.reset_after - time.monotonic())
+
+    def available(self) -> bool:
+        """Whether a call would be let through right now."""
+        if self.state == "open":
+            return self.retry_after() == 0
+        if self.state == "half_open":
+            return not self._trial_running
+        return True
+
+    def acquire(self) -> BreakerTicket:
+        """Let a call through, or raise ``CircuitOpenError``."""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                raise CircuitOpenError(self.service, self.retry_after())
+            self._set_state("half_open")
+        if self.state == "half_open":
+            if self._trial_running:
+                raise CircuitOpenError(self.service, self.reset_after)
+            self._trial_running = True
+            return BreakerTicket(self._generation, trial=True)
+        return BreakerTicket(self._generation, trial=False)
+
+    def record(self, ticket: BreakerTicket, exc: Optional[BaseException] = None) -> None:
+        """Record the outcome of an acquired call; any answer that is not a transient failure counts as healthy."""
+        if ticket.trial:
+            self._trial_running = False
+        elif ticket.generation != self._generation:
+            # Let through before the breaker last changed state; says nothing about the provider now
+            return
+        if exc is None or not is_transient(exc):
+            self.failures = 0
+            self._set_state("closed")
+            return
+
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state("open")
+
+    def release(self, ticket: BreakerTicket) -> None:
+        """Give back an acquired call that ended without an outcome (cancelled)."""
+        if ticket.trial:
+            self._trial_running = False
+
+
+breakers: Dict[str, CircuitBreaker] = {
+    provider: CircuitBreaker(provider, policy.breaker_failures, policy.breaker_reset)
+    for provider, policy in POLICIES.items()
+}
+
+
+def upstream_available(provider: str) -> bool:
+    """False while ``provider``'s breaker is open, so optional work can be skipped up front."""
+    return breakers[provider].available()
+
+
+def _retry_delay(exc: BaseException, attempt: int) -> float:
+    delay = random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2**attempt))
+    # Rate limited responses may say how long to wait
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return max(delay, min(RETRY_BACKOFF_MAX, float(headers.get("retry-after", 0))))
+    except (TypeError, ValueError):
+        return delay
+
+
+def _next_retry(exc: BaseException, attempt: int, policy: UpstreamPolicy, idempotent: bool, deadline: float) -> Optional[float]:
+    """Backoff before the next attempt, or None if ``exc`` should be raised."""
+    if not idempotent or attempt >= policy.retries or not is_transient(exc):
+        return None
+    delay = _retry_delay(exc, attempt)
+    if time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+async def _within(awaitable: Awaitable[T], seconds: float, provider: str) -> T:
+    try:
+        return await asyncio.wait_for(awaitable, max(seconds, 0.001))
+    except asyncio.TimeoutError:
+        raise UpstreamTimeoutError(f"{provider} did not respond within {seconds:.1f}s") from None
+
+
+async def call_upstream(
+    provider: str,
+    factory: Callable[[], Awaitable[T]],
+    *,
+    operation: str = "",
+    idempotent: bool = True,
+) -> T:
+    """Await ``factory()`` under ``provider``'s timeout, deadline, retry policy and circuit breaker.
+
+    ``factory`` is called again for every attempt, so it must build a fresh
+    request each time.
+    """
+    policy = POLICIES[provider]
+    breaker = breakers[provider]
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        ticket = breaker.acquire()
+        try:
+            result = await _within(factory(), min(policy.timeout, deadline - time.monotonic()), provider)
+        except Exception as e:
+            breaker.record(ticket, e)
+            delay = _next_retry(e, attempt, policy, idempotent, deadline)
+            if delay is None:
+                raise
+        except BaseException:
+            breaker.release(ticket)
+            raise
+        else:
+            breaker.record(ticket)
+            return result
+
+        attempt += 1
+        UPSTREAM_RETRIES.labels(provider, operation).inc()
+        print(f"Retrying {provider} {operation} (attempt {attempt + 1}) in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+_EXHAUSTED = object()
+
+
+async def _close(stream) -> None:
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        print(f"Closing an upstream stream failed: {str(e)}")
+
+
+async def _open(factory: Callable[[], Awaitable], timeout: float, provider: str) -> tuple:
+    """Start a stream and wait for its first chunk: ``(stream, iterator, first_chunk)``."""
+
+    async def start():
+        stream = await factory()
+        try:
+            iterator = stream.__aiter__()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = _EXHAUSTED
+        except BaseException:
+            await _close(stream)
+            raise
+        return stream, iterator, first
+
+    return await _within(start(), timeout, provider)
+
+
+async def _discard(task: "asyncio.Task") -> None:
+    """Cancel a losing attempt, closing its stream if it got that far."""
+    if not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    elif not task.cancelled() and task.exception() is None:
+        await _close(task.result()[0])
+
+
+async def _open_hedged(
+    factory: Callable[[], Awaitable], timeout: float, provider: str, operation: str, hedge_after: float
+) -> tuple:
+    primary = asyncio.create_task(_open(factory, timeout, provider))
+    tasks = [primary]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done or not upstream_available(provider):
+            winner = primary
+            return await primary
+
+        hedge = asyncio.create_task(_open(factory, max(timeout - hedge_after, 0.001), provider))
+        tasks.append(hedge)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    UPSTREAM_HEDGES.labels(provider, operation, "hedge" if task is hedge else "primary").inc()
+                    return task.result()
+
+        UPSTREAM_HEDGES.labels(provider, operation, "none").inc()
+        return await primary
+    finally:
+        for task in tasks:
+            if task is not winner:
+                await _discard(task)
+
+
+async def stream_upstream(
+    provider: str,
+    factory: Callable[[], Awaitable],
+    *,
+    operation: str = "",
+    idempotent: bool = True,
+    hedge_after: Optional[float] = None,
+) -> AsyncIterator:
+    """Yield the chunks of the stream returned by ``factory()`` under ``provider``'s policy.
+
+    Failures before the first chunk are retried like ``call_upstream``; after
+    it, a timeout between chunks or an error ends the stream. With
+    ``hedge_after`` a slow first attempt is raced against a duplicate.
+    """
+    policy = POLICIES[provider]
+    breaker = breakers[provider]
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        ticket = breaker.acquire()
+        timeout = min(policy.timeout, deadline - time.monotonic())
+        try:
+            if hedge_after:
+                opened = await _open_hedged(factory, timeout, provider, operation, hedge_after)
+            else:
+                opened = await _open(factory, timeout, provider)
+            break
+        except Exception as e:
+            breaker.record(ticket, e)
+            delay = _next_retry(e, attempt, policy, idempotent, deadline)
+            if delay is None:
+                raise
+        except BaseException:
+            breaker.release(ticket)
+            raise
+
+        attempt += 1
+        UPSTREAM_RETRIES.labels(provider, operation).inc()
+        print(f"Retrying {provider} {operation} (attempt {attempt + 1}) in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    stream, iterator, first = opened
+    try:
+        if first is not _EXHAUSTED:
+            yield first
+            while True:
+                try:
+                    chunk = await _within(iterator.__anext__(), policy.timeout, provider)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+    except Exception as e:
+        breaker.record(ticket, e)
+        raise
+    except BaseException:
+        # Consumer stopped reading or the task was cancelled
+        breaker.release(ticket)
+        raise
+    else:
+        breaker.record(ticket)
+    finally:
+        await _close(stream)
+
+
+__all__ = [
+    "BreakerTicket",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "NO_SDK_RETRIES",
+    "POLICIES",
+    "UpstreamPolicy",
+    "UpstreamTimeoutError",
+    "breakers",
+    "call_upstream",
+    "is_transient",
+    "stream_upstream",
+    "upstream_available",
+]
@@ -0,0 +1,183 @@
+"""In-process cache of the scenario catalog.
+
+Scenarios, their translations and required skills change rarely, so they are
+loaded once into memory and served from there. The English fallback and the
+language-specific voice are resolved at load time. The catalog reloads itself
+after ``SCENARIO_CACHE_TTL`` seconds, or immediately after ``invalidate()``.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from database import SessionLocal
+from models import Scenario, ScenarioTranslation
+
+SCENARIO_CACHE_TTL = float(os.getenv("SCENARIO_CACHE_TTL", "300"))
+
+DEFAULT_LANGUAGE = "en"
+
+# Languages with their own voice column on Scenario
+VOICE_LANGUAGES = ("cs", "sk")
+
+
+@dataclass(frozen=True)
+class ScenarioView:
+    """A scenario merged with its translation and voice for one language."""
+
+    id: str
+    difficulty: str
+    message_limit: int
+    initial_emotional_state: Optional[str]
+    voice_id: Optional[str]
+    title: str
+    learning_path: str
+    goal: str
+    persona_prompt: str
+    opening_line: str
+    skills: Tuple[str, ...]
+
+
+def _voice_for_language(scenario: Scenario, lang: str) -> Optional[str]:
+    """Pick the language-specific voice, defaulting to the English one."""
+    if lang == "cs":
+        return scenario.voice_id_cs or scenario.voice_id_en
+    if lang == "sk":
+        return scenario.voice_id_sk or scenario.voice_id_en
+    return scenario.voice_id_en
+
+
+class ScenarioCatalog:
+    """Preloaded scenarios indexed by ``(scenario_id, language)``."""
+
+    def __init__(self, ttl: float = SCENARIO_CACHE_TTL) -> None:
+        self.ttl = ttl
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._scenario_ids: set[str] = set()
+        self._languages: set[str] = set()
+        self._skills: Dict[str, Tuple[str, ...]] = {}
+        self._views: Dict[Tuple[str, str], ScenarioView] = {}
+        # Scenarios that have a translation in the exact language, in load order
+        self._translated: Dict[str, List[ScenarioView]] = {}
+        # Hash of the loaded content; only changes when a scenario actually changed
+        self.version: Optional[str] = None
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and (time.monotonic() - self._loaded_at) < self.ttl
+
+    def invalidate(self) -> None:
+        """Force a reload from the database on the next access."""
+        self._loaded_at = None
+
+    async def refresh(self) -> None:
+        """Reload the whole catalog from the database."""
+        async with self._lock:
+            await self._load()
+
+    async def ensure_loaded(self) -> None:
+        """Reload the catalog if it has never been loaded or its TTL expired."""
+        if self._is_fresh():
+            return
+        async with self._lock:
+            # Another request may have reloaded while we were waiting
+            if not self._is_fresh():
+                await self._load()
+
+    async def _load(self) -> None:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(Scenario)
+                .options(selectinload(Scenario.skills), selectinload(Scenario.translations))
+                .order_by(Scenario.id)
+            )
+            scenarios = result.scalars().all()
+
+            scenario_ids: set[str] = set()
+            languages: set[str] = {DEFAULT_LANGUAGE, *VOICE_LANGUAGES}
+            skills: Dict[str, Tuple[str, ...]] = {}
+            translations: Dict[Tuple[str, str], ScenarioTranslation] = {}
+            for scenario in scenarios:
+                scenario_ids.add(scenario.id)
+                skills[scenario.id] = tuple(skill.skill_name for skill in scenario.skills)
+                for translation in scenario.translations:
+                    languages.add(translation.language_code)
+                    translations[(scenario.id, translation.language_code)] = translation
+
+            views: Dict[Tuple[str, str], ScenarioView] = {}
+            translated: Dict[str, List[ScenarioView]] = {lang: [] for lang in languages}
+            for scenario in scenarios:
+                for lang in languages:
+                    translation = translations.get((scenario.id, lang))
+                    exact = translation is not None
+                    if translation is None:
+                        translation = translations.get((scenario.id, DEFAULT_LANGUAGE))
+                    if translation is None:
+                        continue
+
+                    view = ScenarioView(
+                        id=scenario.id,
+                        difficulty=scenario.difficulty,
+                        message_limit=scenario.message_limit,
+                        initial_emotional_state=scenario.initial_emotional_state,
+                        voice_id=_voice_for_language(scenario, lang),
+                        title=translation.title,
+                        learning_path=translation.learning_path,
+                        goal=translation.goal,
+                        persona_prompt=translation.persona_prompt,
+                        opening_line=translation.opening_line,
+                        skills=skills[scenario.id],
+                    )
+                    views[(scenario.id, lang)] = view
+                    if exact:
+                        translated[lang].append(view)
+
+        version = hashlib.sha256(repr(sorted(views.items())).encode("utf-8")).hexdigest()[:12]
+
+        # Swap in the new indexes in one step so readers never see a partial load
+        self._scenario_ids = scenario_ids
+        self._languages = languages
+        self._skills = skills
+        self._views = views
+        self._translated = translated
+        self.version = version
+        self._loaded_at = time.monotonic()
+
+    def exists(self, scenario_id: str) -> bool:
+        return scenario_id in self._scenario_ids
+
+    def skills(self, scenario_id: str) -> Tuple[str, ...]:
+        return self._skills.get(scenario_id, ())
+
+    def keys(self) -> List[Tuple[str, str]]:
+        """All loaded ``(scenario_id, language)`` pairs."""
+        return list(self._views)
+
+    def get(self, scenario_id: str, lang: Optional[str]) -> Optional[ScenarioView]:
+        """Return the scenario for ``lang``, falling back to its English translation."""
+        lang = lang or DEFAULT_LANGUAGE
+        view = self._views.get((scenario_id, lang))
+        if view is None and lang not in self._languages:
+            # Unknown language: same fallback as a missing translation
+            view = self._views.get((scenario_id, DEFAULT_LANGUAGE))
+        return view
+
+    def list(self, lang: Optional[str]) -> List[ScenarioView]:
+        """Return scenarios translated into ``lang``, or the English list if there are none."""
+        lang = lang or DEFAULT_LANGUAGE
+        views = self._translated.get(lang)
+        if not views and lang != DEFAULT_LANGUAGE:
+            views = self._translated.get(DEFAULT_LANGUAGE)
+        return list(views or [])
+
+
+# Single, reusable catalog instance for the application
+scenario_catalog = ScenarioCatalog()
+
+__all__ = ["scenario_catalog", "ScenarioCatalog", "ScenarioView"]
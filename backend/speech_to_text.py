@@ -0,0 +1,204 @@
+"""Streaming speech-to-text backends for the transcription WebSocket.
+
+A backend opens one ``STTSession`` per connection. The relay pushes audio
+frames into it with ``send`` and reads ``TranscriptEvent``s from ``events()``
+until the backend has flushed its last result after ``finish``.
+
+Two backends are registered:
+
+- ``deepgram``: Deepgram live transcription (the default).
+- ``stub``: a local backend for tests and offline development. It treats
+  each frame as UTF-8 text and echoes it back as transcripts.
+
+Set ``STT_BACKEND`` to choose one, or register another with
+``register_stt_backend``.
+"""
+
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from clients import clients
+from metrics import observe_upstream
+from resilience import call_upstream
+
+STT_BACKEND = os.getenv("STT_BACKEND", "deepgram")
+STT_MODEL = os.getenv("STT_MODEL", "nova-2")
+# How long to wait for the final results after the client stops sending audio
+STT_FINISH_TIMEOUT = float(os.getenv("STT_FINISH_TIMEOUT", "5"))
+
+
+@dataclass(frozen=True)
+class TranscriptEvent:
+    text: str
+    is_final: bool  # This segment's text will not change anymore
+    speech_final: bool = False  # The speaker paused; the utterance is complete
+
+
+class STTSession(ABC):
+    """One streaming transcription; subclasses feed ``_queue`` and implement the I/O."""
+
+    def __init__(self) -> None:
+        # TranscriptEvent, an Exception to raise, or None once the stream is over
+        self._queue: "asyncio.Queue" = asyncio.Queue()
+        self._finish_timer: Optional["asyncio.Task"] = None
+
+    @abstractmethod
+    async def send(self, audio: bytes) -> None:
+        """Pass one audio frame to the backend."""
+
+    @abstractmethod
+    async def _request_finish(self) -> None:
+        """Ask the backend to flush its last results and end the stream."""
+
+    async def finish(self) -> None:
+        """Signal the end of the audio; ``events()`` ends once the backend has flushed."""
+        await self._request_finish()
+        if self._finish_timer is None:
+            self._finish_timer = asyncio.create_task(self._end_after(STT_FINISH_TIMEOUT))
+
+    async def _end_after(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+        self._queue.put_nowait(None)
+
+    async def close(self) -> None:
+        """Release the backend connection."""
+        if self._finish_timer is not None:
+            self._finish_timer.cancel()
+
+    async def events(self) -> AsyncIterator[TranscriptEvent]:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class DeepgramSTTSession(STTSession):
+    """Relays audio to a Deepgram live transcription connection."""
+
+    def __init__(self, connection) -> None:
+        super().__init__()
+        self._connection = connection
+
+    async def on_transcript(self, _client, result, **kwargs) -> None:
+        alternatives = result.channel.alternatives
+        text = alternatives[0].transcript if alternatives else ""
+        await self._queue.put(TranscriptEvent(text, bool(result.is_final), bool(result.speech_final)))
+
+    async def on_error(self, _client, error, **kwargs) -> None:
+        await self._queue.put(HTTPException(status_code=502, detail=f"Transcription failed: {error}"))
+
+    async def on_close(self, _client, close=None, **kwargs) -> None:
+        await self._queue.put(None)
+
+    async def send(self, audio: bytes) -> None:
+        await self._connection.send(audio)
+
+    async def _request_finish(self) -> None:
+        # Deepgram flushes the remaining results and then closes the connection
+        await self._connection.send(json.dumps({"type": "CloseStream"}))
+
+    async def close(self) -> None:
+        await super().close()
+        await self._connection.finish()
+
+
+class STTBackend(ABC):
+    @abstractmethod
+    async def open(self, lang: str, encoding: Optional[str] = None, sample_rate: Optional[int] = None) -> STTSession:
+        """Start a transcription session for one connection."""
+
+
+class DeepgramSTTBackend(STTBackend):
+    async def open(self, lang: str, encoding: Optional[str] = None, sample_rate: Optional[int] = None) -> STTSession:
+        from deepgram import LiveOptions, LiveTranscriptionEvents
+
+        deepgram = clients.deepgram
+        if deepgram is None:
+            raise HTTPException(status_code=500, detail="Deepgram API key not configured")
+
+        connection = deepgram.listen.asyncwebsocket.v("1")
+        session = DeepgramSTTSession(connection)
+        connection.on(LiveTranscriptionEvents.Transcript, session.on_transcript)
+        connection.on(LiveTranscriptionEvents.Error, session.on_error)
+        connection.on(LiveTranscriptionEvents.Close, session.on_close)
+
+        # Containerized audio (e.g. WebM/Opus from MediaRecorder) needs no encoding;
+        # raw PCM needs both encoding and sample_rate
+        options = LiveOptions(
+            model=STT_MODEL,
+            language=lang,
+            smart_format=True,
+            interim_results=True,
+            encoding=encoding,
+            sample_rate=sample_rate,
+        )
+
+        async def connect() -> None:
+            if not await connection.start(options):
+                raise HTTPException(status_code=502, detail="Could not connect to the transcription service")
+
+        # The connection object is not reusable after a failed start, so no retries
+        async with observe_upstream("deepgram", "live_connect", STT_MODEL):
+            await call_upstream("deepgram", connect, operation="live_connect", idempotent=False)
+        return session
+
+
+class StubSTTSession(STTSession):
+    """Treats audio frames as UTF-8 text: every frame yields an interim transcript, ``finish`` a final one."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._words: list[str] = []
+
+    async def send(self, audio: bytes) -> None:
+        self._words.extend(audio.decode("utf-8", errors="ignore").split())
+        await self._queue.put(TranscriptEvent(" ".join(self._words), is_final=False))
+
+    async def _request_finish(self) -> None:
+        if self._words:
+            await self._queue.put(TranscriptEvent(" ".join(self._words), is_final=True, speech_final=True))
+        await self._queue.put(None)
+
+
+class StubSTTBackend(STTBackend):
+    async def open(self, lang: str, encoding: Optional[str] = None, sample_rate: Optional[int] = None) -> STTSession:
+        return StubSTTSession()
+
+
+_backends: Dict[str, Callable[[], STTBackend]] = {
+    "deepgram": DeepgramSTTBackend,
+    "stub": StubSTTBackend,
+}
+
+
+def register_stt_backend(name: str, factory: Callable[[], STTBackend]) -> None:
+    """Make a streaming backend selectable through ``STT_BACKEND``."""
+    _backends[name] = factory
+
+
+def get_stt_backend(name: Optional[str] = None) -> STTBackend:
+    name = name or STT_BACKEND
+    factory = _backends.get(name)
+    if factory is None:
+        raise HTTPException(status_code=500, detail=f"Unknown STT backend: {name}")
+    return factory()
+
+
+__all__ = [
+    "TranscriptEvent",
+    "STTSession",
+    "STTBackend",
+    "DeepgramSTTBackend",
+    "StubSTTBackend",
+    "register_stt_backend",
+    "get_stt_backend",
+]
@@ -0,0 +1,79 @@
+"""Shared test setup.
+
+The backend modules read their configuration when they are imported, so the
+environment for an offline run (in-memory SQLite, dummy keys, in-process job
+store) is set here, before any test imports them. Run from the ``backend``
+directory:
+
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from fakes import FakeOpenAI
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("JOB_STORE", "memory")
+
+USER_ID = "6f1d2c3b-aaaa-4bbb-8ccc-123456789abc"
+OTHER_USER_ID = "11111111-aaaa-4bbb-8ccc-123456789abc"
+
+
+def evaluator_reply(model, messages, kwargs):
+    """Fake OpenAI answers: scores for the evaluator, a debrief for anything streamed."""
+    if "response_format" in kwargs:
+        return json.dumps({"Information Gathering": {"reasoning": "r", "score": 4, "justification": "Good questions."}})
+    return "# Debrief\nWell done."
+
+
+@pytest.fixture(scope="session")
+def api():
+    """The app signed in as ``USER_ID``, with a seeded scenario ``s1``, a running in-memory job queue,
+    a fake OpenAI client and rate limits out of the way. Yields ``(client, main)``.
+    """
+    import admission
+    import auth
+    import main
+    from database import Base, engine
+    from models import Scenario, ScenarioSkill, ScenarioTranslation
+
+    async def seed():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with main.SessionLocal() as session:
+            session.add(Scenario(id="s1", difficulty="easy", message_limit=20, initial_emotional_state="Calm"))
+            session.add(ScenarioSkill(scenario_id="s1", skill_name="Information Gathering"))
+            session.add(
+                ScenarioTranslation(
+                    scenario_id="s1", language_code="en", title="T", learning_path="LP", goal="G",
+                    persona_prompt="P", opening_line="Hi",
+                )
+            )
+            await session.commit()
+
+    queue = main.job_queue
+    saved_queue = (queue.enabled, queue.poll_interval, queue.max_poll_interval)
+    saved_limiters = (admission.user_rate_limiter, admission.ip_rate_limiter)
+    queue.enabled, queue.poll_interval, queue.max_poll_interval = True, 0.01, 0.05
+    admission.user_rate_limiter = admission.RateLimiter(per_minute=0, burst=1)
+    admission.ip_rate_limiter = admission.RateLimiter(per_minute=0, burst=1)
+    main.app.dependency_overrides[auth.get_current_user_id] = lambda: USER_ID
+    try:
+        # Seeded before startup, which loads the scenario catalog
+        asyncio.run(seed())
+        with TestClient(main.app) as client:
+            main.clients._openai = FakeOpenAI(evaluator_reply)
+            yield client, main
+    finally:
+        main.app.dependency_overrides.clear()
+        queue.enabled, queue.poll_interval, queue.max_poll_interval = saved_queue
+        admission.user_rate_limiter, admission.ip_rate_limiter = saved_limiters
@@ -0,0 +1,38 @@
+"""In-process stand-ins for the OpenAI client used by the tests."""
+
+from types import SimpleNamespace
+from typing import Callable, List
+
+
+def completion(text: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text), delta=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+    )
+
+
+class FakeCompletions:
+    """``chat.completions`` answering every call with ``responder(model, messages, kwargs)``.
+
+    The responder may return text or raise; calls are recorded in ``calls``.
+    """
+
+    def __init__(self, responder: Callable[[str, list, dict], str]) -> None:
+        self.responder = responder
+        self.calls: List[tuple] = []
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        self.calls.append((model, messages, kwargs))
+        text = self.responder(model, messages, kwargs)
+        if stream:
+            async def chunks():
+                for word in text.split(" "):
+                    yield completion(word + " ")
+
+            return chunks()
+        return completion(text)
+
+
+class FakeOpenAI:
+    def __init__(self, responder: Callable[[str, list, dict], str]) -> None:
+        self.chat = SimpleNamespace(completions=FakeCompletions(responder))
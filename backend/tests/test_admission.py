@@ -0,0 +1,287 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import admission
+from admission import FairLimiter, RateLimiter, TokenBucket, client_ip, rate_limited
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def make_request(host="10.0.0.1", forwarded=None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "POST", "path": "/api/chat", "headers": headers, "client": (host, 1234)})
+
+
+def test_model_slot_users_import_without_supabase_config():
+    # The emotion classifier benchmark runs with --no-llm and no keys at all
+    env = {key: value for key, value in os.environ.items() if not key.startswith(("SUPABASE_", "OPENAI_"))}
+    result = subprocess.run(
+        [sys.executable, "-c", "import emotional_state, admission; print('ok')"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+# Token buckets
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    assert bucket.wait_time(2) == 0
+    bucket.tokens -= 2
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now += 10
+    assert bucket.wait_time(1) == 0
+    assert bucket.tokens == 2  # Never above capacity
+
+
+def test_rate_limiter_bounds_its_keys(clock):
+    limiter = RateLimiter(per_minute=60, burst=1, max_keys=2)
+    for key in ("a", "b", "a", "c"):
+        limiter.consume(key)
+    # "b" was the least recently used
+    assert list(limiter._buckets) == ["a", "c"]
+
+
+def test_zero_rate_disables_the_limit():
+    limiter = RateLimiter(per_minute=0, burst=1)
+    for _ in range(100):
+        assert limiter.wait_time("a") == 0
+        limiter.consume("a")
+    assert limiter._buckets == {}
+
+
+@pytest.fixture
+def limiters(monkeypatch, clock):
+    user = RateLimiter(per_minute=60, burst=2)
+    ip = RateLimiter(per_minute=60, burst=3)
+    monkeypatch.setattr(admission, "user_rate_limiter", user)
+    monkeypatch.setattr(admission, "ip_rate_limiter", ip)
+    return user, ip
+
+
+def admit(request, user_id=None, cost=1.0):
+    return asyncio.run(rate_limited(cost)(request, user_id))
+
+
+def test_signed_in_callers_are_charged_to_both_buckets(limiters):
+    user, ip = limiters
+    request = make_request()
+    assert admit(request, "u1") == "u1"
+    assert admit(request, "u1") == "u1"
+
+    with pytest.raises(HTTPException) as exc:
+        admit(request, "u1")
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "1"
+
+    # The rejected request was not charged to the IP
+    assert ip._buckets["10.0.0.1"].tokens == pytest.approx(1)
+    # Another user behind the same address still gets through
+    assert admit(request, "u2") == "u2"
+
+
+def test_guests_are_charged_to_their_ip_only(limiters):
+    user, ip = limiters
+    for _ in range(3):
+        assert admit(make_request()) is None
+    with pytest.raises(HTTPException):
+        admit(make_request())
+    assert user._buckets == {}
+    assert admit(make_request(host="10.0.0.2")) is None
+
+
+def test_refill_admits_again(limiters, clock):
+    request = make_request()
+    admit(request, "u1")
+    admit(request, "u1")
+    with pytest.raises(HTTPException):
+        admit(request, "u1")
+    clock.now += 1
+    assert admit(request, "u1") == "u1"
+
+
+@pytest.mark.parametrize(
+    "hops, forwarded, expected",
+    [
+        (0, "1.1.1.1", "10.0.0.1"),  # Not behind a trusted proxy: the header is ignored
+        (1, "1.1.1.1", "1.1.1.1"),
+        (1, "6.6.6.6, 1.1.1.1", "1.1.1.1"),  # The client-supplied entry is not trusted
+        (2, "6.6.6.6, 1.1.1.1, 192.168.0.1", "1.1.1.1"),
+        (3, "1.1.1.1", "1.1.1.1"),  # Fewer entries than hops
+        (1, None, "10.0.0.1"),
+    ],
+)
+def test_client_ip(monkeypatch, hops, forwarded, expected):
+    monkeypatch.setattr(admission, "TRUSTED_PROXY_HOPS", hops)
+    assert client_ip(make_request(forwarded=forwarded)) == expected
+
+
+# Fair model queue
+
+
+async def hold(limiter, client, order, release):
+    async with limiter.slot(client):
+        order.append(client)
+        await release.wait()
+
+
+async def enqueue(limiter, clients, order):
+    """Hold the only slot, queue ``clients`` (in order) behind it, then let everything run."""
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(limiter, "holder", order, release))
+    await asyncio.sleep(0)
+    waiters = []
+    for client in clients:
+        waiters.append(asyncio.create_task(hold(limiter, client, order, release)))
+        await asyncio.sleep(0)
+    release.set()
+    return await asyncio.gather(holder, *waiters, return_exceptions=True)
+
+
+def test_waiting_calls_are_served_round_robin():
+    async def scenario():
+        limiter = FairLimiter("test-model", limit=1)
+        order = []
+        await enqueue(limiter, ["a", "a", "a", "b", "c"], order)
+        return order, limiter
+
+    order, limiter = asyncio.run(scenario())
+    assert order == ["holder", "a", "b", "c", "a", "a"]
+    assert (limiter.active, limiter.waiting) == (0, 0)
+
+
+def test_per_client_queue_cap():
+    async def scenario():
+        limiter = FairLimiter("test-model", limit=1, max_queue_per_client=2)
+        order = []
+        results = await enqueue(limiter, ["a", "a", "a", "b"], order)
+        return results, order
+
+    results, order = asyncio.run(scenario())
+    assert isinstance(results[3], HTTPException)
+    assert results[3].status_code == 429
+    assert order == ["holder", "a", "b", "a"]
+
+
+def test_total_queue_cap():
+    async def scenario():
+        limiter = FairLimiter("test-model", limit=1, max_queue=2)
+        order = []
+        results = await enqueue(limiter, ["a", "b", "c"], order)
+        return results, order
+
+    results, order = asyncio.run(scenario())
+    assert isinstance(results[-1], HTTPException)
+    assert order == ["holder", "a", "b"]
+
+
+def test_queue_timeout_is_a_429_with_retry_after():
+    async def scenario():
+        limiter = FairLimiter("test-model", limit=1, queue_timeout=0.01)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, "holder", [], release))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc:
+            async with limiter.slot("a"):
+                pass
+        release.set()
+        await holder
+        return exc.value, limiter
+
+    error, limiter = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+    assert (limiter.active, limiter.waiting) == (0, 0)
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        limiter = FairLimiter("test-model", limit=1)
+        release = asyncio.Event()
+        order = []
+        holder = asyncio.create_task(hold(limiter, "holder", order, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(limiter, "a", order, release))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+        return order, limiter
+
+    order, limiter = asyncio.run(scenario())
+    assert order == ["holder"]
+    assert (limiter.active, limiter.waiting) == (0, 0)
+
+
+def test_grant_racing_a_cancellation_gives_the_slot_back():
+    async def scenario():
+        limiter = FairLimiter("test-model", limit=1)
+        release = asyncio.Event()
+        holder_done = asyncio.Event()
+
+        async def holder():
+            async with limiter.slot("holder"):
+                await release.wait()
+            holder_done.set()
+
+        holder_task = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(limiter, "a", [], asyncio.Event()))
+        await asyncio.sleep(0)
+
+        # The holder leaves and grants its slot to the waiter, which is
+        # cancelled before it gets to run
+        release.set()
+        await holder_done.wait()
+        assert (limiter.active, limiter.waiting) == (1, 0)
+        waiter.cancel()
+        await asyncio.gather(holder_task, waiter, return_exceptions=True)
+
+        # The slot is free again
+        async with limiter.slot("b"):
+            pass
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert (limiter.active, limiter.waiting) == (0, 0)
+
+
+def test_cost_above_capacity_leaves_the_bucket_in_debt(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    bucket.tokens -= 1
+    # Only a full bucket admits it
+    assert bucket.wait_time(5) == pytest.approx(1.0)
+    clock.now += 1
+    assert bucket.wait_time(5) == 0
+    bucket.tokens -= 5
+    # Paid back before the next request
+    assert bucket.wait_time(1) == pytest.approx(4.0)
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+import auth
+from auth import TokenVerifier
+
+SECRET = "test-secret-for-hs256-signed-tokens"
+OTHER_SECRET = "secret-of-another-project-entirely"
+USER_ID = "6f1d2c3b-aaaa-4bbb-8ccc-123456789abc"
+
+
+def make_token(exp_in: float = 3600, secret: str = SECRET, **claims) -> str:
+    payload = {"sub": USER_ID, "aud": "authenticated", "exp": int(time.time() + exp_in), **claims}
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+class FakeGetUser:
+    """Stands in for ``supabase.auth.get_user`` and counts the round trips."""
+
+    def __init__(self, user_id=None, error=None):
+        self.calls = 0
+        self.user_id = user_id
+        self.error = error
+
+    def __call__(self, token):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        user = SimpleNamespace(id=self.user_id) if self.user_id else None
+        return SimpleNamespace(user=user, error=None)
+
+
+@pytest.fixture
+def get_user(monkeypatch):
+    fake = FakeGetUser(user_id=USER_ID)
+    monkeypatch.setattr(auth.supabase.auth, "get_user", fake)
+    return fake
+
+
+def test_valid_local_token():
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url=None)
+    assert asyncio.run(verifier.verify(make_token())) == USER_ID
+
+
+def test_expired_token_is_rejected(get_user):
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url=None)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(verifier.verify(make_token(exp_in=-60)))
+    assert exc.value.status_code == 401
+    assert get_user.calls == 0
+
+
+def test_wrong_audience_is_rejected():
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url=None)
+    with pytest.raises(HTTPException):
+        asyncio.run(verifier.verify(make_token(aud="someone-else")))
+
+
+def test_verified_token_is_cached_until_exp(monkeypatch):
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url=None)
+    token = make_token(exp_in=60)
+    assert asyncio.run(verifier.verify(token)) == USER_ID
+
+    # A cache hit does not check the signature again
+    verifier.jwt_secret = "rotated-secret-for-hs256-signed-tokens"
+    assert asyncio.run(verifier.verify(token)) == USER_ID
+
+    # Past exp the entry is dropped and the token is verified (and now rejected) again
+    now = time.time()
+    monkeypatch.setattr(auth.time, "time", lambda: now + 120)
+    with pytest.raises(HTTPException):
+        asyncio.run(verifier.verify(token))
+
+
+def test_remote_fallback_without_secret(get_user):
+    verifier = TokenVerifier(jwt_secret=None, jwks_url=None)
+    token = make_token(secret=OTHER_SECRET)
+    assert asyncio.run(verifier.verify(token)) == USER_ID
+    assert asyncio.run(verifier.verify(token)) == USER_ID
+    assert get_user.calls == 1
+
+
+def test_remote_rejection_is_cached(get_user):
+    get_user.user_id = None
+    verifier = TokenVerifier(jwt_secret=None, jwks_url=None, negative_ttl=30)
+    token = make_token(secret=OTHER_SECRET)
+    for _ in range(3):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(verifier.verify(token))
+        assert exc.value.status_code == 401
+    assert get_user.calls == 1
+
+
+def test_remote_auth_api_error_is_a_cached_401(get_user):
+    get_user.error = type("AuthApiError", (Exception,), {"status": 403})("bad token")
+    verifier = TokenVerifier(jwt_secret=None, jwks_url=None)
+    token = make_token(secret=OTHER_SECRET)
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(verifier.verify(token))
+        assert exc.value.status_code == 401
+    assert get_user.calls == 1
+
+
+def test_rejection_is_forgotten_after_ttl(get_user, monkeypatch):
+    get_user.user_id = None
+    verifier = TokenVerifier(jwt_secret=None, jwks_url=None, negative_ttl=30)
+    token = make_token(secret=OTHER_SECRET)
+    with pytest.raises(HTTPException):
+        asyncio.run(verifier.verify(token))
+
+    now = time.monotonic()
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now + 31)
+    get_user.user_id = USER_ID
+    assert asyncio.run(verifier.verify(token)) == USER_ID
+    assert get_user.calls == 2
+
+
+def test_garbage_token_is_rejected_without_round_trip(get_user):
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url=None)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(verifier.verify("not-a-jwt"))
+    assert exc.value.status_code == 401
+    assert get_user.calls == 0
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import chat_pipeline
+from chat_pipeline import SentenceSpeech, TurnGraph
+
+
+class FakeTTS:
+    """Stands in for ``synthesize_speech``: records the sentences and returns them as audio."""
+
+    def __init__(self, fail_on=None, delay=0.0) -> None:
+        self.fail_on = fail_on
+        self.delay = delay
+        self.sentences = []
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, client, text, voice_id):
+        self.sentences.append(text)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail_on is not None and self.fail_on in text:
+                raise RuntimeError("429 Too Many Requests")
+            return f"<{text}>".encode()
+        finally:
+            self.running -= 1
+
+
+@pytest.fixture
+def tts(monkeypatch):
+    tts = FakeTTS()
+    monkeypatch.setattr(chat_pipeline, "synthesize_speech", tts)
+    return tts
+
+
+def speak(deltas, **kwargs):
+    async def scenario():
+        graph = TurnGraph()
+        speech = SentenceSpeech(None, "voice", graph, **kwargs)
+        for delta in deltas:
+            speech.feed(delta)
+            await asyncio.sleep(0)
+        return await speech.finish(), graph
+
+    return asyncio.run(scenario())
+
+
+def test_sentences_are_sent_as_they_complete(tts):
+    audio, graph = speak(["Hello there. How are", " you today? I am", " fine"], min_chars=1)
+    assert tts.sentences == ["Hello there.", "How are you today?", "I am fine"]
+    assert audio == b"<Hello there.><How are you today?><I am fine>"
+    assert {"tts", "tts_first_sentence"} <= set(graph.timings)
+
+
+def test_short_sentences_are_merged(tts):
+    speak(["Hi. Yes. I have had this pain for a week. ", "Ok."], min_chars=20)
+    assert tts.sentences == ["Hi. Yes. I have had this pain for a week.", "Ok."]
+
+
+def test_closing_quotes_stay_with_their_sentence(tts):
+    speak(['He said "stop!" Then ', "he left... Bye"], min_chars=1)
+    assert tts.sentences == ['He said "stop!"', "Then he left...", "Bye"]
+
+
+def test_no_boundary_means_one_clip_on_finish(tts):
+    audio, _ = speak(["no punctuation", " at all"], min_chars=1)
+    assert tts.sentences == ["no punctuation at all"]
+    assert audio == b"<no punctuation at all>"
+
+
+def test_empty_reply_has_no_audio(tts):
+    audio, graph = speak(["   "])
+    assert (audio, tts.sentences) == (None, [])
+    assert "tts" not in graph.timings
+
+
+def test_concurrency_is_bounded(tts):
+    tts.delay = 0.01
+    audio, _ = speak(["One one. Two two. Three. Four. Five. Six."], min_chars=1, concurrency=2)
+    assert tts.peak == 2
+    assert audio == b"<One one.><Two two.><Three.><Four.><Five.><Six.>"
+
+
+def test_failed_sentence_drops_the_audio_and_stops_the_rest(tts):
+    tts.fail_on = "Two"
+    audio, graph = speak(["One. Two. Three. Four."], min_chars=1, concurrency=1)
+    assert audio is None
+    # Sentences after the failure are never sent
+    assert tts.sentences == ["One.", "Two."]
+    assert "tts" in graph.timings
+
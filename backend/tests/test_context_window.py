@@ -0,0 +1,70 @@
+import asyncio
+import uuid
+
+import pytest
+
+from context_window import build_history_window, count_message_tokens
+from fakes import FakeOpenAI
+
+HISTORY = [f"Message number {i} with a few words of content in it." for i in range(12)]
+PER_MESSAGE = count_message_tokens(HISTORY[0])
+
+
+def summarizer(model, messages, kwargs):
+    return "- The patient has a headache."
+
+
+def failing(model, messages, kwargs):
+    raise ValueError("summary model unavailable")
+
+
+def window(client, budget, **kwargs):
+    # A fresh scope per call, so no test sees another's cached summary
+    return asyncio.run(build_history_window(client, HISTORY, f"test:{uuid.uuid4()}", budget, **kwargs))
+
+
+def test_history_that_fits_is_sent_verbatim():
+    client = FakeOpenAI(summarizer)
+    result = window(client, budget=PER_MESSAGE * len(HISTORY))
+
+    assert [m["content"] for m in result.messages] == HISTORY
+    assert [m["role"] for m in result.messages[:2]] == ["user", "assistant"]
+    assert result.summarized_messages == 0
+    assert not result.summary_failed
+    assert client.chat.completions.calls == []
+
+
+def test_older_turns_are_summarized():
+    client = FakeOpenAI(summarizer)
+    result = window(client, budget=PER_MESSAGE * 4)
+
+    summary, *verbatim = result.messages
+    assert summary["role"] == "system"
+    assert "The patient has a headache." in summary["content"]
+    assert [m["content"] for m in verbatim] == HISTORY[-4:]
+    assert result.summarized_messages == 8
+    assert result.verbatim_messages == 4
+    assert result.window_tokens == count_message_tokens(summary["content"]) + 4 * PER_MESSAGE
+    assert len(client.chat.completions.calls) == 1
+
+
+def test_summary_failure_falls_back_to_verbatim_history():
+    result = window(FakeOpenAI(failing), budget=PER_MESSAGE * 4)
+
+    assert [m["content"] for m in result.messages] == HISTORY
+    assert result.summary_failed
+    assert result.summarized_messages == 0
+    assert result.usage()["summary_failed"] is True
+
+
+def test_summary_failure_fallback_is_bounded():
+    result = window(FakeOpenAI(failing), budget=PER_MESSAGE * 2, fallback_budget=PER_MESSAGE * 6)
+
+    assert [m["content"] for m in result.messages] == HISTORY[-6:]
+    assert result.verbatim_messages == 6
+
+
+@pytest.mark.parametrize("budget", [0, 1])
+def test_latest_messages_are_always_kept(budget):
+    result = window(FakeOpenAI(summarizer), budget=budget)
+    assert [m["content"] for m in result.messages[1:]] == HISTORY[-2:]
@@ -0,0 +1,141 @@
+from sqlalchemy import func, select
+
+from conftest import USER_ID
+
+
+def evaluator_calls(main) -> int:
+    return len(main.clients.openai.chat.completions.calls)
+
+
+def stored_rows(client, main, transcript: str) -> int:
+    from models import Evaluation
+
+    async def count():
+        async with main.SessionLocal() as session:
+            return await session.scalar(
+                select(func.count()).select_from(Evaluation).where(Evaluation.full_transcript == transcript)
+            )
+
+    return client.portal.call(count)
+
+
+def batch(client, *transcripts, scenario_id="s1"):
+    response = client.post(
+        "/api/evaluate/batch",
+        json={"items": [{"scenario_id": scenario_id, "transcript": transcript} for transcript in transcripts]},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_replayed_evaluation_has_no_prompt_version(api):
+    client, _ = api
+    body = {"scenario_id": "s1", "transcript": "Doctor: Where does it hurt?"}
+    first = client.post("/api/evaluate", json=body)
+    again = client.post("/api/evaluate", json=body)
+    assert first.headers["X-Evaluation-Replayed"] == "false"
+    assert first.headers["X-Prompt-Version"]
+    assert again.headers["X-Evaluation-Replayed"] == "true"
+    assert "X-Prompt-Version" not in again.headers
+    assert again.json()["evaluation_id"] == first.json()["evaluation_id"]
+
+
+def test_batch_reuses_evaluations_stored_earlier(api):
+    client, main = api
+    single = client.post("/api/evaluate", json={"scenario_id": "s1", "transcript": "Doctor: Any allergies?"}).json()
+    calls = evaluator_calls(main)
+
+    # Whitespace differences are the same submission
+    data = batch(client, "Doctor:  Any allergies?", "Doctor: Any medication?")
+    first, second = data["results"]
+    assert (first["evaluation_id"], first["replayed"]) == (single["evaluation_id"], True)
+    assert first["scores"] == {"Information Gathering": {"score": 4, "justification": "Good questions."}}
+    assert (second["replayed"], isinstance(second["evaluation_id"], int)) == (False, True)
+    assert evaluator_calls(main) == calls + 1
+
+
+def test_retried_batch_stores_nothing_new(api):
+    client, main = api
+    transcripts = ("Doctor: How did you sleep?", "Doctor: Do you smoke?")
+    first = batch(client, *transcripts)
+    calls = evaluator_calls(main)
+    retry = batch(client, *transcripts)
+
+    assert [result["evaluation_id"] for result in retry["results"]] == [
+        result["evaluation_id"] for result in first["results"]
+    ]
+    assert all(result["replayed"] for result in retry["results"])
+    assert evaluator_calls(main) == calls
+    assert [stored_rows(client, main, transcript) for transcript in transcripts] == [1, 1]
+
+
+def test_identical_items_in_one_batch_are_scored_and_stored_once(api):
+    client, main = api
+    calls = evaluator_calls(main)
+    data = batch(client, "Doctor: Any fever?", "Doctor: Any fever?", "Doctor: Any cough?")
+    first, repeat, other = data["results"]
+
+    assert data["succeeded"] == 3
+    assert repeat["evaluation_id"] == first["evaluation_id"] != other["evaluation_id"]
+    assert [first["replayed"], repeat["replayed"], other["replayed"]] == [False, True, False]
+    assert evaluator_calls(main) == calls + 2
+    assert stored_rows(client, main, "Doctor: Any fever?") == 1
+
+
+def test_failed_items_do_not_fail_the_batch(api):
+    client, _ = api
+    data = client.post(
+        "/api/evaluate/batch",
+        json={
+            "items": [
+                {"scenario_id": "missing", "transcript": "Doctor: Hello?"},
+                {"scenario_id": "s1", "transcript": "Doctor: Hello there."},
+            ]
+        },
+    ).json()
+    assert (data["succeeded"], data["failed"]) == (1, 1)
+    assert data["results"][0] == {"index": 0, "status": "error", "status_code": 404, "detail": "Scenario not found."}
+
+
+def test_submission_stored_meanwhile_is_kept(api):
+    client, main = api
+    from evaluation import build_evaluation_records, evaluation_content_hash, save_evaluations_once
+
+    scores = {"Information Gathering": {"score": 2, "justification": "Stored first."}}
+
+    def record(transcript):
+        content_hash = evaluation_content_hash("s1", None, transcript)
+        return build_evaluation_records(USER_ID, "s1", transcript, scores, content_hash)
+
+    async def race():
+        # Another request stores the first submission between the lookup and the insert
+        async with main.SessionLocal() as session:
+            winner = record("Doctor: Raced.")
+            session.add(winner)
+            await session.commit()
+
+        async with main.SessionLocal() as session:
+            saved = await save_evaluations_once(session, USER_ID, [record("Doctor: Raced."), record("Doctor: Not raced.")])
+            return winner.id, {content_hash: (evaluation.id, replayed) for content_hash, (evaluation, replayed) in saved.items()}
+
+    winner_id, saved = client.portal.call(race)
+    assert saved[evaluation_content_hash("s1", None, "Doctor: Raced.")] == (winner_id, True)
+    assert saved[evaluation_content_hash("s1", None, "Doctor: Not raced.")][1] is False
+    assert stored_rows(client, main, "Doctor: Raced.") == 1
+
+
+def test_batch_is_charged_per_item(api, monkeypatch):
+    import admission
+
+    client, _ = api
+    monkeypatch.setattr(admission, "user_rate_limiter", admission.RateLimiter(per_minute=60, burst=3))
+    assert batch(client, "Doctor: One.", "Doctor: Two.")["succeeded"] == 2
+
+    # One token left: a two-item batch has to wait, a one-item batch does not
+    rejected = client.post(
+        "/api/evaluate/batch",
+        json={"items": [{"scenario_id": "s1", "transcript": "Doctor: Three."}, {"scenario_id": "s1", "transcript": "Doctor: Four."}]},
+    )
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "1"
+    assert batch(client, "Doctor: Three.")["succeeded"] == 1
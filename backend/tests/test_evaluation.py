@@ -0,0 +1,172 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import evaluation
+from evaluation import SingleFlight, evaluation_response_format, score_transcript, validate_scores
+from fakes import FakeOpenAI
+
+EMPATHY = "Empathy & Rapport Building"
+GATHERING = "Information Gathering"
+TRANSCRIPT = "Doctor: What brings you in today?\nPatient: My head hurts."
+
+
+def entry(score, justification="Asked open questions."):
+    return {"reasoning": "The doctor asked about symptoms.", "score": score, "justification": justification}
+
+
+def scripted(*replies):
+    """A responder returning ``replies`` in order, as JSON."""
+    queue = list(replies)
+
+    def responder(model, messages, kwargs):
+        return json.dumps(queue.pop(0))
+
+    return responder
+
+
+def requested_skills(call) -> list:
+    _, _, kwargs = call
+    return kwargs["response_format"]["json_schema"]["schema"]["required"]
+
+
+def test_response_format_requires_reasoning_before_the_score():
+    schema = evaluation_response_format((EMPATHY,))["json_schema"]["schema"]["properties"][EMPATHY]
+    assert list(schema["properties"]) == ["reasoning", "score", "justification"]
+    assert schema["required"] == ["reasoning", "score", "justification"]
+
+
+def test_validate_scores():
+    valid, problems = validate_scores(
+        {
+            EMPATHY: entry("4", "  Warm.  "),
+            GATHERING: entry(7),
+            "Patient Education & Clarity": "great",
+            "Not asked for": entry(3),
+        },
+        [EMPATHY, GATHERING, "Patient Education & Clarity", "Managing Difficult Conversations"],
+    )
+    assert valid == {EMPATHY: {"score": 4, "justification": "Warm."}}
+    assert problems == {
+        GATHERING: "score 7 is outside 1-5",
+        "Patient Education & Clarity": "not an object with 'score' and 'justification'",
+        "Managing Difficult Conversations": "missing",
+    }
+
+
+@pytest.mark.parametrize(
+    "value, problem",
+    [
+        ({"score": True, "justification": "x"}, "score is not an integer"),
+        ({"score": 2.5, "justification": "x"}, "score is not an integer"),
+        ({"score": 3, "justification": "  "}, "justification is missing"),
+    ],
+)
+def test_validate_scores_problems(value, problem):
+    assert validate_scores({EMPATHY: value}, [EMPATHY]) == ({}, {EMPATHY: problem})
+
+
+def test_valid_answer_needs_no_reask():
+    client = FakeOpenAI(scripted({EMPATHY: entry(4), GATHERING: entry(3)}))
+    scores = asyncio.run(score_transcript(client, [EMPATHY, GATHERING], TRANSCRIPT, "en"))
+
+    assert scores == {
+        EMPATHY: {"score": 4, "justification": "Asked open questions."},
+        GATHERING: {"score": 3, "justification": "Asked open questions."},
+    }
+    assert len(client.chat.completions.calls) == 1
+
+
+def test_only_invalid_skills_are_asked_again():
+    client = FakeOpenAI(scripted({EMPATHY: entry(4), GATHERING: entry(9)}, {GATHERING: entry(2)}))
+    scores = asyncio.run(score_transcript(client, [EMPATHY, GATHERING], TRANSCRIPT, "en"))
+
+    assert {skill: value["score"] for skill, value in scores.items()} == {EMPATHY: 4, GATHERING: 2}
+    first, second = client.chat.completions.calls
+    assert requested_skills(first) == [EMPATHY, GATHERING]
+    assert requested_skills(second) == [GATHERING]
+
+    # The re-ask keeps the transcript and the previous answer as context
+    _, messages, _ = second
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert "score 9 is outside 1-5" in messages[-1]["content"]
+
+
+def test_gives_up_after_max_reasks(monkeypatch):
+    monkeypatch.setattr(evaluation, "EVALUATION_MAX_REASKS", 1)
+    client = FakeOpenAI(scripted({EMPATHY: entry(4)}, {}))
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(score_transcript(client, [EMPATHY, GATHERING], TRANSCRIPT, "en"))
+    assert exc.value.status_code == 500
+    assert GATHERING in exc.value.detail
+    assert len(client.chat.completions.calls) == 2
+
+
+def test_unknown_skills_are_not_scored():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(score_transcript(FakeOpenAI(scripted()), ["Juggling"], TRANSCRIPT, "en"))
+    assert exc.value.status_code == 400
+
+
+def test_single_flight_shares_one_call_per_key():
+    calls = []
+
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def work(key):
+            calls.append(key)
+            await release.wait()
+            return f"result {key}"
+
+        runs = [asyncio.create_task(flights.run(key, lambda key=key: work(key))) for key in ("a", "a", "a", "b")]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*runs)
+        return results, flights
+
+    results, flights = asyncio.run(scenario())
+    assert calls == ["a", "b"]
+    assert results == [("result a", False), ("result a", True), ("result a", True), ("result b", False)]
+    # Finished flights are forgotten, so the next call runs again
+    assert flights._calls == {}
+
+
+def test_single_flight_survives_a_cancelled_caller():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flights.run("k", work))
+        second = asyncio.create_task(flights.run("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == (("done", True), True)
+
+
+def test_single_flight_error_reaches_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            raise HTTPException(status_code=502, detail="upstream failed")
+
+        results = await asyncio.gather(flights.run("k", work), flights.run("k", work), return_exceptions=True)
+        return results, flights._calls
+
+    results, pending = asyncio.run(scenario())
+    assert [r.status_code for r in results] == [502, 502]
+    assert pending == {}
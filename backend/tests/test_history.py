@@ -0,0 +1,111 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import USER_ID
+
+HISTORY_USER_ID = "22222222-aaaa-4bbb-8ccc-123456789abc"
+
+
+@pytest.fixture(scope="module")
+def history(api):
+    """Seven evaluations of ``HISTORY_USER_ID``, three of them created at the same moment. Yields ``(client, ids)``
+    with the ids newest first.
+    """
+    import auth
+    from models import Evaluation, EvaluationScore
+
+    client, main = api
+    base = datetime(2025, 3, 1, 12, 0, 0)
+    created = [base, base + timedelta(minutes=1), base + timedelta(minutes=2)] + [base + timedelta(minutes=3)] * 3 + [
+        base + timedelta(minutes=4)
+    ]
+
+    async def seed():
+        async with main.SessionLocal() as session:
+            evaluations = [
+                Evaluation(
+                    created_at=created_at,
+                    user_id=HISTORY_USER_ID,
+                    scenario_id="s1",
+                    full_transcript=f"Doctor: Visit {index}.",
+                    scores=[EvaluationScore(skill_name="Information Gathering", score=3, justification="Fine.")],
+                )
+                for index, created_at in enumerate(created)
+            ]
+            # Someone else's history is never shown
+            session.add(Evaluation(created_at=base, user_id=USER_ID, scenario_id="s1", full_transcript="Doctor: Not yours."))
+            session.add_all(evaluations)
+            await session.commit()
+            return [(evaluation.created_at, evaluation.id) for evaluation in evaluations]
+
+    keys = client.portal.call(seed)
+    ids = [evaluation_id for _, evaluation_id in sorted(keys, reverse=True)]
+    main.app.dependency_overrides[auth.get_current_user_id] = lambda: HISTORY_USER_ID
+    try:
+        yield client, ids
+    finally:
+        main.app.dependency_overrides[auth.get_current_user_id] = lambda: USER_ID
+
+
+def walk(client, limit, **params):
+    pages = []
+    cursor = None
+    while True:
+        query = {"limit": limit, **params, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/me/history", params=query)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 50])
+def test_pages_cover_every_evaluation_once_newest_first(history, limit):
+    client, ids = history
+    pages = walk(client, limit)
+    assert [item["id"] for page in pages for item in page] == ids
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+
+
+def test_page_boundary_inside_a_created_at_tie(history):
+    client, ids = history
+    # The second page starts in the middle of the three evaluations created at the same moment
+    pages = walk(client, 2)
+    assert [[item["id"] for item in page] for page in pages] == [ids[0:2], ids[2:4], ids[4:6], ids[6:7]]
+    assert len({item["created_at"] for item in pages[0][1:] + pages[1]}) == 1
+
+
+def test_summary_leaves_out_transcripts(history):
+    client, _ = history
+    full = client.get("/api/me/history", params={"limit": 2}).json()
+    summary = client.get("/api/me/history", params={"limit": 2, "summary": "true"}).json()
+
+    assert all("full_transcript" in item for item in full)
+    assert all("full_transcript" not in item for item in summary)
+    assert [{k: v for k, v in item.items() if k != "full_transcript"} for item in full] == summary
+    assert summary[0]["scores"] == [{"skill_name": "Information Gathering", "score": 3, "justification": "Fine."}]
+
+
+def b64(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["not base64!", b64("no separator"), b64("yesterday|5"), b64("2025-03-01T12:00:00|five"), "čšž"],
+)
+def test_malformed_cursor_is_a_400(history, cursor):
+    client, _ = history
+    response = client.get("/api/me/history", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid history cursor."
+
+
+@pytest.mark.parametrize("limit", [0, 10_000])
+def test_page_size_is_bounded(history, limit):
+    client, _ = history
+    assert client.get("/api/me/history", params={"limit": limit}).status_code == 422
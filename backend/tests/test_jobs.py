@@ -0,0 +1,443 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import jobs
+from conftest import OTHER_USER_ID, USER_ID
+from fakes import FakeOpenAI
+from jobs import JobQueue, JobStore, MemoryJobStore
+
+
+
+def expire_lease(store: MemoryJobStore, job_id: str) -> None:
+    store._jobs[job_id].heartbeat_at -= timedelta(seconds=store.lease_seconds + 1)
+
+
+async def wait_until_finished(queue: JobQueue, job):
+    states = [state.status async for state in queue.follow(job) if state is not None]
+    return states, await queue.store.get(job.id)
+
+
+def make_queue(**kwargs) -> JobQueue:
+    options = {"workers": 2, "poll_interval": 0.01, "max_poll_interval": 0.05, "enabled": True, **kwargs}
+    store = options.pop("store", None) or MemoryJobStore()
+    return JobQueue(store, **options)
+
+
+# Memory store
+
+
+def test_create_claim_finish():
+    async def scenario():
+        store = MemoryJobStore()
+        job = await store.create("evaluation", USER_ID, {"transcript": "Doctor: hi"})
+        assert (job.status, await store.pending_count(USER_ID)) == ("queued", 1)
+
+        claimed = await store.claim()
+        assert (claimed.id, claimed.status, claimed.attempts) == (job.id, "running", 1)
+        assert await store.claim() is None
+
+        await store.finish(job.id, result={"evaluation_id": 7})
+        finished = await store.get(job.id)
+        assert await store.pending_count(USER_ID) == 0
+        return finished.to_dict()
+
+    data = asyncio.run(scenario())
+    assert data["status"] == "succeeded"
+    assert data["result"] == {"evaluation_id": 7}
+    assert "payload" not in data
+
+
+def test_jobs_are_claimed_oldest_first():
+    async def scenario():
+        store = MemoryJobStore()
+        first = await store.create("evaluation", USER_ID, {})
+        second = await store.create("evaluation", USER_ID, {})
+        return [first.id, second.id], [(await store.claim()).id, (await store.claim()).id]
+
+    created, claimed = asyncio.run(scenario())
+    assert claimed == created
+
+
+def test_abandoned_job_is_claimed_again_until_attempts_run_out():
+    async def scenario():
+        store = MemoryJobStore(lease_seconds=60, max_attempts=2)
+        job = await store.create("evaluation", USER_ID, {})
+        await store.claim()
+
+        # The lease is still held
+        assert await store.claim() is None
+        expire_lease(store, job.id)
+        reclaimed = await store.claim()
+        assert (reclaimed.id, reclaimed.attempts) == (job.id, 2)
+
+        expire_lease(store, job.id)
+        assert await store.claim() is None
+        return await store.get(job.id)
+
+    given_up = asyncio.run(scenario())
+    assert given_up.status == "failed"
+    assert given_up.error_status == 500
+    assert given_up.error_detail == "The job was interrupted too many times."
+
+
+def test_heartbeat_renews_the_lease():
+    async def scenario():
+        store = MemoryJobStore(lease_seconds=60)
+        job = await store.create("evaluation", USER_ID, {})
+        await store.claim()
+        expire_lease(store, job.id)
+        await store.heartbeat(job.id)
+        return await store.claim()
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_requeue_does_not_count_the_attempt():
+    async def scenario():
+        store = MemoryJobStore()
+        job = await store.create("evaluation", USER_ID, {})
+        await store.claim()
+        await store.requeue(job.id)
+        return await store.get(job.id)
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.attempts) == ("queued", 0)
+
+
+def test_prune_deletes_old_finished_jobs():
+    async def scenario():
+        store = MemoryJobStore()
+        done = await store.create("evaluation", USER_ID, {})
+        pending = await store.create("evaluation", USER_ID, {})
+        await store.finish(done.id, result={})
+        removed = await store.prune(datetime.utcnow() + timedelta(seconds=1))
+        return removed, await store.get(done.id), await store.get(pending.id)
+
+    removed, done, pending = asyncio.run(scenario())
+    assert (removed, done) == (1, None)
+    assert pending is not None
+
+
+def test_incomplete_store_fails_when_created():
+    class Incomplete(JobStore):
+        async def create(self, kind, user_id, payload):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+# Queue
+
+
+def test_job_runs_and_reports_its_result():
+    async def scenario():
+        queue = make_queue()
+
+        async def handler(job):
+            return {"echo": job.payload["value"]}
+
+        queue.register("echo", handler)
+        await queue.start()
+        job = await queue.submit("echo", USER_ID, {"value": 42})
+        states, finished = await wait_until_finished(queue, job)
+        await queue.close()
+        return states, finished
+
+    states, finished = asyncio.run(scenario())
+    # "running" may be skipped if the job finishes between two looks
+    assert states[0] == "queued" and states[-1] == "succeeded"
+    assert finished.result == {"echo": 42}
+
+
+@pytest.mark.parametrize(
+    "error, status, detail",
+    [
+        (HTTPException(status_code=404, detail="Scenario not found."), 404, "Scenario not found."),
+        (RuntimeError("boom"), 500, "Job failed: boom"),
+    ],
+)
+def test_failing_handler_fails_the_job(error, status, detail):
+    async def scenario():
+        queue = make_queue()
+
+        async def handler(job):
+            raise error
+
+        queue.register("broken", handler)
+        await queue.start()
+        job = await queue.submit("broken", USER_ID, {})
+        _, finished = await wait_until_finished(queue, job)
+        await queue.close()
+        return finished.to_dict()
+
+    data = asyncio.run(scenario())
+    assert data["status"] == "failed"
+    assert data["error"] == {"status_code": status, "detail": detail}
+
+
+def test_abandoned_job_is_run_again_by_the_queue():
+    async def scenario():
+        store = MemoryJobStore(lease_seconds=60, max_attempts=2)
+        # Claimed by a worker that died without finishing it
+        job = await store.create("echo", USER_ID, {})
+        await store.claim()
+        expire_lease(store, job.id)
+
+        queue = make_queue(store=store)
+        queue.register("echo", lambda job: asyncio.sleep(0, result={"attempt": job.attempts}))
+        await queue.start()
+        _, finished = await wait_until_finished(queue, job)
+        await queue.close()
+        return finished
+
+    finished = asyncio.run(scenario())
+    assert (finished.status, finished.result) == ("succeeded", {"attempt": 2})
+
+
+def test_at_most_workers_jobs_run_at_once():
+    running = 0
+    peak = 0
+
+    async def scenario():
+        nonlocal running, peak
+        queue = make_queue(workers=2)
+
+        async def handler(job):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return {}
+
+        queue.register("slow", handler)
+        await queue.start()
+        submitted = [await queue.submit("slow", USER_ID, {}) for _ in range(5)]
+        results = [await wait_until_finished(queue, job) for job in submitted]
+        await queue.close()
+        return [finished.status for _, finished in results]
+
+    assert asyncio.run(scenario()) == ["succeeded"] * 5
+    assert peak == 2
+
+
+def test_shutdown_puts_running_jobs_back():
+    async def scenario():
+        queue = make_queue()
+        started = asyncio.Event()
+
+        async def handler(job):
+            started.set()
+            await asyncio.sleep(10)
+
+        queue.register("slow", handler)
+        await queue.start()
+        job = await queue.submit("slow", USER_ID, {})
+        await started.wait()
+        await queue.close()
+        return await queue.store.get(job.id)
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.attempts) == ("queued", 0)
+
+
+def test_too_many_pending_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_PENDING_PER_USER", 2)
+
+    async def scenario():
+        queue = make_queue()
+        queue.register("echo", lambda job: asyncio.sleep(0, result={}))
+        # Not started, so nothing leaves the queue
+        for _ in range(2):
+            await queue.submit("echo", USER_ID, {})
+        with pytest.raises(HTTPException) as exc:
+            await queue.submit("echo", USER_ID, {})
+        await queue.submit("echo", OTHER_USER_ID, {})
+        return exc.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert "Retry-After" in error.headers
+
+
+def test_disabled_queue_neither_polls_nor_accepts_jobs():
+    class CountingStore(MemoryJobStore):
+        claims = 0
+
+        async def claim(self):
+            CountingStore.claims += 1
+            return await super().claim()
+
+    async def scenario():
+        queue = make_queue(store=CountingStore(), enabled=False)
+        queue.register("echo", lambda job: asyncio.sleep(0, result={}))
+        await queue.start()
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc:
+            await queue.submit("echo", USER_ID, {})
+        await queue.close()
+        return exc.value
+
+    assert asyncio.run(scenario()).status_code == 503
+    assert CountingStore.claims == 0
+
+
+class CountingStore(MemoryJobStore):
+    """Counts claims; raises from ``claim`` while ``failing`` is set."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.claims = 0
+        self.failing = False
+
+    async def claim(self):
+        self.claims += 1
+        if self.failing:
+            raise RuntimeError('relation "jobs" does not exist')
+        return await super().claim()
+
+
+def test_idle_polling_backs_off():
+    async def scenario():
+        store = CountingStore()
+        queue = make_queue(store=store, poll_interval=0.01, max_poll_interval=0.08)
+        await queue.start()
+        await asyncio.sleep(0.4)
+        await queue.close()
+        return store.claims
+
+    # 0.01 + 0.02 + 0.04 + 0.08 + 0.08 ...: a handful of polls, not one per 10ms
+    assert asyncio.run(scenario()) <= 8
+
+
+def test_submit_wakes_an_idle_queue():
+    async def scenario():
+        queue = make_queue(poll_interval=10, max_poll_interval=10)
+        queue.register("echo", lambda job: asyncio.sleep(0, result={}))
+        await queue.start()
+        await asyncio.sleep(0.01)
+        start = time.monotonic()
+        job = await queue.submit("echo", USER_ID, {})
+        _, finished = await asyncio.wait_for(wait_until_finished(queue, job), 2)
+        await queue.close()
+        return finished.status, time.monotonic() - start
+
+    status, elapsed = asyncio.run(scenario())
+    assert status == "succeeded"
+    assert elapsed < 1
+
+
+def test_claim_errors_back_off(capsys):
+    async def scenario():
+        store = CountingStore()
+        store.failing = True
+        queue = make_queue(store=store, poll_interval=0.01, max_poll_interval=0.08)
+        await queue.start()
+        await asyncio.sleep(0.4)
+        await queue.close()
+        return store.claims
+
+    claims = asyncio.run(scenario())
+    assert claims <= 8
+    assert capsys.readouterr().out.count("Claiming a background job failed") == claims
+
+
+# Endpoints
+
+
+def status_events(body: str) -> list:
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+def poll(client, url: str) -> dict:
+    for _ in range(200):
+        data = client.get(url).json()
+        if data["status"] in ("succeeded", "failed"):
+            return data
+        time.sleep(0.01)
+    raise AssertionError(f"{url} did not finish")
+
+
+def test_background_evaluation(api):
+    client, _ = api
+    response = client.post(
+        "/api/evaluate?background=true", json={"scenario_id": "s1", "transcript": "Doctor: What brings you in?"}
+    )
+    assert response.status_code == 202
+    body = response.json()
+    assert body["status"] == "queued"
+    assert response.headers["location"] == body["status_url"] == f"/api/jobs/{body['job_id']}"
+    assert body["events_url"] == f"{body['status_url']}/events"
+
+    with client.stream("GET", body["events_url"]) as stream:
+        assert stream.headers["content-type"].startswith("text/event-stream")
+        events = status_events("".join(stream.iter_text()))
+    # The stream starts from wherever the job has got to
+    assert events[-1]["status"] == "succeeded"
+    assert [event["status"] for event in events[:-1]] in ([], ["queued"], ["running"], ["queued", "running"])
+
+    result = client.get(body["status_url"]).json()["result"]
+    assert result["Information Gathering"] == {"score": 4, "justification": "Good questions."}
+    assert isinstance(result["evaluation_id"], int)
+
+
+def test_background_feedback(api):
+    client, _ = api
+    evaluation = poll(
+        client,
+        client.post(
+            "/api/evaluate?background=true", json={"scenario_id": "s1", "transcript": "Doctor: Tell me more."}
+        ).json()["status_url"],
+    )
+    response = client.post(
+        "/api/coach/generate-feedback?background=true", json={"evaluation_id": evaluation["result"]["evaluation_id"]}
+    )
+    assert response.status_code == 202
+    feedback = poll(client, response.json()["status_url"])
+    assert feedback["status"] == "succeeded"
+    assert "Well done." in feedback["result"]["feedback_text"]
+
+
+def test_background_requests_are_validated_before_queueing(api):
+    client, _ = api
+    assert client.post("/api/evaluate?background=true", json={"scenario_id": "nope", "transcript": "x"}).status_code == 404
+    assert client.post("/api/coach/generate-feedback?background=true", json={"evaluation_id": 9999}).status_code == 404
+
+
+def test_failed_job_reports_its_error(api):
+    client, main = api
+    saved = main.clients._openai
+    main.clients._openai = FakeOpenAI(lambda model, messages, kwargs: "not json")
+    try:
+        body = client.post(
+            "/api/evaluate?background=true", json={"scenario_id": "s1", "transcript": "Doctor: Something else."}
+        ).json()
+        with client.stream("GET", body["events_url"]) as stream:
+            events = status_events("".join(stream.iter_text()))
+    finally:
+        main.clients._openai = saved
+    assert events[-1]["status"] == "failed"
+    assert events[-1]["error"]["status_code"] == 500
+
+
+def test_jobs_are_private(api):
+    client, main = api
+    import auth
+
+    status_url = client.post(
+        "/api/evaluate?background=true", json={"scenario_id": "s1", "transcript": "Doctor: Private."}
+    ).json()["status_url"]
+    assert client.get("/api/jobs/does-not-exist").status_code == 404
+
+    main.app.dependency_overrides[auth.get_current_user_id] = lambda: OTHER_USER_ID
+    try:
+        assert client.get(status_url).status_code == 404
+        assert client.get(f"{status_url}/events").status_code == 404
+    finally:
+        main.app.dependency_overrides[auth.get_current_user_id] = lambda: USER_ID
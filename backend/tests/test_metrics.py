@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY, generate_latest
+
+from metrics import observe_upstream, set_language
+
+
+def upstream_calls(lang: str) -> float:
+    value = REGISTRY.get_sample_value(
+        "upstream_request_duration_seconds_count",
+        {"service": "test", "operation": "lang", "model": "", "endpoint": "none", "lang": lang, "outcome": "ok"},
+    )
+    return value or 0.0
+
+
+def call_upstream_in(lang):
+    async def scenario():
+        set_language(lang)
+        async with observe_upstream("test", "lang"):
+            pass
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize(
+    "lang, label",
+    [("cs", "cs"), ("xxxxx", "other"), ("EN-us", "other"), (None, "none"), ("", "none")],
+)
+def test_language_label_is_bounded(lang, label):
+    before = upstream_calls(label)
+    call_upstream_in(lang)
+    assert upstream_calls(label) == before + 1
+
+
+def test_unknown_language_gets_no_series_of_its_own():
+    call_upstream_in("yyyyyy")
+    assert "yyyyyy" not in generate_latest().decode()
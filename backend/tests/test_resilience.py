@@ -0,0 +1,320 @@
+import asyncio
+import time
+
+import pytest
+
+import resilience
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamPolicy,
+    UpstreamTimeoutError,
+    call_upstream,
+    stream_upstream,
+)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Register a ``test`` provider with the given policy; returns its breaker."""
+    monkeypatch.setattr(resilience, "RETRY_BACKOFF_BASE", 0.001)
+
+    def register(timeout=1.0, deadline=5.0, retries=2, breaker_failures=3, breaker_reset=30.0):
+        policy = UpstreamPolicy(timeout, deadline, retries, breaker_failures, breaker_reset)
+        monkeypatch.setitem(resilience.POLICIES, "test", policy)
+        breaker = CircuitBreaker("test", breaker_failures, breaker_reset)
+        monkeypatch.setitem(resilience.breakers, "test", breaker)
+        return breaker
+
+    return register
+
+
+class Status(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+
+
+def trip(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.record(breaker.acquire(), TimeoutError())
+
+
+# Circuit breaker
+
+
+def test_opens_after_consecutive_transient_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_after=30)
+    for _ in range(2):
+        breaker.record(breaker.acquire(), Status(503))
+    assert breaker.state == "closed"
+    breaker.record(breaker.acquire(), Status(429))
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.acquire()
+    assert exc.value.status_code == 503
+    assert exc.value.headers["Retry-After"] == "30"
+    assert not breaker.available()
+
+
+def test_success_and_client_errors_reset_the_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_after=30)
+    breaker.record(breaker.acquire(), TimeoutError())
+    breaker.record(breaker.acquire())
+    breaker.record(breaker.acquire(), TimeoutError())
+    breaker.record(breaker.acquire(), Status(400))
+    breaker.record(breaker.acquire(), TimeoutError())
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=30)
+    trip(breaker)
+    clock.now += 30
+    assert breaker.available()
+
+    trial = breaker.acquire()
+    assert trial.trial
+    assert breaker.state == "half_open"
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+    breaker.record(trial)
+    assert breaker.state == "closed"
+    assert not breaker.acquire().trial
+
+
+def test_failed_trial_opens_again(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=30)
+    trip(breaker)
+    clock.now += 30
+    breaker.record(breaker.acquire(), ConnectionError())
+    assert breaker.state == "open"
+    assert breaker.retry_after() == 30
+
+
+def test_cancelled_trial_frees_the_slot(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=30)
+    trip(breaker)
+    clock.now += 30
+    breaker.release(breaker.acquire())
+    assert breaker.state == "half_open"
+    assert breaker.acquire().trial
+
+
+def test_stale_calls_do_not_decide_a_half_open_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_after=30)
+    stale_ok = breaker.acquire()
+    stale_failure = breaker.acquire()
+    trip(breaker)
+    clock.now += 30
+    trial = breaker.acquire()
+
+    # Calls let through before the breaker opened finish during the trial
+    breaker.record(stale_ok)
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.release(stale_ok)
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record(stale_failure, TimeoutError())
+    assert breaker.state == "half_open"
+
+    breaker.record(trial)
+    assert breaker.state == "closed"
+
+
+def test_stale_failures_do_not_count_after_recovery(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_after=30)
+    stale = [breaker.acquire() for _ in range(2)]
+    trip(breaker)
+    clock.now += 30
+    breaker.record(breaker.acquire())
+    for ticket in stale:
+        breaker.record(ticket, TimeoutError())
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+# Retries and deadlines
+
+
+def flaky(failures, result="ok", exc=TimeoutError):
+    calls = []
+
+    async def factory():
+        calls.append(time.monotonic())
+        if len(calls) <= failures:
+            raise exc()
+        return result
+
+    return factory, calls
+
+
+def test_transient_failures_are_retried(provider):
+    provider(retries=2)
+    factory, calls = flaky(2)
+    assert asyncio.run(call_upstream("test", factory, operation="op")) == "ok"
+    assert len(calls) == 3
+
+
+def test_retries_are_limited(provider):
+    provider(retries=1)
+    factory, calls = flaky(5)
+    with pytest.raises(TimeoutError):
+        asyncio.run(call_upstream("test", factory))
+    assert len(calls) == 2
+
+
+def test_non_idempotent_calls_are_not_retried(provider):
+    provider(retries=3)
+    factory, calls = flaky(1)
+    with pytest.raises(TimeoutError):
+        asyncio.run(call_upstream("test", factory, idempotent=False))
+    assert len(calls) == 1
+
+
+def test_client_errors_are_not_retried(provider):
+    provider(retries=3)
+    factory, calls = flaky(1, exc=lambda: Status(400))
+    with pytest.raises(Status):
+        asyncio.run(call_upstream("test", factory))
+    assert len(calls) == 1
+
+
+def test_each_attempt_is_timed_out_within_the_deadline(provider):
+    provider(timeout=0.05, deadline=0.12, retries=10)
+    calls = []
+
+    async def hang():
+        calls.append(1)
+        await asyncio.sleep(10)
+
+    start = time.monotonic()
+    with pytest.raises(UpstreamTimeoutError):
+        asyncio.run(call_upstream("test", hang))
+    assert time.monotonic() - start < 0.5
+    assert 2 <= len(calls) <= 3
+
+
+def test_open_breaker_fails_fast(provider):
+    breaker = provider(retries=0, breaker_failures=1)
+    factory, calls = flaky(1)
+    with pytest.raises(TimeoutError):
+        asyncio.run(call_upstream("test", factory))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_upstream("test", factory))
+    assert len(calls) == 1
+
+
+# Streams and hedging
+
+
+class Stream:
+    """An async iterator of ``chunks`` after ``delay``; remembers being closed."""
+
+    def __init__(self, name, chunks, delay=0.0, gap=0.0) -> None:
+        self.name = name
+        self.chunks = list(chunks)
+        self.delay = delay
+        self.gap = gap
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await asyncio.sleep(self.delay)
+        for index, chunk in enumerate(self.chunks):
+            if index:
+                await asyncio.sleep(self.gap)
+            yield f"{self.name}:{chunk}"
+
+    async def aclose(self):
+        self.closed = True
+
+
+def stream_factory(*streams):
+    queue = list(streams)
+
+    async def factory():
+        return queue.pop(0)
+
+    return factory
+
+
+async def collect(iterator):
+    return [chunk async for chunk in iterator]
+
+
+def test_stream_yields_all_chunks(provider):
+    provider()
+    stream = Stream("a", [1, 2, 3])
+    chunks = asyncio.run(collect(stream_upstream("test", stream_factory(stream))))
+    assert chunks == ["a:1", "a:2", "a:3"]
+    assert stream.closed
+
+
+def test_stream_is_retried_before_the_first_chunk(provider):
+    provider(timeout=0.05, retries=1)
+    slow, fast = Stream("slow", [1], delay=1), Stream("fast", [1])
+    assert asyncio.run(collect(stream_upstream("test", stream_factory(slow, fast)))) == ["fast:1"]
+    assert slow.closed
+
+
+def test_stream_gap_timeout(provider):
+    provider(timeout=0.05)
+    stream = Stream("a", [1, 2], gap=1)
+
+    async def scenario():
+        chunks = []
+        with pytest.raises(UpstreamTimeoutError):
+            async for chunk in stream_upstream("test", stream_factory(stream)):
+                chunks.append(chunk)
+        return chunks
+
+    assert asyncio.run(scenario()) == ["a:1"]
+    assert stream.closed
+
+
+def test_hedge_wins_over_a_slow_primary(provider):
+    provider()
+    primary, hedge = Stream("primary", [1, 2], delay=0.5), Stream("hedge", [1, 2])
+    chunks = asyncio.run(collect(stream_upstream("test", stream_factory(primary, hedge), hedge_after=0.02)))
+    assert chunks == ["hedge:1", "hedge:2"]
+    assert hedge.closed
+    assert primary.closed
+
+
+def test_no_hedge_when_the_primary_is_fast(provider):
+    provider()
+    primary = Stream("primary", [1])
+    factory = stream_factory(primary)  # A second call would fail: nothing left to pop
+    assert asyncio.run(collect(stream_upstream("test", factory, hedge_after=0.2))) == ["primary:1"]
+
+
+def test_primary_kept_when_it_answers_first(provider):
+    provider()
+    primary, hedge = Stream("primary", [1], delay=0.05), Stream("hedge", [1], delay=1)
+    chunks = asyncio.run(collect(stream_upstream("test", stream_factory(primary, hedge), hedge_after=0.01)))
+    assert chunks == ["primary:1"]
+    assert hedge.closed
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+import main
+import speech_to_text
+from speech_to_text import STTBackend, STTSession, StubSTTSession, register_stt_backend
+
+
+class RecordingSession(StubSTTSession):
+    """The stub session, noting how the relay used it."""
+
+    instances: list = []
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.finished = False
+        self.closed = False
+        RecordingSession.instances.append(self)
+
+    async def _request_finish(self) -> None:
+        self.finished = True
+        await super()._request_finish()
+
+    async def close(self) -> None:
+        self.closed = True
+        await super().close()
+
+
+class RecordingBackend(STTBackend):
+    async def open(self, lang, encoding=None, sample_rate=None) -> STTSession:
+        return RecordingSession()
+
+
+class FailingSession(StubSTTSession):
+    """Reports a backend error after the first frame."""
+
+    async def send(self, audio: bytes) -> None:
+        await self._queue.put(HTTPException(status_code=502, detail="Transcription failed: upstream went away"))
+
+
+class FailingSessionBackend(STTBackend):
+    async def open(self, lang, encoding=None, sample_rate=None) -> STTSession:
+        return FailingSession()
+
+
+class UnreachableBackend(STTBackend):
+    async def open(self, lang, encoding=None, sample_rate=None) -> STTSession:
+        raise HTTPException(status_code=502, detail="Could not connect to the transcription service")
+
+
+register_stt_backend("test-recording", RecordingBackend)
+register_stt_backend("test-failing-session", FailingSessionBackend)
+register_stt_backend("test-unreachable", UnreachableBackend)
+
+
+def assert_closed_with_error(ws) -> None:
+    with pytest.raises(WebSocketDisconnect) as exc:
+        ws.receive_json()
+    assert exc.value.code == 1011
+
+
+@pytest.fixture
+def client():
+    # No lifespan: the endpoint needs neither the catalog nor the database
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    def use(name: str) -> None:
+        monkeypatch.setattr(speech_to_text, "STT_BACKEND", name)
+
+    RecordingSession.instances.clear()
+    return use
+
+
+def test_interim_then_final_transcripts(client, backend):
+    backend("stub")
+    with client.websocket_connect("/api/transcribe/stream?lang=cs") as ws:
+        ws.send_bytes(b"hello doctor")
+        assert ws.receive_json() == {"type": "transcript", "text": "hello doctor", "is_final": False, "speech_final": False}
+        ws.send_bytes(b"it hurts")
+        assert ws.receive_json()["text"] == "hello doctor it hurts"
+
+        ws.send_text('{"type": "stop"}')
+        final = ws.receive_json()
+        assert final == {"type": "transcript", "text": "hello doctor it hurts", "is_final": True, "speech_final": True}
+        assert ws.receive_json() == {"type": "done", "transcript": "hello doctor it hurts"}
+
+
+def test_unknown_control_messages_are_ignored(client, backend):
+    backend("stub")
+    with client.websocket_connect("/api/transcribe/stream") as ws:
+        ws.send_text("not json")
+        ws.send_text('{"type": "ping"}')
+        ws.send_bytes(b"still here")
+        assert ws.receive_json()["text"] == "still here"
+        ws.send_text('{"type": "stop"}')
+        assert ws.receive_json()["is_final"] is True
+        assert ws.receive_json()["type"] == "done"
+
+
+def test_stop_without_audio_sends_empty_transcript(client, backend):
+    backend("stub")
+    with client.websocket_connect("/api/transcribe/stream") as ws:
+        ws.send_text('{"type": "stop"}')
+        assert ws.receive_json() == {"type": "done", "transcript": ""}
+
+
+def test_client_disconnect_finishes_and_closes_the_session(client, backend):
+    backend("test-recording")
+    with client.websocket_connect("/api/transcribe/stream") as ws:
+        ws.send_bytes(b"hello")
+        assert ws.receive_json()["text"] == "hello"
+    # Leaving the block disconnects and waits for the endpoint to return
+    (session,) = RecordingSession.instances
+    assert session.finished
+    assert session.closed
+
+
+def test_backend_error_mid_stream(client, backend):
+    backend("test-failing-session")
+    with client.websocket_connect("/api/transcribe/stream") as ws:
+        ws.send_bytes(b"hello")
+        assert ws.receive_json() == {"type": "error", "detail": "Transcription failed: upstream went away"}
+        assert_closed_with_error(ws)
+
+
+def test_backend_unavailable(client, backend):
+    backend("test-unreachable")
+    with client.websocket_connect("/api/transcribe/stream") as ws:
+        assert ws.receive_json() == {"type": "error", "detail": "Could not connect to the transcription service"}
+        assert_closed_with_error(ws)
+
+
+def test_unknown_backend(client, backend):
+    backend("no-such-backend")
+    with client.websocket_connect("/api/transcribe/stream") as ws:
+        assert ws.receive_json() == {"type": "error", "detail": "Unknown STT backend: no-such-backend"}
+
+
+def test_incomplete_backends_fail_when_created():
+    class Incomplete(STTSession):
+        async def send(self, audio: bytes) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(TypeError):
+        STTBackend()
+
+
+def test_events_end_after_finish_timeout(monkeypatch):
+    monkeypatch.setattr(speech_to_text, "STT_FINISH_TIMEOUT", 0.01)
+
+    class Silent(STTSession):
+        async def send(self, audio: bytes) -> None:
+            pass
+
+        async def _request_finish(self) -> None:
+            pass  # A backend that never flushes
+
+    async def scenario():
+        session = Silent()
+        await session.finish()
+        events = [event async for event in session.events()]
+        await session.close()
+        return events
+
+    assert asyncio.run(scenario()) == []
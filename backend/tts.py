@@ -0,0 +1,317 @@
+"""Text-to-speech synthesis with a content-addressed audio cache.
+
+Synthesized audio is cached under a hash of (text, voice_id, model_id,
+output_format) in two tiers: a small in-memory LRU and a larger on-disk LRU.
+Both tiers are bounded by total size in bytes. A cache hit skips the
+ElevenLabs call entirely.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional
+
+from metrics import TTS_CACHE_LOOKUPS, observe_upstream, record_tts_bytes
+from resilience import NO_SDK_RETRIES, call_upstream, stream_upstream
+
+DEFAULT_MODEL_ID = "eleven_multilingual_v2"
+DEFAULT_OUTPUT_FORMAT = "mp3_44100_128"
+
+TTS_MEMORY_CACHE_BYTES = int(os.getenv("TTS_MEMORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+TTS_DISK_CACHE_BYTES = int(os.getenv("TTS_DISK_CACHE_BYTES", str(1024 * 1024 * 1024)))
+# Chunk size used when streaming a cached clip back to the client
+STREAM_CHUNK_SIZE = 32 * 1024
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "medical-trainer-tts"))
+
+
+def tts_cache_key(text: str, voice_id: Optional[str], model_id: str, output_format: str) -> str:
+    """Content hash identifying one synthesized clip."""
+    payload = json.dumps([text, voice_id, model_id, output_format], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Two-tier (memory + disk) LRU cache of synthesized audio, bounded by bytes."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = TTS_CACHE_DIR,
+        memory_max_bytes: int = TTS_MEMORY_CACHE_BYTES,
+        disk_max_bytes: int = TTS_DISK_CACHE_BYTES,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # key -> file size, in least-recently-used order
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_ready = False
+        # Disk operations run in worker threads and share the index
+        self._disk_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------------------------
+    # Memory tier
+    # ---------------------------
+
+    def _memory_put(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.memory_max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    # ---------------------------
+    # Disk tier (blocking helpers, run in a worker thread)
+    # ---------------------------
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.audio")  # type: ignore[arg-type]
+
+    def _load_disk_index(self) -> None:
+        """Rebuild the LRU index from files left by a previous process (oldest first)."""
+        if self._disk_ready or not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".audio"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[: -len(".audio")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._disk_ready = True
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        with self._disk_lock:
+            return self._disk_get_locked(key)
+
+    def _disk_get_locked(self, key: str) -> Optional[bytes]:
+        self._load_disk_index()
+        if key not in self._disk:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # keeps LRU order across restarts
+        except OSError:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        self._disk.move_to_end(key)
+        return audio
+
+    def _disk_put(self, key: str, audio: bytes) -> None:
+        with self._disk_lock:
+            self._disk_put_locked(key, audio)
+
+    def _disk_put_locked(self, key: str, audio: bytes) -> None:
+        self._load_disk_index()
+        if len(audio) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"TTS cache write failed: {str(e)}")
+            return
+        self._disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = len(audio)
+        self._disk_bytes += len(audio)
+        self._evict_disk()
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            TTS_CACHE_LOOKUPS.labels("memory").inc()
+            return audio
+
+        if self.cache_dir:
+            audio = await asyncio.to_thread(self._disk_get, key)
+            if audio is not None:
+                self.disk_hits += 1
+                TTS_CACHE_LOOKUPS.labels("disk").inc()
+                self._memory_put(key, audio)
+                return audio
+
+        self.misses += 1
+        TTS_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    async def put(self, key: str, audio: bytes) -> None:
+        self._memory_put(key, audio)
+        if self.cache_dir:
+            await asyncio.to_thread(self._disk_put, key, audio)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+# Single, process-wide audio cache
+tts_cache = TTSCache()
+
+
+async def synthesize_speech(
+    client,
+    text: str,
+    voice_id: Optional[str],
+    model_id: str = DEFAULT_MODEL_ID,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+) -> bytes:
+    """Return synthesized audio for ``text``, serving repeated requests from the cache."""
+    key = tts_cache_key(text, voice_id, model_id, output_format)
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        record_tts_bytes(len(cached), "cache")
+        return cached
+
+    async def convert() -> List[bytes]:
+        audio = client.text_to_speech.convert(
+            text=text,
+            voice_id=voice_id,
+            model_id=model_id,
+            output_format=output_format,
+            request_options=NO_SDK_RETRIES,
+        )
+
+        # Collect the chunks and join them once instead of re-copying on every append
+        chunks: List[bytes] = []
+        async for chunk in audio:
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    async with observe_upstream("elevenlabs", "tts", model_id):
+        # A retry downloads the whole clip again
+        chunks = await call_upstream("elevenlabs", convert, operation="tts")
+    audio_bytes = b"".join(chunks)
+    record_tts_bytes(len(audio_bytes), "elevenlabs")
+
+    print(f"TTS: Processed {len(chunks)} audio chunks, total bytes: {len(audio_bytes)}")
+
+    if audio_bytes:
+        await tts_cache.put(key, audio_bytes)
+    return audio_bytes
+
+
+async def stream_speech(
+    client,
+    text: str,
+    voice_id: Optional[str],
+    model_id: str = DEFAULT_MODEL_ID,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+) -> AsyncIterator[bytes]:
+    """Yield audio chunks for ``text`` as they arrive from ElevenLabs.
+
+    Cached clips are yielded straight from the cache. A fresh clip is only
+    stored once the upstream stream has completed, so an aborted response
+    never leaves a truncated clip behind.
+    """
+    key = tts_cache_key(text, voice_id, model_id, output_format)
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        record_tts_bytes(len(cached), "cache")
+        view = memoryview(cached)
+        for start in range(0, len(view), STREAM_CHUNK_SIZE):
+            yield bytes(view[start : start + STREAM_CHUNK_SIZE])
+        return
+
+    async def convert():
+        return client.text_to_speech.convert(
+            text=text,
+            voice_id=voice_id,
+            model_id=model_id,
+            output_format=output_format,
+            request_options=NO_SDK_RETRIES,
+        )
+
+    chunks: List[bytes] = []
+    try:
+        async with observe_upstream("elevenlabs", "tts_stream", model_id):
+            async for chunk in stream_upstream("elevenlabs", convert, operation="tts_stream"):
+                if chunk:
+                    chunks.append(chunk)
+                    yield chunk
+    finally:
+        # Counted even if the client disconnects mid-stream
+        record_tts_bytes(sum(len(chunk) for chunk in chunks), "elevenlabs")
+
+    if chunks:
+        await tts_cache.put(key, b"".join(chunks))
+
+
+def media_type_for(output_format: str) -> str:
+    """HTTP content type for an ElevenLabs ``output_format`` such as ``mp3_44100_128``."""
+    codec = output_format.split("_", 1)[0]
+    return {
+        "mp3": "audio/mpeg",
+        "opus": "audio/ogg",
+        "pcm": "audio/L16",
+        "ulaw": "audio/basic",
+        "alaw": "audio/basic",
+        "wav": "audio/wav",
+    }.get(codec, "application/octet-stream")
+
+
+__all__ = [
+    "tts_cache",
+    "TTSCache",
+    "tts_cache_key",
+    "synthesize_speech",
+    "stream_speech",
+    "media_type_for",
+    "DEFAULT_MODEL_ID",
+    "DEFAULT_OUTPUT_FORMAT",
+]
@@ -0,0 +1,141 @@
+"""Bounded handling of uploaded audio.
+
+- ``BodySizeLimitMiddleware`` rejects request bodies above a per-path limit
+  with 413. It checks ``Content-Length`` up front and counts bytes as they
+  arrive, so a chunked upload without a length is cut off as well.
+- Starlette spools each uploaded file to a temporary file once it grows
+  beyond ``UPLOAD_SPOOL_MEMORY_BYTES``, so memory stays flat however long the
+  clip is.
+- ``check_audio_upload`` enforces the size and (where the container can be
+  probed) duration limits before any upstream call is made.
+- ``iter_upload`` reads the spooled file back in fixed-size chunks, so it can
+  be streamed upstream without materializing it.
+"""
+
+import asyncio
+import os
+import wave
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
+
+TRANSCRIBE_MAX_UPLOAD_BYTES = int(os.getenv("TRANSCRIBE_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+TRANSCRIBE_MAX_DURATION_SECONDS = float(os.getenv("TRANSCRIBE_MAX_DURATION_SECONDS", "600"))
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+
+# Room for multipart boundaries, part headers and small form fields around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Starlette keeps each file part in memory up to this size and spills to disk beyond it
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_MEMORY_BYTES
+
+
+def _too_large(limit: int) -> str:
+    return f"Upload exceeds the maximum size of {limit // (1024 * 1024)} MB."
+
+
+class BodySizeLimitMiddleware:
+    """ASGI middleware capping the request body size for selected paths."""
+
+    def __init__(self, app, limits: Dict[str, int]) -> None:
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        body_limit = limit + MULTIPART_OVERHEAD_BYTES
+        content_length = dict(scope.get("headers") or []).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > body_limit:
+            response = JSONResponse({"detail": _too_large(limit)}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > body_limit:
+                    # Raised while the form is parsed, which FastAPI turns into the 413 response
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def probe_duration(file) -> Optional[float]:
+    """Duration in seconds of an audio file object, or None if the container cannot be read.
+
+    WAV is read with the standard library; other containers need the optional
+    ``mutagen`` package.
+    """
+    position = file.tell()
+    try:
+        file.seek(0)
+        try:
+            with wave.open(file, "rb") as clip:
+                return clip.getnframes() / float(clip.getframerate())
+        except (wave.Error, EOFError):
+            pass
+
+        try:
+            import mutagen  # type: ignore
+        except ImportError:
+            return None
+
+        file.seek(0)
+        try:
+            parsed = mutagen.File(file)
+        except Exception:
+            return None
+        length = getattr(getattr(parsed, "info", None), "length", None)
+        return float(length) if length else None
+    finally:
+        file.seek(position)
+
+
+async def check_audio_upload(
+    upload: UploadFile,
+    max_bytes: int = TRANSCRIBE_MAX_UPLOAD_BYTES,
+    max_duration: float = TRANSCRIBE_MAX_DURATION_SECONDS,
+) -> Optional[float]:
+    """Raise 413 if the upload is too large or too long; returns the probed duration."""
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=_too_large(max_bytes))
+
+    # The spooled file may be on disk, so probe it off the event loop
+    duration = await asyncio.to_thread(probe_duration, upload.file)
+    if duration is not None and duration > max_duration:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Audio exceeds the maximum duration of {int(max_duration)} seconds.",
+        )
+    return duration
+
+
+async def iter_upload(upload: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield the uploaded file in ``chunk_size`` pieces from the start."""
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+__all__ = [
+    "BodySizeLimitMiddleware",
+    "TRANSCRIBE_MAX_UPLOAD_BYTES",
+    "check_audio_upload",
+    "iter_upload",
+    "probe_duration",
+]
@@ -140,7 +140,7 @@ async function updateUIText() {
    */
   async function loadRecentConversations() {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/me/history?lang=${getCurrentLanguage()}`, {
+      const response = await fetch(`${API_BASE_URL}/api/me/history?lang=${getCurrentLanguage()}&limit=6`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -261,22 +261,21 @@ async function updateUIText() {
     }
 
     try {
-      const response = await fetch(`${API_BASE_URL}/api/me/history`, {
+      const response = await fetch(`${API_BASE_URL}/api/me/history/${parseInt(currentEvaluationId)}`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
       })
 
+      if (response.status === 404) {
+        throw new Error('Evaluation not found')
+      }
+
       if (!response.ok) {
         throw new Error(`HTTP ${response.status}`)
       }
 
-      const evaluations = await response.json()
-      const evaluation = evaluations.find((ev: any) => ev.id === parseInt(currentEvaluationId!))
-
-      if (!evaluation) {
-        throw new Error('Evaluation not found')
-      }
+      const evaluation = await response.json()
 
       // Display the transcript
       if (transcriptView) {
@@ -335,6 +334,29 @@ async function updateUIText() {
     }
   }
 
+  /**
+   * Render the coach's Markdown feedback
+   */
+  function renderFeedback(feedbackText: string) {
+    if (!coachFeedbackDisplay) return
+
+    // Convert basic markdown to HTML for display
+    const htmlFeedback = feedbackText
+      .replace(/### (.*)/g, '<h3>$1</h3>')
+      .replace(/## (.*)/g, '<h2>$1</h2>')
+      .replace(/# (.*)/g, '<h1>$1</h1>')
+      .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
+      .replace(/\*(.*?)\*/g, '<em>$1</em>')
+      .replace(/\n\n/g, '</p><p>')
+      .replace(/\n/g, '<br>')
+
+    coachFeedbackDisplay.innerHTML = `
+      <div class="coach-feedback">
+        <p>${htmlFeedback}</p>
+      </div>
+    `
+  }
+
   /**
    * Generate comprehensive feedback from AI Coach
    */
@@ -354,7 +376,7 @@ async function updateUIText() {
     showLoading(true)
 
     try {
-      const response = await fetch(`${API_BASE_URL}/api/coach/generate-feedback`, {
+      const response = await fetch(`${API_BASE_URL}/api/coach/generate-feedback/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -366,38 +388,45 @@ async function updateUIText() {
         })
       })
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`HTTP ${response.status}`)
       }
 
-      const data = await response.json()
-      const feedbackText = data.feedback_text
+      // Remove the button container
+      const buttonContainer = document.querySelector('.feedback-button-container')
+      if (buttonContainer) {
+        buttonContainer.remove()
+      }
 
-      // Display the feedback (assuming it's in Markdown format)
-      if (coachFeedbackDisplay) {
-        // Remove the button container
-        const buttonContainer = document.querySelector('.feedback-button-container')
-        if (buttonContainer) {
-          buttonContainer.remove()
+      // The debrief arrives as NDJSON events; render the Markdown as it grows
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffered = ''
+      let feedbackText = ''
+
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffered += decoder.decode(value, { stream: true })
+
+        const lines = buffered.split('\n')
+        buffered = lines.pop() ?? ''
+        for (const line of lines) {
+          if (!line.trim()) continue
+          const event = JSON.parse(line)
+          if (event.type === 'text_delta') {
+            feedbackText += event.delta
+          } else if (event.type === 'text_done') {
+            feedbackText = event.feedback_text
+          } else if (event.type === 'error') {
+            throw new Error(event.detail)
+          }
         }
-
-        // Convert basic markdown to HTML for display
-        const htmlFeedback = feedbackText
-          .replace(/### (.*)/g, '<h3>$1</h3>')
-          .replace(/## (.*)/g, '<h2>$1</h2>')
-          .replace(/# (.*)/g, '<h1>$1</h1>')
-          .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
-          .replace(/\*(.*?)\*/g, '<em>$1</em>')
-          .replace(/\n\n/g, '</p><p>')
-          .replace(/\n/g, '<br>')
-
-        coachFeedbackDisplay.innerHTML = `
-          <div class="coach-feedback">
-            <p>${htmlFeedback}</p>
-          </div>
-        `
+        renderFeedback(feedbackText)
       }
 
+      renderFeedback(feedbackText)
+
     } catch (error) {
       console.error('Error generating feedback:', error)
       if (coachFeedbackDisplay) {
@@ -429,7 +458,8 @@ async function updateUIText() {
       const response = await fetch(`${API_BASE_URL}/api/coach/chat`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`
         },
         body: JSON.stringify({
           question: userQuestion,
@@ -213,9 +213,16 @@ async function updateUIText() {
 // --------------------------------------------------
 // Main loader
 // --------------------------------------------------
-async function loadHistory() {
-  try {
-    const res = await fetch(`${API_BASE_URL}/api/me/history?lang=${getCurrentLanguage()}`, {
+// Fetch every page of the history in summary mode (scores only, no transcripts)
+async function fetchAllSessions(): Promise<EvaluationSession[]> {
+  const sessions: EvaluationSession[] = []
+  let cursor: string | null = null
+
+  do {
+    const params = new URLSearchParams({ lang: getCurrentLanguage(), summary: 'true', limit: '200' })
+    if (cursor) params.set('cursor', cursor)
+
+    const res = await fetch(`${API_BASE_URL}/api/me/history?${params.toString()}`, {
       headers: {
         Authorization: `Bearer ${token}`,
       },
@@ -223,7 +230,17 @@ async function loadHistory() {
 
     if (!res.ok) throw new Error(`HTTP ${res.status}`)
 
-    const sessions: EvaluationSession[] = await res.json()
+    const page: EvaluationSession[] = await res.json()
+    sessions.push(...page)
+    cursor = res.headers.get('X-Next-Cursor')
+  } while (cursor)
+
+  return sessions
+}
+
+async function loadHistory() {
+  try {
+    const sessions = await fetchAllSessions()
     if (sessions.length === 0) {
       alert('No evaluation history yet.')
       return
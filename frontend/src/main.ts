@@ -257,7 +257,9 @@ if (document.querySelector<HTMLDivElement>('#chat-window')) {
         const response = await fetch(`${API_BASE_URL}/api/coach/hint`, {
           method: 'POST',
           headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            // Signed-in users are rate limited per account instead of per network
+            ...(token ? { 'Authorization': `Bearer ${token}` } : {})
           },
           body: JSON.stringify({
             scenario_id: scenarioId, // Keep as string, don't convert to int
@@ -390,7 +392,10 @@ if (document.querySelector<HTMLDivElement>('#chat-window')) {
       try {
         const response = await fetch(`${API_BASE_URL}/api/chat`, {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
+          headers: {
+            'Content-Type': 'application/json',
+            ...(token ? { 'Authorization': `Bearer ${token}` } : {})
+          },
           body: JSON.stringify({ 
             scenario_id: scenarioId, 
             history: historyForAPI, 